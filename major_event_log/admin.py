@@ -1,7 +1,33 @@
 """Setup the admin page so admins can view, make, and modify events."""
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
 
-from .models import Event
+from .counts import CountingPaginator
+from .models import Agent, ArchivedEvent, Event
+from .search import search_events
+
+
+class EventChangeList(ChangeList):
+    """Changelist that only loads the columns it displays."""
+
+    def get_queryset(self, request):
+        field_names = {field.name for field in self.model._meta.fields}
+        fields = [name for name in self.list_display if name in field_names]
+        return super().get_queryset(request).only('pk', *fields)
+
+    def get_ordering(self, request, queryset):
+        # Searches list the best matches first, unless a column was
+        # picked to sort by.
+        if self.query.strip() and ORDER_VAR not in self.params:
+            ordering = list(queryset.query.order_by)
+            if ordering:
+                return ordering
+        return super().get_ordering(request, queryset)
+
+
+class AgentAdmin(admin.ModelAdmin):
+    list_display = ('name', 'email')
+    search_fields = ['name', 'email']
 
 
 class EventAdmin(admin.ModelAdmin):
@@ -10,15 +36,51 @@ class EventAdmin(admin.ModelAdmin):
         ('Title info', {'fields': ['title', 'detail']}),
         ('Outcome info', {'fields': ['outcome', 'outcome_detail']}),
         ('Event date', {'fields': ['date']}),
-        ('Contact info', {'fields': ['contact_name', 'contact_email']}),
+        ('Contact info', {'fields': ['agent']}),
     ]
+    # Pick the reporting agent by searching, rather than from a list of
+    # every agent.
+    autocomplete_fields = ['agent']
     # Show the title, date, creation_date, and outcome in the event list.
     list_display = ('title', 'date', 'entry_created', 'outcome')
-    # Allow an admin to filter events by the event date.
-    list_filter = ['date', 'entry_created']
-    # Allow an admin to search events by title.
-    search_fields = ['title']
+    # Allow an admin to filter events by the event date and outcome.
+    list_filter = ['date', 'entry_created', 'outcome']
+    # Allow an admin to search events by title, detail and outcome
+    # detail, through the search backend (see get_search_results).
+    search_fields = ['title', 'detail', 'outcome_detail']
+    # Count the events without scanning the table, and skip the second
+    # count of all events that the changelist makes by default.
+    paginator = CountingPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return EventChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search_events(queryset, search_term), False
+
+
+class ArchivedEventAdmin(admin.ModelAdmin):
+    """Lists archived events, which can be viewed but not changed."""
+    list_display = ('title', 'date', 'entry_created', 'outcome')
+    list_filter = ['outcome']
+    # The archive has no search index; look events up by id.
+    search_fields = ['=id']
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
-# Register the Event model on the admin page.
+# Register the models on the admin page.
+admin.site.register(Agent, AgentAdmin)
 admin.site.register(Event, EventAdmin)
+admin.site.register(ArchivedEvent, ArchivedEventAdmin)
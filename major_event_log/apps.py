@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class MajorEventLogConfig(AppConfig):
+    name = 'major_event_log'
+    verbose_name = 'Major Event Log'
+    default_auto_field = 'django.db.models.AutoField'
+
+    def ready(self):
+        # Connect the signal receivers.
+        from . import signals  # noqa: F401
@@ -0,0 +1,83 @@
+"""Moving old events out of the events table.
+
+The index, the feeds, the exports and the admin all read the events
+table, so it is kept small by moving the events entered before a cutoff
+to the ArchivedEvent table, a batch at a time. Each batch is copied and
+deleted in one transaction, so an event is always in exactly one of the
+two tables.
+
+Archived events keep their ids, so their event pages, PREMIS and Atom
+records (and OAI-PMH records) are still found by id: the views look in
+the archive when an event isn't in the events table. They leave the
+listings, the Atom feed, search and the event counts, but stay in the
+lists harvesters sync from (the changes feed, OAI-PMH lists and the
+exports, see chained.py) and in the rollups behind the statistics,
+which describe every event logged.
+"""
+import datetime
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import ArchivedEvent, Event
+from .signals import events_archived
+
+DEFAULT_BATCH_SIZE = 1000
+# The fields copied from an event to its archived copy.
+ARCHIVED_FIELDS = [field.attname for field in ArchivedEvent._meta.fields]
+
+
+def archive_cutoff(days):
+    """Return the cutoff archiving the events entered more than the
+    given number of days ago.
+    """
+    return timezone.now() - datetime.timedelta(days=days)
+
+
+def archive_events(before, batch_size=DEFAULT_BATCH_SIZE, using='default'):
+    """Move the events entered before a datetime to the archive, oldest
+    first. Yields the number of events moved by each batch.
+    """
+    while True:
+        moved = archive_batch(before, batch_size, using=using)
+        if not moved:
+            return
+        yield moved
+
+
+def archive_batch(before, batch_size=DEFAULT_BATCH_SIZE, using='default'):
+    """Move up to batch_size of the oldest events entered before a
+    datetime to the archive. Returns the number of events moved.
+    """
+    with transaction.atomic(using=using):
+        events = list(
+            Event.objects.using(using).select_for_update()
+            .filter(entry_created__lt=before)
+            .order_by('entry_created', 'id')[:batch_size])
+        if not events:
+            return 0
+        ArchivedEvent.objects.using(using).bulk_create([
+            ArchivedEvent(**{name: getattr(event, name)
+                             for name in ARCHIVED_FIELDS})
+            for event in events
+        ])
+        delete_rows(events, using)
+        events_archived.send(sender=Event, events=events, using=using)
+    return len(events)
+
+
+def delete_rows(events, using):
+    """Delete the rows of events with a single DELETE statement.
+
+    Unlike Model.delete(), this sends no post_delete signal per event,
+    which would also take the events out of the rollups; the receivers
+    of events_archived handle the rest. Nothing else references events.
+    """
+    connection = connections[using]
+    pk = Event._meta.pk
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {0} WHERE {1} IN ({2})'.format(
+            connection.ops.quote_name(Event._meta.db_table),
+            connection.ops.quote_name(pk.column),
+            ', '.join(['%s'] * len(events))),
+            [pk.get_db_prep_value(event.pk, connection) for event in events])
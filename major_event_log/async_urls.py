@@ -0,0 +1,34 @@
+"""The URLs of the app, served by the async views where there are any.
+
+Include this module instead of urls.py to serve the app under ASGI:
+
+    path('major-event-log/', include(('major_event_log.async_urls',
+                                      'major-event-log'),
+                                     namespace='major-event-log')),
+
+The URLs and their names are those of urls.py. The views without an
+async version are the synchronous ones, which Django runs in a thread.
+"""
+from django.urls import path
+
+from . import async_views
+from .pagecache import cache_page
+from .routers import read_from_replica
+from .urls import urlpatterns as sync_urlpatterns
+
+# The async views, by URL name.
+ASYNC_VIEWS = {
+    'index': cache_page('index')(
+        read_from_replica(async_views.AsyncEventList.as_view())),
+    'event_premis': async_views.event_premis,
+    'event_atom': async_views.event_atom,
+    'event_details': async_views.event_details,
+    'feed': cache_page('feed')(
+        read_from_replica(async_views.latest_events_feed)),
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name)
+    if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in sync_urlpatterns
+]
@@ -0,0 +1,165 @@
+"""Async versions of the read views and the Atom feed, for ASGI servers.
+
+They are served by the URLconf in async_urls.py, which can be included
+instead of urls.py. The event pages, the cursor pages of the index and
+the feed, and the facet sidebar are read with Django's async ORM, so a
+request waiting on the database doesn't hold a thread. Numbered pages
+and searches, which are counted and searched through synchronous code,
+are handed to the synchronous views with `sync_to_async`.
+
+Templates and feeds are rendered in a thread, as Django renders
+template responses under ASGI, since they may still read from the
+database.
+"""
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.contrib.syndication.views import Feed
+from django.core.exceptions import BadRequest
+from django.http import Http404, HttpResponse
+from django.template.response import TemplateResponse
+from django.urls import reverse
+
+from .cache import render_cache
+from .conditional import (add_validators, aget_event_modified,
+                          async_event_condition, conditional_response)
+from .facets import afacet_sidebar
+from .feeds import LatestEventsFeed
+from .metrics import rendering
+from .models import ArchivedEvent, Event
+from .pagination import CursorPaginator, InvalidCursor
+from .routers import read_from_replica
+from .serializers import serialize_atom, serialize_premis
+from .views import EventList
+
+
+async def aget_event_or_404(event_id):
+    """Retrieves event, as get_event_or_404 does, with the async ORM."""
+    try:
+        uuid.UUID(event_id)
+    except ValueError:
+        raise Http404('Invalid event ID')
+    for model in (Event, ArchivedEvent):
+        try:
+            return await model.objects.select_related('agent').aget(
+                id=event_id)
+        except model.DoesNotExist:
+            pass
+    raise Http404('No Event matches the given query.')
+
+
+@read_from_replica
+@async_event_condition
+async def event_details(request, event_id):
+    """Loads the event details page of the event with the given ID."""
+    event = await aget_event_or_404(event_id)
+    return TemplateResponse(request, 'major-event-log/event_details.html',
+                            {'event': event})
+
+
+@read_from_replica
+@async_event_condition
+async def event_atom(request, event_id):
+    """Loads the Atom record for the event with the given ID."""
+    content = None
+    modified = await aget_event_modified(request, event_id)
+    if modified is not None:
+        event_detail_url = request.build_absolute_uri(
+            reverse('major-event-log:event_details',
+                    args=[uuid.UUID(event_id)]))
+        content = await render_cache.aget('atom', event_id, modified,
+                                          variant=event_detail_url)
+    if content is None:
+        event = await aget_event_or_404(event_id)
+        event_detail_url = request.build_absolute_uri(
+            event.get_absolute_url())
+        with rendering():
+            content = serialize_atom(event, event_detail_url)
+        await render_cache.aset('atom', event_id, event.entry_modified,
+                                content, variant=event_detail_url)
+    return HttpResponse(content, content_type='text/xml; charset=utf-8')
+
+
+@read_from_replica
+@async_event_condition
+async def event_premis(request, event_id):
+    """Loads the PREMIS event item for the event with the given ID."""
+    modified = await aget_event_modified(request, event_id)
+    content = await render_cache.aget('premis', event_id, modified)
+    if content is None:
+        event = await aget_event_or_404(event_id)
+        with rendering():
+            content = serialize_premis(event)
+        await render_cache.aset('premis', event_id, event.entry_modified,
+                                content)
+    return HttpResponse(content, content_type='text/xml; charset=utf-8')
+
+
+class AsyncEventList(EventList):
+    """The index, reading its cursor pages and facet sidebar with the
+    async ORM.
+    """
+
+    cursor_page = None
+    facets = None
+
+    async def get(self, request, *args, **kwargs):
+        if self.has_numbered_pages():
+            return await sync_to_async(super().get)(request, *args, **kwargs)
+        self.object_list = self.get_queryset()
+        paginator = CursorPaginator(self.object_list, self.paginate_by)
+        try:
+            page = await paginator.apage(request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise BadRequest('Invalid cursor.')
+        self.cursor_page = (paginator, page, page.object_list,
+                            page.has_other_pages())
+        self.facets = await afacet_sidebar(request.GET)
+        return self.render_to_response(self.get_context_data())
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.cursor_page is not None:
+            return self.cursor_page
+        return super().paginate_queryset(queryset, page_size)
+
+    def get_facets(self):
+        if self.facets is not None:
+            return self.facets
+        return super().get_facets()
+
+
+class AsyncLatestEventsFeed(LatestEventsFeed):
+    """The Atom feed, reading its cursor pages with the async ORM.
+
+    An instance is created for each request (see `latest_events_feed`),
+    where the synchronous feed copies itself for each request.
+    """
+
+    prefetched = False
+
+    async def respond(self, request):
+        if self.has_numbered_pages(request):
+            return await sync_to_async(super().__call__)(request)
+        self.setup_paginator(request, self.get_queryset(request))
+        try:
+            self._current_page = await self.paginator.apage(self.page)
+        except InvalidCursor:
+            raise BadRequest('Invalid cursor.')
+        self.prefetched = True
+        etag, modified = self.make_page_validators(
+            self._current_page,
+            [(item.pk, item.entry_modified) for item in self._current_page])
+        response = conditional_response(request, etag, modified)
+        if response is None:
+            response = await sync_to_async(Feed.__call__)(self, request)
+        return add_validators(request, response, etag, modified)
+
+    def get_object(self, request):
+        if self.prefetched:
+            return self.paginator.object_list
+        return super().get_object(request)
+
+
+async def latest_events_feed(request):
+    """Loads the Atom feed of the latest events."""
+    return await AsyncLatestEventsFeed().respond(request)
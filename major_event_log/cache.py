@@ -0,0 +1,207 @@
+"""Cache for the rendered PREMIS and Atom records of events.
+
+A record is a pure function of its Event row, so once rendered it can
+be served again until the event is modified. Records are looked up in
+a small in-process LRU first and then in a Django cache backend. Each
+entry remembers the entry_modified value it was rendered from, and a
+lookup only succeeds when that value matches the current one, so an
+edit made by another process can never be served stale. Saving or
+deleting an event also drops its entries right away (see signals.py).
+
+The cache is disabled unless MAJOR_EVENT_LOG_RENDER_CACHE is set:
+
+    MAJOR_EVENT_LOG_RENDER_CACHE = {
+        'ALIAS': 'default',     # Django cache alias for the shared tier.
+        'TIMEOUT': 86400,       # Lifetime of shared entries in seconds.
+        'LRU_SIZE': 1000,       # Entries in the in-process tier (0 = off).
+    }
+"""
+import threading
+import uuid
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_OPTIONS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 86400,
+    'LRU_SIZE': 1000,
+}
+
+
+class LRUCache(object):
+    """A thread-safe, size-bounded, least recently used mapping.
+
+    Its operations hold the lock only for a dictionary update, so the
+    async views use it directly rather than from a thread.
+    """
+
+    def __init__(self):
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value, maxsize):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RenderCache(object):
+    """Two tier cache of rendered event records.
+
+    Records are identified by a kind (e.g. 'premis' or 'atom') and an
+    event id. `variant` distinguishes renderings that depend on more
+    than the event itself, such as the absolute URLs in an Atom entry.
+    """
+
+    kinds = ('premis', 'atom')
+    key_prefix = 'major_event_log:render'
+
+    def __init__(self):
+        self.lru = LRUCache()
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    @property
+    def options(self):
+        options = getattr(settings, 'MAJOR_EVENT_LOG_RENDER_CACHE', None)
+        if not options:
+            return None
+        return dict(DEFAULT_OPTIONS, **options)
+
+    @property
+    def enabled(self):
+        return self.options is not None
+
+    def make_key(self, kind, event_id):
+        return '{0}:{1}:{2}'.format(
+            self.key_prefix, kind, uuid.UUID(str(event_id)).hex)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _lru_get(self, options, key, expected):
+        entry = self.lru.get(key) if options['LRU_SIZE'] else None
+        if entry is not None and entry[0] == expected:
+            self._count('lru_hits')
+            return entry[1]
+        return None
+
+    def _shared_found(self, options, key, expected, entry):
+        """Return the content of an entry of the shared tier, keeping it
+        in the LRU, or None if it doesn't match.
+        """
+        if entry is not None and tuple(entry[0]) == expected:
+            self._count('hits')
+            if options['LRU_SIZE']:
+                self.lru.set(key, entry, options['LRU_SIZE'])
+            return entry[1]
+        self._count('misses')
+        return None
+
+    def _entry(self, options, key, modified, content, variant):
+        entry = ((modified.isoformat(), variant), content)
+        if options['LRU_SIZE']:
+            self.lru.set(key, entry, options['LRU_SIZE'])
+        return entry
+
+    def get(self, kind, event_id, modified, variant=''):
+        """Return the cached bytes for the record, or None on a miss.
+
+        `modified` is the event's current entry_modified value.
+        """
+        options = self.options
+        if options is None or modified is None:
+            return None
+        key = self.make_key(kind, event_id)
+        expected = (modified.isoformat(), variant)
+        content = self._lru_get(options, key, expected)
+        if content is not None:
+            return content
+        return self._shared_found(options, key, expected,
+                                  caches[options['ALIAS']].get(key))
+
+    async def aget(self, kind, event_id, modified, variant=''):
+        """Return the cached bytes for the record, or None on a miss,
+        reading the shared tier with the async cache API.
+        """
+        options = self.options
+        if options is None or modified is None:
+            return None
+        key = self.make_key(kind, event_id)
+        expected = (modified.isoformat(), variant)
+        content = self._lru_get(options, key, expected)
+        if content is not None:
+            return content
+        return self._shared_found(options, key, expected,
+                                  await caches[options['ALIAS']].aget(key))
+
+    def set(self, kind, event_id, modified, content, variant=''):
+        """Store the rendered bytes of a record."""
+        options = self.options
+        if options is None:
+            return
+        key = self.make_key(kind, event_id)
+        entry = self._entry(options, key, modified, content, variant)
+        caches[options['ALIAS']].set(key, entry, options['TIMEOUT'])
+
+    async def aset(self, kind, event_id, modified, content, variant=''):
+        """Store the rendered bytes of a record with the async cache
+        API.
+        """
+        options = self.options
+        if options is None:
+            return
+        key = self.make_key(kind, event_id)
+        entry = self._entry(options, key, modified, content, variant)
+        await caches[options['ALIAS']].aset(key, entry, options['TIMEOUT'])
+
+    def invalidate(self, event_id):
+        """Drop every cached record of the event."""
+        keys = [self.make_key(kind, event_id) for kind in self.kinds]
+        for key in keys:
+            self.lru.delete(key)
+        options = self.options
+        if options is not None:
+            caches[options['ALIAS']].delete_many(keys)
+
+    def get_stats(self):
+        """Return a copy of the hit and miss counters."""
+        with self._stats_lock:
+            return {
+                'lru_hits': self.stats['lru_hits'],
+                'hits': self.stats['hits'],
+                'misses': self.stats['misses'],
+            }
+
+    def clear(self):
+        """Empty the in-process tier and reset the counters."""
+        self.lru.clear()
+        with self._stats_lock:
+            self.stats.clear()
+
+
+render_cache = RenderCache()
@@ -0,0 +1,155 @@
+"""Reading the events table and the archive as one list.
+
+Archived events (see archive.py) keep their ids and entry dates, so the
+lists harvesters sync from (the changes feed, OAI-PMH and the exports)
+keep describing them. A ChainedQuerySet holds a queryset of each table,
+applies every filter, ordering and slice to all of them, and merges
+their rows on the ordering they share when it is evaluated:
+
+    events = all_events().order_by('entry_modified', 'id')
+    paginator = CursorPaginator(events.filter(outcome=Event.SUCCESS), 100,
+                                ordering=('entry_modified', 'id'))
+
+It can stand in for a queryset wherever the CursorPaginator, the record
+and export helpers read one, and each page still costs one indexed
+range query per table. Rows are merged on the fields named by the
+ordering, which must be sorted in one direction and end with a unique
+field, as for the CursorPaginator.
+"""
+import heapq
+import itertools
+
+from .models import ArchivedEvent, Event
+
+
+class ChainedQuerySet(object):
+    """The querysets of several models, read as one ordered list."""
+
+    def __init__(self, querysets):
+        self.querysets = list(querysets)
+        self._start = 0
+        self._stop = None
+        # The fields of the rows returned by values_list(), and how many
+        # of them are returned (the others are read to merge the rows).
+        self._row_fields = None
+        self._width = None
+        self._flat = False
+
+    def __repr__(self):
+        return '<ChainedQuerySet {0!r}>'.format(self.querysets)
+
+    def _clone(self, querysets):
+        chain = self.__class__(querysets)
+        chain.__dict__.update({name: value
+                               for name, value in self.__dict__.items()
+                               if name != 'querysets'})
+        return chain
+
+    def map(self, function, *args, **kwargs):
+        """Return a chain of the querysets returned by calling `function`
+        with each queryset and the given arguments.
+        """
+        return self._clone([function(queryset, *args, **kwargs)
+                            for queryset in self.querysets])
+
+    def _apply(self, name, *args, **kwargs):
+        return self._clone([getattr(queryset, name)(*args, **kwargs)
+                            for queryset in self.querysets])
+
+    def all(self):
+        return self._apply('all')
+
+    def filter(self, *args, **kwargs):
+        return self._apply('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._apply('exclude', *args, **kwargs)
+
+    def annotate(self, *args, **kwargs):
+        return self._apply('annotate', *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self._apply('order_by', *fields)
+
+    def using(self, alias):
+        return self._apply('using', alias)
+
+    def values(self, *fields):
+        return self._apply('values', *fields)
+
+    def values_list(self, *fields, flat=False):
+        if flat and len(fields) != 1:
+            raise TypeError('flat is only valid with a single field.')
+        extra = [name for name in self._ordering_fields()
+                 if name not in fields]
+        chain = self._apply('values_list', *fields, *extra)
+        chain._row_fields = fields + tuple(extra)
+        chain._width = len(fields)
+        chain._flat = flat
+        return chain
+
+    @property
+    def model(self):
+        return self.querysets[0].model
+
+    @property
+    def db(self):
+        return self.querysets[0].db
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError('ChainedQuerySet only supports slices.')
+        start = self._start + (index.start or 0)
+        stop = self._stop
+        if index.stop is not None:
+            stop = self._start + index.stop
+            if self._stop is not None:
+                stop = min(stop, self._stop)
+        chain = self._apply('__getitem__', slice(None, stop))
+        chain._start, chain._stop = start, stop
+        return chain
+
+    def _ordering(self):
+        queryset = self.querysets[0]
+        return list(queryset.query.order_by or queryset.model._meta.ordering)
+
+    def _ordering_fields(self):
+        return [name.lstrip('-') for name in self._ordering()]
+
+    def _merge_key(self):
+        fields = self._ordering_fields()
+        if self._row_fields is not None:
+            positions = [self._row_fields.index(name) for name in fields]
+            return lambda row: tuple(row[position] for position in positions)
+
+        def key(item):
+            if isinstance(item, dict):
+                return tuple(item[name] for name in fields)
+            return tuple(getattr(item, name) for name in fields)
+        return key
+
+    def _merge(self, iterables):
+        ordering = self._ordering()
+        rows = heapq.merge(*iterables, key=self._merge_key(),
+                           reverse=ordering[0].startswith('-'))
+        rows = itertools.islice(rows, self._start, self._stop)
+        if self._row_fields is None:
+            return rows
+        if self._flat:
+            return (row[0] for row in rows)
+        if self._width < len(self._row_fields):
+            return (row[:self._width] for row in rows)
+        return rows
+
+    def __iter__(self):
+        return self._merge(self.querysets)
+
+    def iterator(self, chunk_size=None):
+        """Iterate over the merged rows, reading each queryset in chunks."""
+        return self._merge(queryset.iterator(chunk_size=chunk_size)
+                           for queryset in self.querysets)
+
+
+def all_events():
+    """Return a chain of the events of the events table and the archive."""
+    return ChainedQuerySet([Event.objects.all(), ArchivedEvent.objects.all()])
@@ -0,0 +1,143 @@
+"""Validators for conditional GET requests.
+
+The ETag and Last-Modified values of an event's pages are derived from
+`Event.entry_modified` (or `ArchivedEvent.entry_modified`), which is
+fetched on its own with a single query that does not build a model
+instance. Clients that already hold the current copy get an HTTP 304
+without the event being loaded or any template being rendered.
+
+The views of async_views.py can't use Django's `condition` decorator,
+which calls the validator functions synchronously, and go through
+`async_event_condition` instead.
+"""
+import datetime
+import functools
+import hashlib
+import uuid
+
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from .models import ArchivedEvent, Event
+
+
+def make_etag(*parts):
+    """Hash the given values into an opaque entity tag."""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def get_event_modified(request, event_id):
+    """Return the entry_modified value of the event, or None if the
+    event_id is malformed or doesn't refer to an existing event.
+
+    The result is remembered on the request so that the ETag and the
+    Last-Modified checks share one query (two for archived events).
+    """
+    cache = request.__dict__.setdefault('_event_modified', {})
+    if event_id not in cache:
+        try:
+            uuid.UUID(event_id)
+        except ValueError:
+            cache[event_id] = None
+        else:
+            for model in (Event, ArchivedEvent):
+                cache[event_id] = (model.objects.filter(id=event_id)
+                                   .values_list('entry_modified', flat=True)
+                                   .first())
+                if cache[event_id] is not None:
+                    break
+    return cache[event_id]
+
+
+async def aget_event_modified(request, event_id):
+    """Return the entry_modified value of the event, as
+    `get_event_modified` does, read with the async ORM.
+    """
+    cache = request.__dict__.setdefault('_event_modified', {})
+    if event_id not in cache:
+        try:
+            uuid.UUID(event_id)
+        except ValueError:
+            cache[event_id] = None
+        else:
+            for model in (Event, ArchivedEvent):
+                cache[event_id] = await (
+                    model.objects.filter(id=event_id)
+                    .values_list('entry_modified', flat=True).afirst())
+                if cache[event_id] is not None:
+                    break
+    return cache[event_id]
+
+
+def event_etag(request, event_id):
+    modified = get_event_modified(request, event_id)
+    if modified is None:
+        return None
+    return make_etag(event_id, modified.isoformat())
+
+
+def event_last_modified(request, event_id):
+    return get_event_modified(request, event_id)
+
+
+# Decorator for views that take an event_id and represent a single event.
+event_condition = condition(etag_func=event_etag,
+                            last_modified_func=event_last_modified)
+
+
+def conditional_response(request, etag, last_modified):
+    """Return the HTTP 304 (or 412) response to a conditional request
+    for a resource with the given validators, or None if the resource
+    must be sent, as Django's `condition` decorator does.
+    """
+    return get_conditional_response(
+        request, etag=_quoted_etag(etag),
+        last_modified=_timestamp(last_modified))
+
+
+def add_validators(request, response, etag, last_modified):
+    """Send the validators of the resource with the response."""
+    if request.method not in ('GET', 'HEAD'):
+        return response
+    timestamp = _timestamp(last_modified)
+    if timestamp and not response.has_header('Last-Modified'):
+        response.headers['Last-Modified'] = http_date(timestamp)
+    if etag is not None:
+        response.headers.setdefault('ETag', _quoted_etag(etag))
+    return response
+
+
+def _quoted_etag(etag):
+    return quote_etag(etag) if etag is not None else None
+
+
+def _timestamp(last_modified):
+    if not last_modified:
+        return None
+    if not timezone.is_aware(last_modified):
+        last_modified = timezone.make_aware(last_modified,
+                                            datetime.timezone.utc)
+    return int(last_modified.timestamp())
+
+
+def async_event_condition(view):
+    """Decorator for async views that take an event_id and represent a
+    single event, the counterpart of `event_condition`.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, event_id):
+        modified = await aget_event_modified(request, event_id)
+        etag = None
+        if modified is not None:
+            etag = make_etag(event_id, modified.isoformat())
+        response = conditional_response(request, etag, modified)
+        if response is None:
+            response = await view(request, event_id)
+        return add_validators(request, response, etag, modified)
+    return wrapper
@@ -0,0 +1,185 @@
+"""Counting events without scanning the events table.
+
+Numbered pagination needs the number of rows it paginates, and an exact
+COUNT(*) costs as much as reading the whole table. Counts go through a
+count provider instead. The default provider answers unfiltered counts
+from a counter row (see EventCounter) that the signal receivers in
+signals.py keep up to date, and counts filtered querysets exactly unless
+the database's own estimate says they are large, in which case the
+estimate is used.
+
+The provider is chosen with MAJOR_EVENT_LOG_COUNT_PROVIDER, the dotted
+path of a class with a `count(queryset)` method. Estimates are used for
+querysets the database expects to hold at least
+MAJOR_EVENT_LOG_COUNT_ESTIMATE_THRESHOLD rows.
+"""
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+from .models import Event, EventCounter
+
+# The name of the counter holding the number of events.
+TOTAL_COUNTER = 'events'
+DEFAULT_PROVIDER = 'major_event_log.counts.EventCountProvider'
+DEFAULT_ESTIMATE_THRESHOLD = 100000
+
+
+def add_to_count(queryset, delta, **key):
+    """Add delta to the `count` of the row of the queryset matching
+    the key, creating the row with a count of delta if there is none.
+    """
+    if queryset.filter(**key).update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic(using=queryset.db):
+            queryset.create(count=delta, **key)
+    except IntegrityError:
+        # Created by a concurrent writer in the meantime.
+        queryset.filter(**key).update(count=F('count') + delta)
+
+
+def adjust_counter(name, delta, using=None):
+    """Add delta to a counter, if the counter exists.
+
+    The total counter is created by a migration and by
+    `rebuild_counters` from an exact count. Creating it here from a
+    count could lose the adjustments of writers committing meanwhile.
+    """
+    EventCounter.objects.using(using).filter(name=name).update(
+        count=F('count') + delta)
+
+
+def increment_counters(deltas, using=None):
+    """Add to several counters, creating the missing ones.
+
+    `deltas` maps counter names to the amounts to add. Unlike
+    `adjust_counter`, a missing counter is taken to be zero.
+    """
+    counters = EventCounter.objects.using(using)
+    for name, delta in deltas.items():
+        if delta:
+            add_to_count(counters, delta, name=name)
+
+
+def get_counter(name, queryset):
+    """Return the value of a counter, or an exact count of the queryset
+    if the counter doesn't exist.
+
+    Missing counters aren't created from the count, which writers could
+    change before the counter is stored; the rebuild_event_counters
+    command creates them.
+    """
+    count = EventCounter.objects.using(queryset.db).filter(
+        name=name).values_list('count', flat=True).first()
+    if count is None:
+        return queryset.count()
+    return count
+
+
+def rebuild_counters(using=None):
+    """Recount the counted events and store the results."""
+    events = Event.objects.using(using)
+    counts = {TOTAL_COUNTER: events.count()}
+    for name, count in counts.items():
+        EventCounter.objects.using(using).update_or_create(
+            name=name, defaults={'count': count})
+    return counts
+
+
+def is_unfiltered(queryset):
+    """Return True if the queryset selects every event."""
+    query = queryset.query
+    return (queryset.model is Event and not query.where and
+            not query.distinct and not query.combinator and
+            query.low_mark == 0 and query.high_mark is None)
+
+
+def estimate_count(queryset):
+    """Return the database's estimate of the number of rows in the
+    queryset, or None if the database doesn't provide one.
+
+    Only PostgreSQL is supported: the table statistics (reltuples) for
+    unfiltered querysets, and the planner's row estimate otherwise.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if is_unfiltered(queryset):
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+            estimate = row[0] if row else -1
+        else:
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = plan[0]['Plan']['Plan Rows']
+    # Tables that have never been analyzed have a reltuples of -1.
+    if estimate < 0:
+        return None
+    return int(estimate)
+
+
+class ExactCountProvider(object):
+    """Counts every queryset with COUNT(*)."""
+
+    def count(self, queryset):
+        return queryset.count()
+
+
+class EventCountProvider(object):
+    """Counts from the maintained counter row when the queryset holds
+    every event, and from the database's estimate for large filtered
+    querysets.
+    """
+
+    def __init__(self, estimate_threshold=None):
+        if estimate_threshold is None:
+            estimate_threshold = getattr(
+                settings, 'MAJOR_EVENT_LOG_COUNT_ESTIMATE_THRESHOLD',
+                DEFAULT_ESTIMATE_THRESHOLD)
+        self.estimate_threshold = estimate_threshold
+
+    def count(self, queryset):
+        if is_unfiltered(queryset):
+            return get_counter(TOTAL_COUNTER, queryset)
+        estimate = estimate_count(queryset)
+        if estimate is not None and estimate >= self.estimate_threshold:
+            return estimate
+        return queryset.count()
+
+
+def get_count_provider():
+    """Return an instance of the configured count provider."""
+    path = getattr(settings, 'MAJOR_EVENT_LOG_COUNT_PROVIDER',
+                   DEFAULT_PROVIDER)
+    return import_string(path)()
+
+
+def count_events(queryset):
+    """Count the events of a queryset with the configured provider."""
+    return get_count_provider().count(queryset)
+
+
+class CountingPaginator(Paginator):
+    """A Paginator that counts its queryset with the count provider.
+
+    Counts from estimates are approximate, so the number of pages may
+    be off by a little for very large filtered querysets.
+    """
+
+    @cached_property
+    def count(self):
+        if hasattr(self.object_list, 'query'):
+            return count_events(self.object_list)
+        return len(self.object_list)
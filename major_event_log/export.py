@@ -0,0 +1,182 @@
+"""Streaming exports of the whole event log.
+
+Events are read with a chunked iterator and written one record at a
+time by generators, so the memory used by an export stays flat however
+many events there are. The row based exports read tuples with
+`values_list` and never instantiate the model.
+"""
+import csv
+import datetime
+import io
+import json
+import uuid
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .chained import all_events
+from .records import as_records, with_agent_fields
+from .serializers import premis_container_chunks
+
+DEFAULT_CHUNK_SIZE = 2000
+# The event fields written by the row based (JSON and CSV) exports.
+EXPORT_FIELDS = ('id', 'title', 'detail', 'outcome', 'outcome_detail', 'date',
+                 'entry_created', 'entry_modified', 'contact_name',
+                 'contact_email')
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 date or date and time into an aware datetime.
+
+    Naive values are taken to be in the current time zone. Raises
+    ValueError if the value can't be parsed.
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError('Invalid date: {0}'.format(value))
+        parsed = datetime.datetime.combine(date, datetime.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def modified_events(since=None, until=None):
+    """Return the events modified in the [since, until) interval, in
+    the order they were modified, archived events included.
+    """
+    events = all_events().order_by('entry_modified', 'id')
+    if since is not None:
+        events = events.filter(entry_modified__gte=since)
+    if until is not None:
+        events = events.filter(entry_modified__lt=until)
+    return events
+
+
+def dated_events(since=None, until=None, outcome=None):
+    """Return the events dated in the [since, until) interval, with the
+    given outcome if any, in date order, archived events included.
+    """
+    events = all_events().order_by('date', 'id')
+    if outcome is not None:
+        events = events.filter(outcome=outcome)
+    if since is not None:
+        events = events.filter(date__gte=since)
+    if until is not None:
+        events = events.filter(date__lt=until)
+    return events
+
+
+def event_rows(queryset, fields=EXPORT_FIELDS, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the values of the fields for every event of the queryset,
+    as tuples.
+    """
+    queryset = with_agent_fields(queryset, fields).values_list(*fields)
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def premis_export_chunks(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield a PREMIS document holding every event of the queryset."""
+    records = as_records(queryset).iterator(chunk_size=chunk_size)
+    return premis_container_chunks(records)
+
+
+def json_line(row):
+    """Return an event row (a dict of field values) as a line of JSON."""
+    return json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def jsonl_chunks(rows, fields=EXPORT_FIELDS):
+    """Yield each row of field values as a line of JSON."""
+    for row in rows:
+        yield json_line(dict(zip(fields, row)))
+
+
+def _csv_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def csv_chunks(rows, fields=EXPORT_FIELDS, rows_per_chunk=500):
+    """Yield CSV text for the rows of field values, headed by the field
+    names.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    count = 0
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        count += 1
+        if count == rows_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    yield buffer.getvalue()
+
+
+def write_chunks(output, chunks):
+    """Write a stream of chunks to a file."""
+    for chunk in chunks:
+        output.write(chunk)
+
+
+def write_output(chunks, path, compress, stdout):
+    """Write a stream of text chunks to the file at `path`, or to
+    `stdout` (the output of a management command) without a path,
+    gzipped if `compress` is true.
+
+    Raises ValueError if compressed data would be written to a stdout
+    that does not accept bytes.
+    """
+    if not path and not compress:
+        for chunk in chunks:
+            stdout.write(chunk, ending='')
+        return
+    chunks = encode_chunks(chunks)
+    if compress:
+        chunks = gzip_chunks(chunks)
+    if path:
+        with open(path, 'wb') as output:
+            write_chunks(output, chunks)
+        return
+    # Compressed data goes to the binary buffer behind stdout.
+    output = getattr(stdout, 'buffer', None)
+    if output is None:
+        raise ValueError('Standard output does not accept binary data; use '
+                         '--output with --gzip.')
+    write_chunks(output, chunks)
+    output.flush()
+
+
+def encode_chunks(chunks, encoding='utf-8'):
+    """Encode a stream of text chunks."""
+    for chunk in chunks:
+        yield chunk.encode(encoding)
+
+
+def gzip_chunks(chunks, level=6, buffer_size=64 * 1024):
+    """Compress a stream of byte chunks into a gzip stream.
+
+    Input is buffered up to `buffer_size` bytes between compressor
+    calls to avoid emitting many tiny chunks.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= buffer_size:
+            data = compressor.compress(b''.join(buffer))
+            buffer, size = [], 0
+            if data:
+                yield data
+    yield compressor.compress(b''.join(buffer)) + compressor.flush()
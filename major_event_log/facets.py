@@ -0,0 +1,232 @@
+"""Faceted filtering of events by outcome, year, date range and agent.
+
+The number of events with each outcome, in each year and reported by
+each agent is kept in EventCounter rows named `<facet>:<value>`, such as
+`outcome:http://...#success`, `year:2024` or `agent:12` (by agent id).
+The signal receivers in signals.py adjust them as events are created,
+changed and deleted. The facet sidebar is read from those rows instead
+of being aggregated from the events table on every request, so its
+counts are totals of the whole log, whatever the filters or search.
+"""
+from collections import Counter
+
+from django.db.models import Count, Q
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from .counts import increment_counters
+from .export import parse_timestamp
+from .models import Agent, Event, EventCounter
+
+FACETS = ('outcome', 'year', 'agent')
+# The query parameters that filter events.
+FILTER_PARAMS = ('outcome', 'since', 'until', 'agent')
+OUTCOME_LABELS = dict(Event.OUTCOME_CHOICES)
+# Outcomes may be given by their vocabulary URI or by their label.
+OUTCOMES = {label.lower(): value for value, label in Event.OUTCOME_CHOICES}
+# The number of agents listed in the sidebar, most events first.
+SIDEBAR_AGENTS = 20
+# The largest agent id, as agents have an AutoField primary key.
+MAX_AGENT_ID = 2147483647
+
+
+def counter_name(facet, value):
+    return '{0}:{1}'.format(facet, value)
+
+
+def facet_counters(*facets):
+    """Return a filter selecting the counters of the given facets."""
+    condition = Q()
+    for facet in facets:
+        condition |= Q(name__startswith=counter_name(facet, ''))
+    return condition
+
+
+def event_year(event):
+    date = event.date
+    if timezone.is_aware(date):
+        date = timezone.localtime(date)
+    return date.year
+
+
+def event_facets(event):
+    """Return the names of the facet counters an event counts towards."""
+    return [
+        counter_name('outcome', event.outcome),
+        counter_name('year', event_year(event)),
+        counter_name('agent', event.agent_id),
+    ]
+
+
+def count_events(events, delta=1, using=None):
+    """Add delta to the facet counters of each event."""
+    deltas = Counter()
+    for event in events:
+        for name in event_facets(event):
+            deltas[name] += delta
+    increment_counters(deltas, using=using)
+
+
+def move_event(before, after, using=None):
+    """Move an event from the facet counters of its old values (a list
+    of counter names) to those of its new values.
+    """
+    deltas = Counter()
+    for name in before:
+        deltas[name] -= 1
+    for name in event_facets(after):
+        deltas[name] += 1
+    increment_counters(deltas, using=using)
+
+
+def rebuild_facet_counts(using=None):
+    """Recount the facets of all events and store the counts.
+
+    Returns the number of facet counters stored.
+    """
+    events = Event.objects.using(using).order_by()
+    counts = {}
+    for facet, field, expression in (
+            ('outcome', 'outcome', None),
+            ('year', 'year', ExtractYear('date')),
+            ('agent', 'agent_id', None)):
+        rows = events
+        if expression is not None:
+            rows = rows.annotate(**{field: expression})
+        for row in rows.values(field).annotate(count=Count('id')):
+            counts[counter_name(facet, row[field])] = row['count']
+    counters = EventCounter.objects.using(using)
+    counters.filter(facet_counters(*FACETS)).delete()
+    counters.bulk_create([EventCounter(name=name, count=count)
+                          for name, count in counts.items()])
+    return len(counts)
+
+
+def parse_filters(params):
+    """Return the event filters given in the query parameters.
+
+    Raises ValueError if a filter is invalid.
+    """
+    filters = {}
+    outcome = params.get('outcome')
+    if outcome:
+        outcome = OUTCOMES.get(outcome.lower(), outcome)
+        if outcome not in OUTCOME_LABELS:
+            raise ValueError('Unknown outcome: {0}'.format(outcome))
+        filters['outcome'] = outcome
+    for name in ('since', 'until'):
+        if params.get(name):
+            filters[name] = parse_timestamp(params[name])
+    if params.get('agent'):
+        try:
+            agent = int(params['agent'])
+        except ValueError:
+            agent = None
+        # Ids out of range would overflow the query instead.
+        if agent is None or not 0 < agent <= MAX_AGENT_ID:
+            raise ValueError('Invalid agent: {0}'.format(params['agent']))
+        filters['agent'] = agent
+    return filters
+
+
+def filter_events(queryset, filters):
+    """Apply parsed filters to an event queryset."""
+    if 'outcome' in filters:
+        queryset = queryset.filter(outcome=filters['outcome'])
+    if 'since' in filters:
+        queryset = queryset.filter(date__gte=filters['since'])
+    if 'until' in filters:
+        queryset = queryset.filter(date__lt=filters['until'])
+    if 'agent' in filters:
+        queryset = queryset.filter(agent_id=filters['agent'])
+    return queryset
+
+
+def facet_url(params, **changes):
+    """Return a query string for the parameters with some of them
+    changed (or removed, when changed to None), back on the first page.
+    """
+    params = params.copy()
+    for name in ('page', 'cursor', 'p'):
+        params.pop(name, None)
+    for name, value in changes.items():
+        params.pop(name, None)
+        if value is not None:
+            params[name] = value
+    return '?' + params.urlencode() if params else '?'
+
+
+def sidebar_counters():
+    """Return the querysets of the outcome and year counters and of the
+    counters of the agents listed in the sidebar.
+    """
+    counters = EventCounter.objects.filter(count__gt=0)
+    return (counters.filter(facet_counters('outcome', 'year')),
+            counters.filter(facet_counters('agent')).order_by(
+                '-count', 'name')[:SIDEBAR_AGENTS])
+
+
+def sidebar_agent_ids(rows):
+    return [int(row.name.split(':', 1)[1]) for row in rows
+            if row.name.startswith(counter_name('agent', ''))]
+
+
+def facet_sidebar(params):
+    """Return the facets of the sidebar, each a list of dicts with the
+    label, count and link of a value and whether it is selected.
+    """
+    rows = []
+    for counters in sidebar_counters():
+        rows += counters
+    agent_ids = sidebar_agent_ids(rows)
+    agents = Agent.objects.in_bulk(agent_ids) if agent_ids else {}
+    return build_sidebar(params, rows, agents)
+
+
+async def afacet_sidebar(params):
+    """Return the facets of the sidebar, read with the async ORM."""
+    rows = []
+    for counters in sidebar_counters():
+        rows += [row async for row in counters]
+    agent_ids = sidebar_agent_ids(rows)
+    agents = await Agent.objects.ain_bulk(agent_ids) if agent_ids else {}
+    return build_sidebar(params, rows, agents)
+
+
+def build_sidebar(params, rows, agents):
+    """Build the sidebar from the counter rows and the agents they
+    count, by id.
+    """
+    outcome = params.get('outcome', '')
+    selected_outcome = OUTCOMES.get(outcome.lower(), outcome)
+    sidebar = {facet: [] for facet in FACETS}
+    for row in rows:
+        facet, value = row.name.split(':', 1)
+        item = {'value': value, 'count': row.count}
+        if facet == 'outcome':
+            item['label'] = OUTCOME_LABELS.get(value, value)
+            item['active'] = selected_outcome == value
+            item['url'] = facet_url(params, outcome=item['label'].lower())
+        elif facet == 'year':
+            since = '{0}-01-01'.format(value)
+            until = '{0}-01-01'.format(int(value) + 1)
+            item['label'] = value
+            item['active'] = (params.get('since') == since and
+                              params.get('until') == until)
+            item['url'] = facet_url(params, since=since, until=until)
+        else:
+            agent = agents.get(int(value))
+            item['label'] = agent.name if agent else value
+            item['active'] = params.get('agent') == value
+            item['url'] = facet_url(params, agent=value)
+        sidebar[facet].append(item)
+    sidebar['year'].sort(key=lambda item: item['value'], reverse=True)
+    sidebar['agent'].sort(key=lambda item: (-item['count'], item['label']))
+    return sidebar
+
+
+def filter_query(params, names=FILTER_PARAMS):
+    """Return the urlencoded filter parameters present in params."""
+    return urlencode([(name, params[name]) for name in names
+                      if params.get(name)])
@@ -1,12 +1,25 @@
 """Creates the Atom feed for the major PREMIS events."""
+import copy
 
 from django.utils.feedgenerator import Atom1Feed, rfc3339_date
 from django.urls import reverse, reverse_lazy
-from django.core.paginator import Paginator, InvalidPage
+from django.core.paginator import InvalidPage
 from django.contrib.syndication.views import Feed
+from django.core.exceptions import BadRequest
 from django.http import Http404
-
+from django.views.decorators.http import condition
+
+from .chained import all_events
+from .changes import (CHANGES_ORDERING, TOKEN_FIELD, resume_token,
+                      settled_changes)
+from .conditional import make_etag
+from .counts import CountingPaginator
+from .facets import FILTER_PARAMS, filter_events, filter_query, parse_filters
+from .metrics import rendering
 from .models import Event
+from .pagination import CursorPaginator, InvalidCursor
+from .records import as_records
+from .search import search_events
 
 
 class PaginatedAtom1FeedMixin(object):
@@ -15,9 +28,20 @@ class PaginatedAtom1FeedMixin(object):
     def _create_link_attr(self, rel, page):
         """Helper function to compose the attributes dictionary argument
         that handler.addQuickElement accepts.
+
+        In cursor mode `page` is a cursor token, and a page of None
+        links to the bare feed URL (the first page).
         """
-        href = u'{0}?{1}={2}'.format(
-            self.feed['link'], self.feed['page_field'], page)
+        field = self.feed.get('cursor_field') or self.feed['page_field']
+        extra_query = self.feed.get('extra_query', '')
+        if page is None:
+            href = self.feed['link']
+            if extra_query:
+                href = u'{0}?{1}'.format(href, extra_query)
+        else:
+            href = u'{0}?{1}={2}'.format(self.feed['link'], field, page)
+            if extra_query:
+                href = u'{0}&{1}'.format(href, extra_query)
 
         return {u'rel': rel, u'href': href}
 
@@ -36,13 +60,14 @@ class PaginatedAtom1FeedMixin(object):
             )
 
         handler.addQuickElement(
-            u'link', '', self._create_link_attr(u'first', 1))
+            u'link', '', self._create_link_attr(u'first', self.feed['first_page']))
 
-        handler.addQuickElement(
-            u'link',
-            '',
-            self._create_link_attr(u'last', self.feed['last_page'])
-        )
+        if self.feed.get('last_page', None) is not None:
+            handler.addQuickElement(
+                u'link',
+                '',
+                self._create_link_attr(u'last', self.feed['last_page'])
+            )
 
         if self.feed.get('prev_page', None) is not None:
             handler.addQuickElement(
@@ -91,43 +116,120 @@ class MajorEventLogFeed(PaginatedAtom1FeedMixin, Atom1Feed):
     are that pagination is added, and the 'alternate' link is removed.
     """
 
-    pass
+    def write(self, outfile, encoding):
+        with rendering():
+            super().write(outfile, encoding)
 
 
 class PaginatedFeedMixin(object):
-    """Feed mixin to enable pagination."""
+    """Feed mixin to enable pagination.
+
+    Requests that name a page number with `page_field`, and searches
+    (which are ordered by rank), are paginated by page number. All other
+    requests are paginated with a keyset cursor passed in
+    `cursor_field`, ordered by `cursor_ordering`.
+
+    The paginator and page of a request are kept on a copy of the feed
+    made for the request, as one feed instance serves every request.
+    """
 
     paginator = None
     page = 1
     items_per_page = 10
     page_field = 'page'
+    cursor_field = 'cursor'
+    cursor_ordering = ('-entry_created', '-id')
+    search_field = None
+    # Filter parameters carried over to the page links, along with the
+    # search.
+    filter_params = ()
+    extra_query = ''
+
+    def __call__(self, request, *args, **kwargs):
+        feed = copy.copy(self)
+        return super(PaginatedFeedMixin, feed).__call__(request, *args,
+                                                        **kwargs)
+
+    def get_search_query(self, request):
+        if not self.search_field:
+            return ''
+        return request.GET.get(self.search_field, '').strip()
+
+    def has_numbered_pages(self, request):
+        """Whether to paginate the request by page number."""
+        return bool(self.page_field and (self.page_field in request.GET or
+                                         self.get_search_query(request)))
+
+    def get_paginator(self, request, items):
+        """Returns the paginator for the request along with the page
+        number or cursor that selects the requested page.
+        """
+        if self.has_numbered_pages(request):
+            paginator = CountingPaginator(items, self.items_per_page)
+            return paginator, request.GET.get(self.page_field, 1)
+        paginator = CursorPaginator(
+            items, self.items_per_page, ordering=self.cursor_ordering)
+        return paginator, request.GET.get(self.cursor_field) or None
 
     def setup_paginator(self, request, items):
         """Instantiates the paginator object and attaches
-        it to self.
+        it to self, the copy of the feed made for the request.
 
         This needs to be called from `get_object` in order to receive
         the request object.
         """
-        self.page = request.GET.get(self.page_field, 1)
-        self.paginator = Paginator(items, self.items_per_page)
+        self.paginator, self.page = self.get_paginator(request, items)
+        self._current_page = None
+        names = (self.search_field,) if self.search_field else ()
+        self.extra_query = filter_query(request.GET,
+                                        names + tuple(self.filter_params))
 
     def get_current_page(self):
         """Get the current page of the Paginator."""
+        if getattr(self, '_current_page', None) is not None:
+            return self._current_page
         try:
-            return self.paginator.page(self.page)
+            self._current_page = self.paginator.page(self.page)
+        except InvalidCursor:
+            raise BadRequest('Invalid cursor.')
         except InvalidPage:
             raise Http404("Invalid page number.")
+        return self._current_page
+
+    def get_cursor_kwargs(self):
+        """Returns the keyword arguments for the cursor page links."""
+        page = self.get_current_page()
+        kwargs = {}
+
+        kwargs.setdefault('page_field', self.page_field)
+        kwargs.setdefault('cursor_field', self.cursor_field)
+        kwargs.setdefault('extra_query', self.extra_query)
+        kwargs.setdefault('first_page', None)
+        if page.has_next():
+            kwargs.setdefault('next_page', page.next_cursor)
+            kwargs.setdefault('last_page', self.paginator.LAST_CURSOR)
+
+        if page.has_previous():
+            kwargs.setdefault('prev_page', page.previous_cursor)
+
+        kwargs.setdefault('cr_page', page.cursor)
+
+        return kwargs
 
     def get_page_kwargs(self):
         """Returns the keyword arguments for the page links.
 
         This is intended to be called from `feed_extra_kwargs`.
         """
+        if getattr(self.paginator, 'is_keyset', False):
+            return self.get_cursor_kwargs()
+
         page = self.get_current_page()
         kwargs = {}
 
         kwargs.setdefault('page_field', self.page_field)
+        kwargs.setdefault('extra_query', self.extra_query)
+        kwargs.setdefault('first_page', 1)
         if page.has_next():
             kwargs.setdefault('next_page', page.next_page_number())
 
@@ -140,19 +242,92 @@ class PaginatedFeedMixin(object):
         return kwargs
 
 
-class LatestEventsFeed(PaginatedFeedMixin, Feed):
+class ConditionalFeedMixin(object):
+    """Feed mixin that answers conditional GET requests.
+
+    The validators are computed from the ids and the latest
+    entry_modified of the events on the requested page, which are
+    fetched without instantiating models or rendering the feed.
+    Requires `get_queryset` and a paginating mixin.
+    """
+
+    validator_fields = ('id', 'entry_created', 'entry_modified')
+
+    def get_page_validators(self, request):
+        """Returns the (etag, last_modified) pair of the requested page."""
+        if not hasattr(request, '_feed_validators'):
+            rows = self.get_queryset(request).values(*self.validator_fields)
+            paginator, number = self.get_paginator(request, rows)
+            try:
+                page = paginator.page(number)
+            except InvalidPage:
+                # Let the feed itself respond with the HTTP 404.
+                request._feed_validators = (None, None)
+                return request._feed_validators
+            request._feed_validators = self.make_page_validators(
+                page, [(row['id'], row['entry_modified'])
+                       for row in page.object_list])
+        return request._feed_validators
+
+    def make_page_validators(self, page, rows):
+        """Returns the (etag, last_modified) pair of a page from the id
+        and entry_modified pairs of its events.
+        """
+        if getattr(page.paginator, 'is_keyset', False):
+            position = (page.has_previous(), page.has_next())
+        else:
+            position = (page.paginator.num_pages,)
+        modified = max((row[1] for row in rows), default=None)
+        etag = make_etag(modified, *position, *(row[0] for row in rows))
+        return etag, modified
+
+    def page_etag(self, request, *args, **kwargs):
+        return self.get_page_validators(request)[0]
+
+    def page_last_modified(self, request, *args, **kwargs):
+        return self.get_page_validators(request)[1]
+
+    def __call__(self, request, *args, **kwargs):
+        view = condition(etag_func=self.page_etag,
+                         last_modified_func=self.page_last_modified)(
+            super().__call__)
+        return view(request, *args, **kwargs)
+
+
+class LatestEventsFeed(ConditionalFeedMixin, PaginatedFeedMixin, Feed):
     feed_type = MajorEventLogFeed
     title = 'PREMIS Major Event Log'
     link = reverse_lazy('major-event-log:feed')
     author_name = 'Major Event Log'
     author_link = 'http://digital2.library.unt.edu/name/nm0005293/'
     page_field = 'p'
+    search_field = 'q'
+    filter_params = FILTER_PARAMS
+    # The columns read by the item methods and the pagination keys.
+    # Items are read-only EventRecords rather than Event instances.
+    item_fields = ('id', 'title', 'detail', 'entry_created', 'entry_modified')
+
+    def get_queryset(self, request):
+        events = Event.objects.order_by('-entry_created', '-id')
+        try:
+            filters = parse_filters(request.GET)
+        except ValueError as error:
+            raise BadRequest(str(error))
+        events = filter_events(events, filters)
+        query = self.get_search_query(request)
+        if query:
+            events = search_events(events, query)
+        return as_records(events, self.item_fields)
 
     def get_object(self, request):
-        events = Event.objects.order_by('-entry_created')
+        events = self.get_queryset(request)
         self.setup_paginator(request, events)
         return events
 
+    def get_feed(self, obj, request):
+        with rendering():
+            return super().get_feed(obj, request)
+
     def feed_extra_kwargs(self, display):
         return self.get_page_kwargs()
 
@@ -170,3 +345,35 @@ class LatestEventsFeed(PaginatedFeedMixin, Feed):
 
     def item_updateddate(self, item):
         return item.entry_modified
+
+
+class EventChangesFeed(LatestEventsFeed):
+    """Feed of created and modified events, oldest change first.
+
+    The `next` link always carries a resume token, even on the last
+    page, so that a harvester can come back later for newer changes.
+    """
+
+    title = 'PREMIS Major Event Log Changes'
+    link = reverse_lazy('major-event-log:changes')
+    page_field = None
+    search_field = None
+    filter_params = ()
+    cursor_field = TOKEN_FIELD
+    cursor_ordering = CHANGES_ORDERING
+    items_per_page = 100
+
+    def get_queryset(self, request):
+        # Archived events stay in the changes, where harvesters look.
+        events = settled_changes(all_events().order_by(*CHANGES_ORDERING))
+        return as_records(events, self.item_fields)
+
+    def get_page_kwargs(self):
+        page = self.get_current_page()
+        return {
+            'page_field': self.page_field,
+            'cursor_field': self.cursor_field,
+            'first_page': None,
+            'cr_page': page.cursor,
+            'next_page': resume_token(page, self.page),
+        }
@@ -0,0 +1,302 @@
+"""Loading events in bulk from JSON lines or PREMIS XML.
+
+Records are validated like the admin form would validate them and then
+written with `bulk_create`, one transaction per batch. When a load is
+given an idempotency key, every batch is recorded under that key and
+its position in the load, in the same transaction as its events, so a
+retried load skips the batches that were already written.
+
+The contact name and email address of a record identify its reporting
+agent, which is created with the first batch that refers to it.
+"""
+import datetime
+import itertools
+import json
+import uuid
+import xml.etree.ElementTree as ElementTree
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Agent, Event, IngestBatch
+from .serializers import PREMIS_NAMESPACE
+from .signals import events_created
+
+DEFAULT_BATCH_SIZE = 500
+# The fields that may be given in a record.
+RECORD_FIELDS = ('id', 'title', 'detail', 'outcome', 'outcome_detail', 'date',
+                 'contact_name', 'contact_email')
+# The fields that PREMIS records may take from `defaults`, as PREMIS has
+# no element for them (or may leave them out).
+PREMIS_DEFAULT_FIELDS = ('title', 'contact_name', 'contact_email')
+# The record fields of the reporting agent, and the Agent fields they set.
+AGENT_FIELDS = {'contact_name': 'name', 'contact_email': 'email'}
+# Outcomes may be given by their vocabulary URI or by their label.
+OUTCOMES = {label.lower(): value for value, label in Event.OUTCOME_CHOICES}
+# Batches are recorded as '<key>:<batch number>', so keys leave room for
+# the number within IngestBatch.key.
+MAX_IDEMPOTENCY_KEY_LENGTH = (
+    IngestBatch._meta.get_field('key').max_length - 20)
+
+
+class IngestError(ValueError):
+    """An invalid record, with the line (or record) number it was found at."""
+
+    def __init__(self, message, line=None):
+        super().__init__(message)
+        self.message = message
+        self.line = line
+
+    def __str__(self):
+        if self.line is None:
+            return self.message
+        return 'Line {0}: {1}'.format(self.line, self.message)
+
+
+class IngestConflict(IntegrityError):
+    """A batch that could not be written, with the number of events
+    created by the batches before it.
+    """
+
+    def __init__(self, message, created, batch):
+        super().__init__(message)
+        self.created = created
+        self.batch = batch
+
+
+def check_idempotency_key(key):
+    """Raise an IngestError unless `key` can be recorded with batches."""
+    if len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise IngestError('Idempotency keys may be at most {0} characters '
+                          'long.'.format(MAX_IDEMPOTENCY_KEY_LENGTH))
+    if not key.isascii() or not key.isprintable():
+        raise IngestError('Idempotency keys may only contain printable '
+                          'ASCII characters.')
+
+
+def parse_jsonl(lines):
+    """Yield (line number, record) pairs from lines of JSON objects.
+
+    Blank lines are skipped.
+    """
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            raise IngestError('Invalid JSON: {0}'.format(error), number)
+        if not isinstance(record, dict):
+            raise IngestError('Expected a JSON object.', number)
+        yield number, record
+
+
+def _premis(tag):
+    return '{{{0}}}{1}'.format(PREMIS_NAMESPACE, tag)
+
+
+def _premis_text(element, path):
+    found = element.find(path.format(ns=PREMIS_NAMESPACE))
+    if found is None:
+        return None
+    return found.text or ''
+
+
+def parse_premis(stream, defaults=None):
+    """Yield (record number, record) pairs from the `premis:event`
+    elements of a PREMIS document, whether a single event or a
+    container of events.
+
+    PREMIS has no title or email address for events, so those come from
+    `defaults`, which may only set the PREMIS_DEFAULT_FIELDS. The title
+    defaults to the start of the event detail.
+    """
+    defaults = {name: value for name, value in (defaults or {}).items()
+                if name in PREMIS_DEFAULT_FIELDS}
+    number = 0
+    try:
+        for _, element in ElementTree.iterparse(stream):
+            if element.tag != _premis('event'):
+                continue
+            number += 1
+            record = {
+                'id': _premis_text(
+                    element, '{{{ns}}}eventIdentifier/'
+                             '{{{ns}}}eventIdentifierValue'),
+                'date': _premis_text(element, '{{{ns}}}eventDateTime'),
+                'detail': _premis_text(element, '{{{ns}}}eventDetail'),
+                'outcome': _premis_text(
+                    element, '{{{ns}}}eventOutcomeInformation/'
+                             '{{{ns}}}eventOutcome'),
+                'outcome_detail': _premis_text(
+                    element, '{{{ns}}}eventOutcomeInformation/'
+                             '{{{ns}}}eventOutcomeDetail/'
+                             '{{{ns}}}eventOutcomeDetailNote'),
+                'contact_name': _premis_text(
+                    element, '{{{ns}}}linkingAgentIdentifier/'
+                             '{{{ns}}}linkingAgentIdentifierValue'),
+            }
+            record = {key: value for key, value in record.items()
+                      if value is not None}
+            for key, value in defaults.items():
+                record.setdefault(key, value)
+            record.setdefault('title', record.get('detail', '')[:100])
+            element.clear()
+            yield number, record
+    except ElementTree.ParseError as error:
+        raise IngestError('Invalid XML: {0}'.format(error), number + 1)
+
+
+def check_type(name, value, line=None):
+    """Raise IngestError unless a record value has a type the field
+    accepts. Missing values (None) are left for validation to report.
+    """
+    types = (str,)
+    if name == 'date':
+        types = (str, datetime.datetime)
+    elif name == 'id':
+        types = (str, uuid.UUID)
+    if value is not None and not isinstance(value, types):
+        raise IngestError('Invalid {0}: expected a string, not {1}'.format(
+            name, type(value).__name__), line)
+
+
+def build_event(record, line=None):
+    """Return an unsaved, validated Event built from a record.
+
+    The agent of the event is unsaved as well, until the event is
+    loaded (see resolve_agents).
+    """
+    unknown = set(record) - set(RECORD_FIELDS)
+    if unknown:
+        raise IngestError('Unknown fields: {0}'.format(
+            ', '.join(sorted(unknown))), line)
+    for name, value in record.items():
+        check_type(name, value, line)
+    fields = dict(record)
+
+    outcome = fields.get('outcome')
+    if isinstance(outcome, str) and outcome.lower() in OUTCOMES:
+        fields['outcome'] = OUTCOMES[outcome.lower()]
+
+    date = fields.get('date')
+    if isinstance(date, str):
+        try:
+            date = parse_datetime(date)
+        except ValueError:
+            date = None
+        if date is None:
+            raise IngestError('Invalid date: {0}'.format(fields['date']), line)
+        fields['date'] = date
+    if isinstance(date, datetime.datetime) and timezone.is_naive(date):
+        fields['date'] = timezone.make_aware(date)
+
+    if fields.get('id') is not None:
+        try:
+            fields['id'] = uuid.UUID(str(fields['id']))
+        except ValueError:
+            raise IngestError('Invalid id: {0}'.format(fields['id']), line)
+    else:
+        fields.pop('id', None)
+
+    agent = Agent(**{AGENT_FIELDS[name]: fields.pop(name)
+                     for name in AGENT_FIELDS if name in fields})
+    event = Event(agent=agent, **fields)
+    errors = {}
+    for instance, exclude, names in (
+            (event, ['agent'], {}),
+            (agent, [], {value: key for key, value in AGENT_FIELDS.items()})):
+        try:
+            instance.full_clean(exclude=exclude, validate_unique=False,
+                                validate_constraints=False)
+        except ValidationError as error:
+            for field, messages in error.message_dict.items():
+                errors[names.get(field, field)] = messages
+    if errors:
+        messages = ('{0}: {1}'.format(field, ' '.join(errors[field]))
+                    for field in sorted(errors))
+        raise IngestError('; '.join(messages), line)
+    return event
+
+
+def build_events(records):
+    """Validate (line number, record) pairs into unsaved events."""
+    for line, record in records:
+        yield build_event(record, line)
+
+
+def load_events(events, batch_size=DEFAULT_BATCH_SIZE, idempotency_key=None):
+    """Write unsaved events to the database in batches.
+
+    Each batch is written in its own transaction. With an idempotency
+    key, batches already recorded under the key are skipped. Returns a
+    dictionary with the number of events created and skipped, or raises
+    an IngestConflict for the first batch that could not be written.
+    """
+    if idempotency_key:
+        check_idempotency_key(idempotency_key)
+    result = {'created': 0, 'skipped': 0, 'batches': 0}
+    agents = {}
+    events = iter(events)
+    for number in itertools.count():
+        batch = list(itertools.islice(events, batch_size))
+        if not batch:
+            break
+        result['batches'] += 1
+        try:
+            written = load_batch(batch, idempotency_key, number, agents)
+        except IntegrityError as error:
+            raise IngestConflict(str(error), result['created'],
+                                 number) from error
+        if written:
+            result['created'] += len(batch)
+        else:
+            result['skipped'] += len(batch)
+    return result
+
+
+def resolve_agents(events, agents=None):
+    """Point each event at the saved agent with the name and email
+    address of its agent, creating the agents that don't exist yet.
+
+    `agents` caches the saved agents by name and email address across
+    calls.
+    """
+    if agents is None:
+        agents = {}
+    for event in events:
+        key = (event.agent.name, event.agent.email)
+        if key not in agents:
+            agents[key], _ = Agent.objects.get_or_create(name=key[0],
+                                                         email=key[1])
+        event.agent = agents[key]
+
+
+def load_batch(events, idempotency_key, number, agents=None):
+    """Write one batch of events. Returns False if the batch was
+    already written under the idempotency key.
+    """
+    key = None
+    if idempotency_key:
+        key = '{0}:{1}'.format(idempotency_key, number)
+        if IngestBatch.objects.filter(key=key).exists():
+            return False
+    # Outside the transaction of the batch, so that the cached agents
+    # stay saved whatever becomes of it.
+    resolve_agents(events, agents)
+    try:
+        with transaction.atomic():
+            if key:
+                IngestBatch.objects.create(key=key, event_count=len(events))
+            Event.objects.bulk_create(events)
+    except IntegrityError:
+        # A concurrent retry may have written the batch in the meantime.
+        if key and IngestBatch.objects.filter(key=key).exists():
+            return False
+        raise
+    events_created.send(sender=Event, events=events)
+    return True
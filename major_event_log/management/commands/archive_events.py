@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from major_event_log.archive import (DEFAULT_BATCH_SIZE, archive_cutoff,
+                                     archive_events)
+from major_event_log.export import parse_timestamp
+
+
+class Command(BaseCommand):
+    help = ('Moves the events entered before a cutoff to the archive, '
+            'where they can still be looked up by id.')
+
+    def add_arguments(self, parser):
+        cutoff = parser.add_mutually_exclusive_group(required=True)
+        cutoff.add_argument(
+            '--before', help='Archive the events entered before this '
+                             'ISO 8601 date or date and time.')
+        cutoff.add_argument(
+            '--older-than', type=int, metavar='DAYS',
+            help='Archive the events entered more than this many days ago.')
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help='Number of events moved in each transaction.')
+        parser.add_argument(
+            '--database', default='default',
+            help='Database to archive the events of.')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                before = parse_timestamp(options['before'])
+            except ValueError as error:
+                raise CommandError(error)
+        else:
+            before = archive_cutoff(options['older_than'])
+        if options['batch_size'] < 1:
+            raise CommandError('The batch size must be at least 1.')
+
+        total = 0
+        for moved in archive_events(before, options['batch_size'],
+                                    using=options['database']):
+            total += moved
+            if options['verbosity'] > 1:
+                self.stdout.write('Archived {0} events.'.format(total))
+        self.stdout.write('Archived {0} events entered before {1}.'.format(
+            total, before.isoformat()))
@@ -0,0 +1,40 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from major_event_log.static_site import build_static_site
+
+
+class Command(BaseCommand):
+    help = ('Renders the index, the feed, the about page and the records of '
+            'every event to static files, re-rendering only the pages that '
+            'changed since the last build.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output', help='Directory to write the site to.')
+        parser.add_argument(
+            '--base-url', required=True,
+            help='Scheme and host the site is served at, such as '
+                 'https://example.org, used in the absolute links of the '
+                 'feeds and records.')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Number of processes rendering pages. Defaults to the '
+                 'number of CPUs; 1 renders in this process.')
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Render every page, as after changing templates.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('The number of workers must be at least 1.')
+        if not options['base_url'].startswith(('http://', 'https://')):
+            raise CommandError('The base URL must start with http:// or '
+                               'https://.')
+        result = build_static_site(options['output'], options['base_url'],
+                                   workers=options['workers'],
+                                   full=options['full'])
+        self.stdout.write(
+            'Rendered {rendered} pages, kept {unchanged} unchanged pages and '
+            'removed {removed} pages.'.format(**result))
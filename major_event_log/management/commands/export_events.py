@@ -0,0 +1,82 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from major_event_log.export import (DEFAULT_CHUNK_SIZE, EXPORT_FIELDS,
+                                    csv_chunks, dated_events, event_rows,
+                                    jsonl_chunks, parse_timestamp,
+                                    write_output)
+from major_event_log.ingest import OUTCOMES
+from major_event_log.models import Event
+
+FORMATS = {
+    'jsonl': jsonl_chunks,
+    'csv': csv_chunks,
+}
+
+
+class Command(BaseCommand):
+    help = 'Writes events as JSON lines or CSV for offline analysis.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', choices=sorted(FORMATS), default='jsonl',
+            help='Output format. Defaults to jsonl.')
+        parser.add_argument(
+            '--since', help='Only export events dated at or after this '
+                            'ISO 8601 date or date and time.')
+        parser.add_argument(
+            '--until', help='Only export events dated before this ISO 8601 '
+                            'date or date and time.')
+        parser.add_argument(
+            '--outcome', help='Only export events with this outcome, given '
+                              'by its label or URI.')
+        parser.add_argument(
+            '-o', '--output',
+            help='File to write to. Defaults to standard output.')
+        parser.add_argument(
+            '--gzip', action='store_true', help='Compress the output.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+            help='Number of rows fetched from the database at a time.')
+
+    def get_filters(self, options):
+        filters = {}
+        for name in ('since', 'until'):
+            if options[name]:
+                try:
+                    filters[name] = parse_timestamp(options[name])
+                except ValueError as error:
+                    raise CommandError(error)
+        outcome = options['outcome']
+        if outcome:
+            outcome = OUTCOMES.get(outcome.lower(), outcome)
+            if outcome not in dict(Event.OUTCOME_CHOICES):
+                raise CommandError(
+                    'Unknown outcome: {0}'.format(options['outcome']))
+            filters['outcome'] = outcome
+        return filters
+
+    def count_rows(self, rows):
+        for row in rows:
+            self.row_count += 1
+            yield row
+
+    def handle(self, *args, **options):
+        events = dated_events(**self.get_filters(options))
+        self.row_count = 0
+        rows = self.count_rows(
+            event_rows(events, chunk_size=options['chunk_size']))
+        chunks = FORMATS[options['format']](rows, EXPORT_FIELDS)
+
+        started = time.perf_counter()
+        try:
+            write_output(chunks, options['output'], options['gzip'],
+                         self.stdout)
+        except ValueError as error:
+            raise CommandError(error)
+        elapsed = time.perf_counter() - started
+
+        self.stderr.write('Exported {0} events in {1:.1f}s ({2:.0f} rows/s).'
+                          .format(self.row_count, elapsed,
+                                  self.row_count / elapsed if elapsed else 0))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from major_event_log.export import (DEFAULT_CHUNK_SIZE, modified_events,
+                                    parse_timestamp, premis_export_chunks,
+                                    write_output)
+
+
+class Command(BaseCommand):
+    help = 'Writes every event to a single PREMIS XML document.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since', help='Only export events modified at or after this '
+                            'ISO 8601 date or date and time.')
+        parser.add_argument(
+            '--until', help='Only export events modified before this ISO '
+                            '8601 date or date and time.')
+        parser.add_argument(
+            '-o', '--output',
+            help='File to write to. Defaults to standard output.')
+        parser.add_argument(
+            '--gzip', action='store_true', help='Compress the output.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+            help='Number of events fetched from the database at a time.')
+
+    def handle(self, *args, **options):
+        bounds = {}
+        for name in ('since', 'until'):
+            if options[name]:
+                try:
+                    bounds[name] = parse_timestamp(options[name])
+                except ValueError as error:
+                    raise CommandError(error)
+
+        events = modified_events(**bounds)
+        chunks = premis_export_chunks(events, chunk_size=options['chunk_size'])
+        try:
+            write_output(chunks, options['output'], options['gzip'],
+                         self.stdout)
+        except ValueError as error:
+            raise CommandError(error)
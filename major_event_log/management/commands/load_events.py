@@ -0,0 +1,67 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from major_event_log.ingest import (DEFAULT_BATCH_SIZE,
+                                    PREMIS_DEFAULT_FIELDS, IngestConflict,
+                                    IngestError,
+                                    build_events, load_events, parse_jsonl,
+                                    parse_premis)
+
+
+class Command(BaseCommand):
+    help = 'Loads events in bulk from a JSON lines or PREMIS XML file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='File to load, or - for standard input.')
+        parser.add_argument(
+            '--format', choices=['jsonl', 'premis'],
+            help='Format of the file. Defaults to premis for .xml files and '
+                 'jsonl otherwise.')
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help='Number of events written per transaction.')
+        parser.add_argument(
+            '--idempotency-key',
+            help='Key recorded with each batch, so that loading the file '
+                 'again with the same key skips the batches already loaded.')
+        parser.add_argument(
+            '--title', help='Title for PREMIS records.')
+        parser.add_argument(
+            '--contact-name', help='Contact name for PREMIS records that '
+                                   'have no linking agent.')
+        parser.add_argument(
+            '--contact-email', help='Contact email for PREMIS records.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format']
+        if file_format is None:
+            file_format = 'premis' if path.endswith('.xml') else 'jsonl'
+
+        stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        try:
+            if file_format == 'premis':
+                defaults = {field: options[field]
+                            for field in PREMIS_DEFAULT_FIELDS
+                            if options[field]}
+                records = parse_premis(stream, defaults=defaults)
+            else:
+                records = parse_jsonl(stream)
+            result = load_events(build_events(records),
+                                 batch_size=options['batch_size'],
+                                 idempotency_key=options['idempotency_key'])
+        except IngestError as error:
+            raise CommandError(error)
+        except IngestConflict as error:
+            raise CommandError(
+                'Could not write batch {0} after creating {1} events: '
+                '{2}'.format(error.batch, error.created, error))
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+        self.stdout.write(
+            'Created {created} events and skipped {skipped} already loaded '
+            'events in {batches} batches.'.format(**result))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from major_event_log.counts import rebuild_counters
+from major_event_log.facets import rebuild_facet_counts
+
+
+class Command(BaseCommand):
+    help = ('Recounts the events and stores the counts used for '
+            'pagination and the facet sidebar.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default='default',
+            help='Database to rebuild the counters of.')
+
+    def handle(self, *args, **options):
+        counts = rebuild_counters(using=options['database'])
+        for name, count in sorted(counts.items()):
+            self.stdout.write('{0}: {1}'.format(name, count))
+        facets = rebuild_facet_counts(using=options['database'])
+        self.stdout.write('Rebuilt {0} facet counts.'.format(facets))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from major_event_log.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recounts the daily event rollups behind the statistics page.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default='default',
+            help='Database to rebuild the rollups of.')
+
+    def handle(self, *args, **options):
+        count = rebuild_rollups(using=options['database'])
+        self.stdout.write('Rebuilt {0} rollups.'.format(count))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from major_event_log.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of the events.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default='default',
+            help='Database to rebuild the search index of.')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend(options['database'])
+        count = backend.rebuild()
+        if count is None:
+            self.stdout.write('{0} keeps no separate index.'.format(
+                type(backend).__name__))
+        else:
+            self.stdout.write('Indexed {0} events.'.format(count))
@@ -0,0 +1,315 @@
+"""Query count, database time, render time and response size of views.
+
+MetricsMiddleware measures every request to a view of the app, and the
+instrument_view decorator measures a single view:
+
+- the number of SQL queries and the time spent running them, through a
+  database execute wrapper, so DEBUG doesn't need to be on;
+- the time spent rendering templates, records and feeds (marked in the
+  views with `rendering()`), including the queries made lazily while
+  rendering;
+- the total time of the view and the size of the response.
+
+Streaming responses are measured until the response is returned, before
+its content is generated, and their size is not recorded.
+
+Async views are measured too. Their queries run in the thread that
+`sync_to_async` runs the request's database work in, so the execute
+wrapper is installed there rather than in the event loop's thread.
+
+The measurements of a request are returned in a Server-Timing header
+(unless MAJOR_EVENT_LOG_SERVER_TIMING is False) and added to totals per
+view, which the `metrics/` view serves in the Prometheus text format
+when MAJOR_EVENT_LOG_METRICS_ENDPOINT is True. The totals are kept in
+process, so every worker process of a server reports its own.
+"""
+import contextvars
+import functools
+import threading
+import time
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.db import connections
+
+APP_NAME = 'major-event-log'
+# Upper bounds of the buckets of the request duration histogram, in
+# seconds.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                    10.0)
+# The metrics of the request being measured in the current context.
+_current = contextvars.ContextVar('major_event_log_metrics', default=None)
+
+
+class RequestMetrics(object):
+    """The measurements of one request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.total_seconds = 0.0
+        # None for streaming responses.
+        self.response_bytes = None
+
+    def __call__(self, execute, sql, params, many, context):
+        """Time a query, as a database execute wrapper."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - started
+
+    def server_timing(self):
+        """Return the measurements as a Server-Timing header value."""
+        return ('db;dur={0:.1f};desc="{1} queries", render;dur={2:.1f}, '
+                'total;dur={3:.1f}').format(
+                    self.db_seconds * 1000, self.queries,
+                    self.render_seconds * 1000, self.total_seconds * 1000)
+
+
+@contextmanager
+def rendering():
+    """Add the time spent in the block to the render time of the request
+    being measured, if any.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.render_seconds += time.perf_counter() - started
+
+
+def _escape_label(value):
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+class MetricsRegistry(object):
+    """Thread-safe totals of the measured requests of each view."""
+
+    counters = (
+        ('queries', 'queries_total', 'SQL queries run by requests.'),
+        ('db_seconds', 'db_seconds_total',
+         'Time spent running SQL queries.'),
+        ('render_seconds', 'render_seconds_total',
+         'Time spent rendering templates, records and feeds.'),
+        ('response_bytes', 'response_bytes_total',
+         'Size of the (non-streaming) responses.'),
+    )
+    prefix = 'major_event_log_view_'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, metrics):
+        """Add the measurements of a request to the totals of a view."""
+        with self._lock:
+            totals = self._views.get(view)
+            if totals is None:
+                totals = self._views[view] = {
+                    'requests': 0, 'seconds': 0.0, 'queries': 0,
+                    'db_seconds': 0.0, 'render_seconds': 0.0,
+                    'response_bytes': 0,
+                    'buckets': [0] * len(DURATION_BUCKETS),
+                }
+            totals['requests'] += 1
+            totals['seconds'] += metrics.total_seconds
+            totals['queries'] += metrics.queries
+            totals['db_seconds'] += metrics.db_seconds
+            totals['render_seconds'] += metrics.render_seconds
+            totals['response_bytes'] += metrics.response_bytes or 0
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if metrics.total_seconds <= bound:
+                    totals['buckets'][index] += 1
+
+    def get_stats(self):
+        """Return a copy of the totals of each view."""
+        with self._lock:
+            return {view: dict(totals, buckets=list(totals['buckets']))
+                    for view, totals in self._views.items()}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def prometheus(self):
+        """Return the totals in the Prometheus text exposition format."""
+        stats = sorted(self.get_stats().items())
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append('# HELP {0}{1} {2}'.format(self.prefix, name,
+                                                    help_text))
+            lines.append('# TYPE {0}{1} {2}'.format(self.prefix, name, kind))
+
+        def sample(name, view, value, **labels):
+            labels = ''.join(',{0}="{1}"'.format(key, label)
+                             for key, label in labels.items())
+            lines.append('{0}{1}{{view="{2}"{3}}} {4}'.format(
+                self.prefix, name, _escape_label(view), labels, value))
+
+        metric('requests_total', 'counter', 'Requests served.')
+        for view, totals in stats:
+            sample('requests_total', view, totals['requests'])
+        metric('request_duration_seconds', 'histogram',
+               'Time spent in the view.')
+        for view, totals in stats:
+            for bound, count in zip(DURATION_BUCKETS, totals['buckets']):
+                sample('request_duration_seconds_bucket', view, count,
+                       le=repr(bound))
+            sample('request_duration_seconds_bucket', view,
+                   totals['requests'], le='+Inf')
+            sample('request_duration_seconds_sum', view, totals['seconds'])
+            sample('request_duration_seconds_count', view,
+                   totals['requests'])
+        for key, name, help_text in self.counters:
+            metric(name, 'counter', help_text)
+            for view, totals in stats:
+                sample(name, view, totals[key])
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def measuring():
+    """Measure the queries and rendering in the block.
+
+    Yields the RequestMetrics being filled in, or None if the block is
+    already being measured (by the middleware and a decorated view, say),
+    so that a request is only measured once.
+    """
+    if _current.get() is not None:
+        yield None
+        return
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            _wrap_connections(stack, metrics)
+            yield metrics
+    finally:
+        _current.reset(token)
+        metrics.total_seconds = time.perf_counter() - started
+
+
+@asynccontextmanager
+async def ameasuring():
+    """Measure the queries and rendering in the block, for async views,
+    as `measuring` does.
+    """
+    if _current.get() is not None:
+        yield None
+        return
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    started = time.perf_counter()
+    stack = ExitStack()
+    try:
+        await sync_to_async(_wrap_connections)(stack, metrics)
+        yield metrics
+    finally:
+        await sync_to_async(stack.close)()
+        _current.reset(token)
+        metrics.total_seconds = time.perf_counter() - started
+
+
+def _wrap_connections(stack, metrics):
+    """Time the queries of the current thread's connections."""
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(metrics))
+
+
+def render_response(response):
+    """Render a template response now, as part of the render time."""
+    if callable(getattr(response, 'render', None)) and not response.is_rendered:
+        with rendering():
+            response.render()
+    return response
+
+
+def record_response(view, metrics, response):
+    """Record the measurements of a request under the view name and add
+    the Server-Timing header to its response.
+    """
+    if not response.streaming:
+        metrics.response_bytes = len(response.content)
+    registry.record(view, metrics)
+    if getattr(settings, 'MAJOR_EVENT_LOG_SERVER_TIMING', True):
+        timing = metrics.server_timing()
+        if response.has_header('Server-Timing'):
+            timing = response['Server-Timing'] + ', ' + timing
+        response['Server-Timing'] = timing
+
+
+def instrument_view(view):
+    """Decorator measuring a view, recorded under its dotted path."""
+    name = '{0}.{1}'.format(view.__module__, view.__qualname__)
+
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            async with ameasuring() as metrics:
+                response = await view(request, *args, **kwargs)
+                response = await sync_to_async(render_response)(response)
+            if metrics is not None:
+                record_response(name, metrics, response)
+            return response
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with measuring() as metrics:
+            response = render_response(view(request, *args, **kwargs))
+        if metrics is not None:
+            record_response(name, metrics, response)
+        return response
+    return wrapper
+
+
+class MetricsMiddleware(object):
+    """Measures the requests to the views of the app, recorded under
+    their URL names (e.g. `major-event-log:index`). Runs natively under
+    both WSGI and ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with measuring() as metrics:
+            response = self.get_response(request)
+        return self.record(request, metrics, response)
+
+    async def __acall__(self, request):
+        async with ameasuring() as metrics:
+            response = await self.get_response(request)
+        return self.record(request, metrics, response)
+
+    def record(self, request, metrics, response):
+        match = getattr(request, 'resolver_match', None)
+        if (metrics is not None and match is not None and
+                APP_NAME in match.app_names):
+            record_response(match.view_name, metrics, response)
+        return response
+
+    def process_template_response(self, request, response):
+        return render_response(response)
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('major_event_log', '0003_auto_20191216_1716'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='event',
+            options={'ordering': ['date', 'id']},
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['entry_created', 'id'], name='event_entry_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['date', 'id'], name='event_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['outcome', 'date', 'id'], name='event_outcome_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('major_event_log', '0004_event_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['entry_modified', 'id'], name='event_entry_modified_id_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+def create_total_counter(apps, schema_editor):
+    Event = apps.get_model('major_event_log', 'Event')
+    EventCounter = apps.get_model('major_event_log', 'EventCounter')
+    using = schema_editor.connection.alias
+    EventCounter.objects.using(using).create(
+        name='events', count=Event.objects.using(using).count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('major_event_log', '0006_ingestbatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventCounter',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_total_counter, migrations.RunPython.noop),
+    ]
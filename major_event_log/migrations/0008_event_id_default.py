@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:48
+
+from django.db import migrations, models
+import major_event_log.uuids
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('major_event_log', '0007_eventcounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='id',
+            field=models.UUIDField(default=major_event_log.uuids.event_id, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
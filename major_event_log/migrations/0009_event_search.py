@@ -0,0 +1,48 @@
+from django.db import migrations, transaction
+from django.db.utils import OperationalError
+
+# Keep in step with major_event_log.search.
+FTS_TABLE = 'major_event_log_event_fts'
+PG_DOCUMENT = ("to_tsvector('english', coalesce(title, '') || ' ' || "
+               "coalesce(detail, '') || ' ' || coalesce(outcome_detail, ''))")
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX event_search_idx ON major_event_log_event '
+            'USING GIN (({0}))'.format(PG_DOCUMENT))
+    elif connection.vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=connection.alias):
+                schema_editor.execute(
+                    'CREATE VIRTUAL TABLE {0} USING fts5(event_id UNINDEXED, '
+                    'title, detail, outcome_detail)'.format(FTS_TABLE))
+        except OperationalError:
+            # SQLite was built without FTS5; searches fall back to
+            # substring matches.
+            return
+        schema_editor.execute(
+            'INSERT INTO {0} (event_id, title, detail, outcome_detail) '
+            'SELECT id, title, detail, outcome_detail '
+            'FROM major_event_log_event'.format(FTS_TABLE))
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS event_search_idx')
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS {0}'.format(FTS_TABLE))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('major_event_log', '0008_event_id_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
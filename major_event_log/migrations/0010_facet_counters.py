@@ -0,0 +1,37 @@
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import ExtractYear
+
+
+def count_facets(apps, schema_editor):
+    Event = apps.get_model('major_event_log', 'Event')
+    EventCounter = apps.get_model('major_event_log', 'EventCounter')
+    using = schema_editor.connection.alias
+    events = Event.objects.using(using).order_by()
+    counters = []
+    for facet, field, rows in (
+            ('outcome', 'outcome', events),
+            ('year', 'year', events.annotate(year=ExtractYear('date'))),
+            ('agent', 'contact_name', events)):
+        for row in rows.values(field).annotate(count=Count('id')):
+            counters.append(EventCounter(
+                name='{0}:{1}'.format(facet, row[field]),
+                count=row['count']))
+    EventCounter.objects.using(using).bulk_create(counters)
+
+
+def delete_facets(apps, schema_editor):
+    EventCounter = apps.get_model('major_event_log', 'EventCounter')
+    EventCounter.objects.using(schema_editor.connection.alias).exclude(
+        name='events').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('major_event_log', '0009_event_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_facets, delete_facets),
+    ]
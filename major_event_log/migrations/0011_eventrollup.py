@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:54
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def build_rollups(apps, schema_editor):
+    Event = apps.get_model('major_event_log', 'Event')
+    EventRollup = apps.get_model('major_event_log', 'EventRollup')
+    using = schema_editor.connection.alias
+    rows = (Event.objects.using(using).order_by()
+            .annotate(day=TruncDate('date'))
+            .values('day', 'outcome', 'contact_name')
+            .annotate(count=Count('id')))
+    EventRollup.objects.using(using).bulk_create(
+        [EventRollup(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('major_event_log', '0010_facet_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('outcome', models.CharField(choices=[('http://purl.org/NET/UNTL/vocabularies/eventOutcomes/#success', 'Success'), ('http://purl.org/NET/UNTL/vocabularies/eventOutcomes/#failure', 'Failure')], max_length=80)),
+                ('contact_name', models.CharField(max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='eventrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'outcome', 'contact_name'), name='event_rollup_unique'),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('major_event_log', '0011_eventrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Agent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Appears as the Reporting Agent', max_length=100)),
+                ('email', models.EmailField(max_length=254)),
+            ],
+            options={
+                'ordering': ['name', 'email'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='agent',
+            constraint=models.UniqueConstraint(fields=('name', 'email'), name='agent_name_email_unique'),
+        ),
+        # Nullable until 0014 removes them, so that 0014 can be reversed.
+        migrations.AlterField(
+            model_name='event',
+            name='contact_name',
+            field=models.CharField(help_text='Appears as the Reporting Agent', max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='contact_email',
+            field=models.EmailField(max_length=254, null=True),
+        ),
+        migrations.AlterField(
+            model_name='eventrollup',
+            name='contact_name',
+            field=models.CharField(max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='agent',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='events', to='major_event_log.agent', verbose_name='reporting agent'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='eventrollup',
+            name='event_rollup_unique',
+        ),
+        migrations.AddField(
+            model_name='eventrollup',
+            name='agent',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='major_event_log.agent'),
+        ),
+    ]
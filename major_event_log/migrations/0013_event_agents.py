@@ -0,0 +1,79 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import TruncDate
+
+
+def recount_agents(apps, using, fields):
+    """Rebuild the rollups and agent facet counters from the events,
+    grouping them by the given agent fields. The first field names the
+    agent facet counters.
+    """
+    Event = apps.get_model('major_event_log', 'Event')
+    EventCounter = apps.get_model('major_event_log', 'EventCounter')
+    EventRollup = apps.get_model('major_event_log', 'EventRollup')
+    events = Event.objects.using(using).order_by()
+    rows = (events.annotate(day=TruncDate('date'))
+            .values('day', 'outcome', *fields)
+            .annotate(count=Count('id')))
+    rollups = []
+    for row in rows:
+        if 'agent' in row:
+            row['agent_id'] = row.pop('agent')
+        rollups.append(EventRollup(**row))
+    EventRollup.objects.using(using).all().delete()
+    EventRollup.objects.using(using).bulk_create(rollups, batch_size=1000)
+    counters = EventCounter.objects.using(using)
+    counters.filter(name__startswith='agent:').delete()
+    counters.bulk_create([
+        EventCounter(name='agent:{0}'.format(row[fields[0]]),
+                     count=row['count'])
+        for row in events.values(fields[0]).annotate(count=Count('id'))])
+
+
+def create_agents(apps, schema_editor):
+    """Create an agent for every distinct contact name and email address
+    of the events, and point the events at them.
+
+    The events are updated in one statement, each looking its agent up
+    through the unique (name, email) index of the agents, rather than
+    scanning the events once per agent.
+    """
+    Agent = apps.get_model('major_event_log', 'Agent')
+    Event = apps.get_model('major_event_log', 'Event')
+    using = schema_editor.connection.alias
+    events = Event.objects.using(using)
+    contacts = (events.order_by('contact_name', 'contact_email')
+                .values_list('contact_name', 'contact_email').distinct())
+    Agent.objects.using(using).bulk_create(
+        [Agent(name=name, email=email) for name, email in contacts],
+        batch_size=1000)
+    events.update(agent=Subquery(
+        Agent.objects.using(using).filter(
+            name=OuterRef('contact_name'), email=OuterRef('contact_email'))
+        .values('pk')[:1]))
+    recount_agents(apps, using, ('agent', 'contact_name'))
+
+
+def copy_agents(apps, schema_editor):
+    """Copy the name and email address of each agent back to its
+    events, in one statement.
+    """
+    Agent = apps.get_model('major_event_log', 'Agent')
+    Event = apps.get_model('major_event_log', 'Event')
+    using = schema_editor.connection.alias
+    agents = Agent.objects.using(using).filter(pk=OuterRef('agent_id'))
+    Event.objects.using(using).filter(agent__isnull=False).update(
+        contact_name=Subquery(agents.values('name')[:1]),
+        contact_email=Subquery(agents.values('email')[:1]))
+    recount_agents(apps, using, ('contact_name',))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('major_event_log', '0012_agent'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_agents, copy_agents),
+    ]
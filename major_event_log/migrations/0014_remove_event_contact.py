@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('major_event_log', '0013_event_agents'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='event',
+            name='contact_email',
+        ),
+        migrations.RemoveField(
+            model_name='event',
+            name='contact_name',
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='agent',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='events', to='major_event_log.agent', verbose_name='reporting agent'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['agent', 'entry_created', 'id'], name='event_agent_created_id_idx'),
+        ),
+        migrations.RemoveField(
+            model_name='eventrollup',
+            name='contact_name',
+        ),
+        migrations.AlterField(
+            model_name='eventrollup',
+            name='agent',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='major_event_log.agent'),
+        ),
+        migrations.AddConstraint(
+            model_name='eventrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'outcome', 'agent'), name='event_rollup_unique'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('major_event_log', '0014_remove_event_contact'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedEvent',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=100)),
+                ('detail', models.TextField()),
+                ('outcome', models.CharField(choices=[('http://purl.org/NET/UNTL/vocabularies/eventOutcomes/#success', 'Success'), ('http://purl.org/NET/UNTL/vocabularies/eventOutcomes/#failure', 'Failure')], max_length=80)),
+                ('outcome_detail', models.TextField()),
+                ('date', models.DateTimeField()),
+                ('entry_created', models.DateTimeField()),
+                ('entry_modified', models.DateTimeField()),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_events', to='major_event_log.agent', verbose_name='reporting agent')),
+            ],
+            options={
+                'ordering': ['date', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations
+
+# Keep in step with major_event_log.search.
+FTS_TABLE = 'major_event_log_event_fts'
+FTS_IDS_TABLE = 'major_event_log_event_fts_ids'
+
+
+def has_table(schema_editor, name):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND "
+                       "name = %s", [name])
+        return cursor.fetchone() is not None
+
+
+def key_rows_by_rowid(apps, schema_editor):
+    """Replace the event_id column of the FTS5 table with a mapping from
+    event ids to its rowids, indexed by event id.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or not has_table(schema_editor,
+                                                      FTS_TABLE):
+        return
+    schema_editor.execute('DROP TABLE {0}'.format(FTS_TABLE))
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE {0} USING fts5(title, detail, '
+        'outcome_detail)'.format(FTS_TABLE))
+    schema_editor.execute(
+        'CREATE TABLE {0} (fts_rowid integer NOT NULL PRIMARY KEY, '
+        'event_id char(32) NOT NULL UNIQUE)'.format(FTS_IDS_TABLE))
+    schema_editor.execute(
+        'INSERT INTO {0} (event_id) SELECT id '
+        'FROM major_event_log_event'.format(FTS_IDS_TABLE))
+    schema_editor.execute(
+        'INSERT INTO {0} (rowid, title, detail, outcome_detail) '
+        'SELECT fts_rowid, title, detail, outcome_detail '
+        'FROM {1} JOIN major_event_log_event ON event_id = id'.format(
+            FTS_TABLE, FTS_IDS_TABLE))
+
+
+def key_rows_by_event_id(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or not has_table(schema_editor,
+                                                      FTS_IDS_TABLE):
+        return
+    schema_editor.execute('DROP TABLE {0}'.format(FTS_IDS_TABLE))
+    schema_editor.execute('DROP TABLE IF EXISTS {0}'.format(FTS_TABLE))
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE {0} USING fts5(event_id UNINDEXED, '
+        'title, detail, outcome_detail)'.format(FTS_TABLE))
+    schema_editor.execute(
+        'INSERT INTO {0} (event_id, title, detail, outcome_detail) '
+        'SELECT id, title, detail, outcome_detail '
+        'FROM major_event_log_event'.format(FTS_TABLE))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('major_event_log', '0015_archivedevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(key_rows_by_rowid, key_rows_by_event_id),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('major_event_log', '0016_event_search_rowids'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedevent',
+            index=models.Index(fields=['date', 'id'], name='archivedevent_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedevent',
+            index=models.Index(fields=['entry_modified', 'id'], name='archivedevent_modified_id_idx'),
+        ),
+    ]
@@ -1,44 +1,179 @@
 """Model definition.
 
 The Event class defines all the data required in order to create a
-major PREMIS event.
+major PREMIS event. The reporting agent of an event is an Agent, shared
+by all the events it reported. Old events can be moved to the
+ArchivedEvent table, which has the same fields.
 """
-import uuid
-
 from django.db import models
 from django.urls import reverse
 
+from .uuids import event_id
+
+
+class Agent(models.Model):
+    """The individual or organization reporting events."""
+    name = models.CharField(max_length=100,
+                            help_text='Appears as the Reporting Agent')
+    email = models.EmailField()
 
-class Event(models.Model):
+    def get_absolute_url(self):
+        return reverse('major-event-log:agent_events', args=[self.pk])
+
+    class Meta:
+        ordering = ['name', 'email']
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'email'],
+                                    name='agent_name_email_unique'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class BaseEvent(models.Model):
+    """The description of an event, shared by the events of the log and
+    those moved to the archive.
+    """
     SUCCESS = 'http://purl.org/NET/UNTL/vocabularies/eventOutcomes/#success'
     FAILURE = 'http://purl.org/NET/UNTL/vocabularies/eventOutcomes/#failure'
     OUTCOME_CHOICES = (
         (SUCCESS, 'Success'),
         (FAILURE, 'Failure'),
     )
-    # Unique identifier for each event. Primary key.
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=100)
     detail = models.TextField()
     outcome = models.CharField(max_length=80, choices=OUTCOME_CHOICES)
     outcome_detail = models.TextField()
     # Date of the event, NOT the date of entry.
     date = models.DateTimeField()
-    entry_created = models.DateTimeField(auto_now_add=True)
-    entry_modified = models.DateTimeField(auto_now=True)
-    # The contact_name attribute will be used as the reporting agent.
-    contact_name = models.CharField(max_length=100,
-                                    help_text='Appears as the Reporting Agent')
-    contact_email = models.EmailField()
+
+    class Meta:
+        abstract = True
 
     def get_absolute_url(self):
         return reverse('major-event-log:event_details', args=[self.id])
 
+    # The name and email address of the reporting agent, under the
+    # names of the columns they were once stored in. Select the agent
+    # along with the event (select_related) when reading them.
+    @property
+    def contact_name(self):
+        return self.agent.name
+
+    @property
+    def contact_email(self):
+        return self.agent.email
+
     def is_success(self):
         return self.outcome == self.SUCCESS
 
+    def __str__(self):
+        return self.title
+
+
+class Event(BaseEvent):
+    # Unique identifier for each event. Primary key. Version 4 or 7
+    # depending on MAJOR_EVENT_LOG_UUID_VERSION (see uuids.py).
+    id = models.UUIDField(primary_key=True, default=event_id, editable=False)
+    entry_created = models.DateTimeField(auto_now_add=True)
+    entry_modified = models.DateTimeField(auto_now=True)
+    # Indexed by event_agent_created_id_idx below.
+    agent = models.ForeignKey(Agent, on_delete=models.PROTECT,
+                              related_name='events', db_index=False,
+                              verbose_name='reporting agent')
+
+    class Meta:
+        ordering = ['date', 'id']
+        # Indexes matching the app's access paths: the index and feed
+        # sort by entry_created, the default ordering (and the admin)
+        # sorts by date, the admin filters by outcome, and exports
+        # select events by entry_modified. The agent listing sorts the
+        # events of an agent by entry_created.
+        indexes = [
+            models.Index(fields=['entry_created', 'id'],
+                         name='event_entry_created_id_idx'),
+            models.Index(fields=['date', 'id'], name='event_date_id_idx'),
+            models.Index(fields=['outcome', 'date', 'id'],
+                         name='event_outcome_date_id_idx'),
+            models.Index(fields=['entry_modified', 'id'],
+                         name='event_entry_modified_id_idx'),
+            models.Index(fields=['agent', 'entry_created', 'id'],
+                         name='event_agent_created_id_idx'),
+        ]
+
+
+class ArchivedEvent(BaseEvent):
+    """An event moved out of the events table by the archive_events
+    command (see archive.py), keeping its id and entry dates.
+
+    Archived events are looked up by id, and read by the changes and
+    exports (see chained.py) in the orders of their indexes.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    # Copied from the event, rather than set when the row is saved.
+    entry_created = models.DateTimeField()
+    entry_modified = models.DateTimeField()
+    agent = models.ForeignKey(Agent, on_delete=models.PROTECT,
+                              related_name='archived_events',
+                              verbose_name='reporting agent')
+
+    class Meta:
+        ordering = ['date', 'id']
+        indexes = [
+            models.Index(fields=['date', 'id'],
+                         name='archivedevent_date_id_idx'),
+            models.Index(fields=['entry_modified', 'id'],
+                         name='archivedevent_modified_id_idx'),
+        ]
+
+
+class IngestBatch(models.Model):
+    """Records a batch of events loaded in bulk.
+
+    The key is supplied by the client, so a batch that is retried with
+    the same key is recognized and not loaded twice.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    event_count = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+
     class Meta:
-        ordering = ['date']
+        verbose_name_plural = 'ingest batches'
 
     def __str__(self):
-        return self.title
+        return self.key
+
+
+class EventCounter(models.Model):
+    """A maintained count of events, so that counting them doesn't need
+    a scan of the events table (see counts.py).
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    count = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return '{0}: {1}'.format(self.name, self.count)
+
+
+class EventRollup(models.Model):
+    """The number of events of a day with an outcome and a reporting
+    agent, kept up to date as events change (see rollups.py).
+    """
+    day = models.DateField()
+    outcome = models.CharField(max_length=80, choices=Event.OUTCOME_CHOICES)
+    # An agent can only be deleted once it has no events, and so when
+    # its rollups are all zero.
+    agent = models.ForeignKey(Agent, on_delete=models.CASCADE,
+                              related_name='+')
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'outcome', 'agent'],
+                                    name='event_rollup_unique'),
+        ]
+
+    def __str__(self):
+        return '{0} {1} {2}: {3}'.format(self.day, self.get_outcome_display(),
+                                         self.agent_id, self.count)
@@ -0,0 +1,428 @@
+"""OAI-PMH 2.0 provider for the PREMIS event records.
+
+The provider serves the same PREMIS event records as the
+`event/<id>.premis.xml` pages under the `premis` metadata prefix. Lists
+are returned in batches ordered by (entry_modified, id), and resumption
+tokens carry the keyset position of the last record together with the
+original request arguments. No state is kept on the server, and every
+batch costs one indexed range query however far into the list it is.
+
+Settings:
+
+    MAJOR_EVENT_LOG_OAI_REPOSITORY_NAME  - repositoryName for Identify.
+    MAJOR_EVENT_LOG_OAI_REPOSITORY_IDENTIFIER - namespace identifier used
+                                           in OAI identifiers. Defaults
+                                           to the request's host name.
+    MAJOR_EVENT_LOG_OAI_ADMIN_EMAILS     - adminEmail values for Identify.
+                                           Defaults to the ADMINS emails.
+    MAJOR_EVENT_LOG_OAI_BATCH_SIZE       - records per list response.
+
+Like the changes feed, lists leave out the changes made within
+MAJOR_EVENT_LOG_CHANGES_LAG seconds (see changes.py).
+"""
+import base64
+import binascii
+import datetime
+import json
+import uuid
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from .chained import all_events
+from .changes import CHANGES_ORDERING, settled_changes
+from .models import ArchivedEvent, Event
+from .pagination import CursorPaginator, InvalidCursor
+from .records import RECORD_FIELDS, as_records
+from .routers import read_from_replica
+from .serializers import (PREMIS_NAMESPACE, end_tag, premis_event_chunks,
+                          start_tag, text_element)
+
+OAI_NAMESPACE = 'http://www.openarchives.org/OAI/2.0/'
+OAI_SCHEMA = 'http://www.openarchives.org/OAI/2.0/OAI-PMH.xsd'
+XSI_NAMESPACE = 'http://www.w3.org/2001/XMLSchema-instance'
+IDENTIFY_NAMESPACE = 'http://www.openarchives.org/OAI/2.0/oai-identifier'
+IDENTIFY_SCHEMA = 'http://www.openarchives.org/OAI/2.0/oai-identifier.xsd'
+GRANULARITY = 'YYYY-MM-DDThh:mm:ssZ'
+# The arguments of a list request carried in its resumption tokens.
+LIST_ARGUMENTS = ('metadataPrefix', 'from', 'until')
+
+METADATA_FORMATS = {
+    'premis': {
+        'schema': 'http://www.loc.gov/standards/premis/v2/premis-v2-0.xsd',
+        'metadataNamespace': PREMIS_NAMESPACE,
+    },
+}
+
+# The arguments each verb accepts: (required, optional, exclusive).
+VERB_ARGUMENTS = {
+    'Identify': ((), (), None),
+    'ListMetadataFormats': ((), ('identifier',), None),
+    'ListSets': ((), (), 'resumptionToken'),
+    'ListIdentifiers': (('metadataPrefix',), ('from', 'until', 'set'),
+                        'resumptionToken'),
+    'ListRecords': (('metadataPrefix',), ('from', 'until', 'set'),
+                    'resumptionToken'),
+    'GetRecord': (('identifier', 'metadataPrefix'), (), None),
+}
+
+
+class OAIError(Exception):
+    """An OAI-PMH error condition, reported in an `error` element."""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def get_setting(name, default=None):
+    return getattr(settings, 'MAJOR_EVENT_LOG_OAI_' + name, default)
+
+
+def format_datestamp(value):
+    """Format a datetime with the repository's UTC seconds granularity."""
+    if timezone.is_aware(value):
+        value = value.astimezone(datetime.timezone.utc)
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def parse_datestamp(value, until=False):
+    """Parse a from/until argument into an aware datetime bound.
+
+    Returns a pair of the bound and its granularity. Bounds are
+    inclusive, so an `until` bound is moved to the end of the day or
+    second it names, and is meant to be compared exclusively.
+    """
+    for fmt, granularity, step in (
+            ('%Y-%m-%d', 'day', datetime.timedelta(days=1)),
+            ('%Y-%m-%dT%H:%M:%SZ', 'second', datetime.timedelta(seconds=1))):
+        try:
+            parsed = datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+        if until:
+            parsed += step
+        return parsed, granularity
+    raise OAIError('badArgument', 'Invalid date: {0}'.format(value))
+
+
+class OAIRepository(object):
+    """Answers the OAI-PMH verbs for one request."""
+
+    def __init__(self, request, arguments):
+        self.request = request
+        self.arguments = arguments
+        self.base_url = request.build_absolute_uri(request.path)
+        self.batch_size = get_setting('BATCH_SIZE', 100)
+        self.namespace = get_setting('REPOSITORY_IDENTIFIER',
+                                     request.get_host().split(':')[0])
+
+    def make_identifier(self, event_id):
+        return 'oai:{0}:{1}'.format(self.namespace, event_id)
+
+    def parse_identifier(self, identifier):
+        """Return the event id of an OAI identifier or raise
+        idDoesNotExist.
+        """
+        prefix = 'oai:{0}:'.format(self.namespace)
+        if identifier.startswith(prefix):
+            try:
+                return uuid.UUID(identifier[len(prefix):])
+            except ValueError:
+                pass
+        raise OAIError('idDoesNotExist',
+                       'No record has the identifier {0}'.format(identifier))
+
+    def check_metadata_prefix(self, prefix):
+        if prefix not in METADATA_FORMATS:
+            raise OAIError('cannotDisseminateFormat',
+                           'Unsupported metadataPrefix: {0}'.format(prefix))
+
+    # Resumption tokens.
+
+    def encode_token(self, list_arguments, cursor):
+        data = dict(list_arguments, cursor=cursor)
+        raw = json.dumps(data, sort_keys=True, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    def decode_token(self, token):
+        """Return the list arguments and the cursor of a resumption
+        token, checking that they are all strings and that the cursor
+        can be decoded.
+        """
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+            if not isinstance(data, dict) or not data.get('cursor'):
+                raise ValueError('Incomplete resumption token')
+            if (set(data) - set(LIST_ARGUMENTS + ('cursor',)) or
+                    not all(isinstance(value, str)
+                            for value in data.values())):
+                raise ValueError('Unexpected resumption token arguments')
+            cursor = data.pop('cursor')
+            CursorPaginator(Event.objects.all(), self.batch_size,
+                            ordering=CHANGES_ORDERING).decode_cursor(cursor)
+        except (ValueError, UnicodeError, binascii.Error, InvalidCursor):
+            raise OAIError('badResumptionToken', 'Invalid resumption token.')
+        return data, cursor
+
+    # Verbs. Each verb checks its arguments and fetches what it needs
+    # before returning the chunks of its element, so that OAI errors are
+    # raised before the response starts streaming.
+
+    def Identify(self):
+        earliest = next(iter(all_events().order_by(*CHANGES_ORDERING)
+                             .values_list('entry_modified', flat=True)[:1]),
+                        None)
+        return self.identify_chunks(earliest or timezone.now())
+
+    def identify_chunks(self, earliest):
+        emails = get_setting('ADMIN_EMAILS') or [
+            email for _, email in settings.ADMINS] or [
+            settings.DEFAULT_FROM_EMAIL]
+        yield start_tag('Identify')
+        yield text_element('repositoryName', get_setting(
+            'REPOSITORY_NAME', 'PREMIS Major Event Log'))
+        yield text_element('baseURL', self.base_url)
+        yield text_element('protocolVersion', '2.0')
+        for email in emails:
+            yield text_element('adminEmail', email)
+        yield text_element('earliestDatestamp', format_datestamp(earliest))
+        yield text_element('deletedRecord', 'no')
+        yield text_element('granularity', GRANULARITY)
+        yield start_tag('description')
+        yield start_tag('oai-identifier', {
+            'xmlns': IDENTIFY_NAMESPACE,
+            'xmlns:xsi': XSI_NAMESPACE,
+            'xsi:schemaLocation': '{0} {1}'.format(IDENTIFY_NAMESPACE,
+                                                   IDENTIFY_SCHEMA),
+        })
+        yield text_element('scheme', 'oai')
+        yield text_element('repositoryIdentifier', self.namespace)
+        yield text_element('delimiter', ':')
+        yield text_element('sampleIdentifier', self.make_identifier(
+            '88888888-4444-4444-a444-121212121212'))
+        yield end_tag('oai-identifier')
+        yield end_tag('description')
+        yield end_tag('Identify')
+
+    def ListMetadataFormats(self):
+        if 'identifier' in self.arguments:
+            self.get_event(self.arguments['identifier'], fields=('id',))
+        return self.metadata_formats_chunks()
+
+    def metadata_formats_chunks(self):
+        yield start_tag('ListMetadataFormats')
+        for prefix, metadata_format in METADATA_FORMATS.items():
+            yield start_tag('metadataFormat')
+            yield text_element('metadataPrefix', prefix)
+            yield text_element('schema', metadata_format['schema'])
+            yield text_element('metadataNamespace',
+                               metadata_format['metadataNamespace'])
+            yield end_tag('metadataFormat')
+        yield end_tag('ListMetadataFormats')
+
+    def ListSets(self):
+        raise OAIError('noSetHierarchy',
+                       'This repository does not support sets.')
+
+    def ListIdentifiers(self):
+        return self.list_events('ListIdentifiers', ('id', 'entry_modified'))
+
+    def ListRecords(self):
+        return self.list_events('ListRecords', None)
+
+    def GetRecord(self):
+        self.check_metadata_prefix(self.arguments['metadataPrefix'])
+        event = self.get_event(self.arguments['identifier'])
+        return self.get_record_chunks(event)
+
+    def get_record_chunks(self, event):
+        yield start_tag('GetRecord')
+        yield from self.record_chunks(event)
+        yield end_tag('GetRecord')
+
+    # Helpers.
+
+    def get_event(self, identifier, fields=None):
+        event_id = self.parse_identifier(identifier)
+        for model in (Event, ArchivedEvent):
+            events = model.objects.filter(id=event_id)
+            event = as_records(events, fields or RECORD_FIELDS).first()
+            if event is not None:
+                break
+        else:
+            raise OAIError(
+                'idDoesNotExist',
+                'No record has the identifier {0}'.format(identifier))
+        return event
+
+    def header_chunks(self, event):
+        yield start_tag('header')
+        yield text_element('identifier', self.make_identifier(event.id))
+        yield text_element('datestamp',
+                           format_datestamp(event.entry_modified))
+        yield end_tag('header')
+
+    def record_chunks(self, event):
+        yield start_tag('record')
+        yield from self.header_chunks(event)
+        yield start_tag('metadata')
+        yield from premis_event_chunks(event)
+        yield end_tag('metadata')
+        yield end_tag('record')
+
+    def list_events(self, verb, fields):
+        """Fetch the next batch of a list and return the chunks of the
+        verb's element.
+
+        The batch is fetched before anything is written so that errors
+        such as noRecordsMatch can still be reported.
+        """
+        token = self.arguments.get('resumptionToken')
+        if token is not None:
+            list_arguments, cursor = self.decode_token(token)
+        else:
+            list_arguments = {
+                name: self.arguments[name]
+                for name in LIST_ARGUMENTS if name in self.arguments}
+            cursor = None
+            if 'set' in self.arguments:
+                raise OAIError('noSetHierarchy',
+                               'This repository does not support sets.')
+
+        try:
+            self.check_metadata_prefix(list_arguments['metadataPrefix'])
+            events = self.filter_events(settled_changes(all_events()),
+                                        list_arguments)
+        except (KeyError, OAIError):
+            if token is not None:
+                raise OAIError('badResumptionToken',
+                               'Invalid resumption token.')
+            raise
+        events = as_records(events, fields or RECORD_FIELDS)
+        paginator = CursorPaginator(events, self.batch_size,
+                                    ordering=CHANGES_ORDERING)
+        try:
+            page = paginator.page(cursor)
+        except InvalidCursor:
+            raise OAIError('badResumptionToken', 'Invalid resumption token.')
+        if not page.object_list:
+            if token is not None:
+                raise OAIError('badResumptionToken',
+                               'The resumption token has expired.')
+            raise OAIError('noRecordsMatch',
+                           'No records match the request.')
+
+        next_token = None
+        if page.has_next():
+            next_token = self.encode_token(list_arguments, page.next_cursor)
+        return self.list_chunks(verb, page.object_list, token, next_token)
+
+    def list_chunks(self, verb, events, token, next_token):
+        yield start_tag(verb)
+        for event in events:
+            if verb == 'ListIdentifiers':
+                yield ''.join(self.header_chunks(event))
+            else:
+                yield ''.join(self.record_chunks(event))
+        if next_token is not None:
+            yield text_element('resumptionToken', next_token)
+        elif token is not None:
+            # The last batch of a resumed list ends with an empty token.
+            yield '<resumptionToken/>'
+        yield end_tag(verb)
+
+    def filter_events(self, events, list_arguments):
+        granularities = set()
+        if 'from' in list_arguments:
+            since, granularity = parse_datestamp(list_arguments['from'])
+            granularities.add(granularity)
+            events = events.filter(entry_modified__gte=since)
+        if 'until' in list_arguments:
+            until, granularity = parse_datestamp(list_arguments['until'],
+                                                 until=True)
+            granularities.add(granularity)
+            events = events.filter(entry_modified__lt=until)
+        if len(granularities) > 1:
+            raise OAIError('badArgument',
+                           'The from and until arguments must have the '
+                           'same granularity.')
+        if 'from' in list_arguments and 'until' in list_arguments:
+            if since >= until:
+                raise OAIError('badArgument',
+                               'The from argument must be before until.')
+        return events
+
+
+def check_arguments(arguments):
+    """Check the verb and its arguments, raising OAIError for a bad
+    request.
+    """
+    verb = arguments.get('verb')
+    if verb not in VERB_ARGUMENTS:
+        raise OAIError('badVerb', 'Illegal or missing verb.')
+    required, optional, exclusive = VERB_ARGUMENTS[verb]
+    names = set(arguments) - {'verb'}
+    if exclusive and exclusive in names:
+        if names != {exclusive}:
+            raise OAIError('badArgument', 'The {0} argument is exclusive.'
+                           .format(exclusive))
+        return verb
+    missing = set(required) - names
+    if missing:
+        raise OAIError('badArgument', 'Missing argument: {0}'.format(
+            ', '.join(sorted(missing))))
+    illegal = names - set(required) - set(optional)
+    if illegal:
+        raise OAIError('badArgument', 'Illegal argument: {0}'.format(
+            ', '.join(sorted(illegal))))
+    return verb
+
+
+def response_chunks(request, arguments, verb, body):
+    """Yield the OAI-PMH envelope around the chunks of a verb's body."""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield start_tag('OAI-PMH', {
+        'xmlns': OAI_NAMESPACE,
+        'xmlns:xsi': XSI_NAMESPACE,
+        'xsi:schemaLocation': '{0} {1}'.format(OAI_NAMESPACE, OAI_SCHEMA),
+    })
+    yield text_element('responseDate', format_datestamp(timezone.now()))
+    # The request element only echoes the arguments of a valid request.
+    yield text_element('request', request.build_absolute_uri(request.path),
+                       arguments if verb else None)
+    yield from body
+    yield end_tag('OAI-PMH')
+    yield '\n'
+
+
+def error_chunks(error):
+    yield text_element('error', error.message, {'code': error.code})
+
+
+@read_from_replica
+@csrf_exempt
+@require_http_methods(['GET', 'HEAD', 'POST'])
+def oai_pmh(request):
+    """The OAI-PMH endpoint."""
+    query = request.POST if request.method == 'POST' else request.GET
+    arguments = query.dict()
+    verb = None
+    try:
+        if any(len(values) > 1 for _, values in query.lists()):
+            raise OAIError('badArgument', 'Repeated argument.')
+        verb = check_arguments(arguments)
+        body = getattr(OAIRepository(request, arguments), verb)()
+    except OAIError as error:
+        if error.code in ('badVerb', 'badArgument'):
+            verb = None
+        body = error_chunks(error)
+
+    chunks = response_chunks(request, arguments, verb, body)
+    return StreamingHttpResponse((chunk.encode('utf-8') for chunk in chunks),
+                                 content_type='text/xml; charset=utf-8')
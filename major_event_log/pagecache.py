@@ -0,0 +1,320 @@
+"""Cache for the pages of the event listing and its Atom feed.
+
+Listing pages are read far more often than events are written, so
+whole responses are cached, keyed by the view, host, path and query
+parameters (and so by page number or cursor). Every entry records the
+log version it was rendered at. The version is a single stamp in the
+Django cache that the signal receivers in signals.py bump when an event
+or agent is saved or deleted, once the transaction commits, so one
+write retires every cached page at once without the keys having to be
+enumerated. Updates made with `QuerySet.update()`, which sends no
+signals, are only picked up once entries expire.
+
+When a page is missing or out of date, the first request to notice
+takes a short lock (`cache.add`) and renders it again, while requests
+arriving in the meantime are answered with the previous copy, if any,
+or wait briefly for the new one. A burst of requests after a write
+thus renders each page once.
+
+The cache stands in front of the replica routing of routers.py.
+Requests from clients within their read-your-writes window skip it,
+as the pages cached for everyone may not show their own changes yet.
+Pages read from the replica within that window after a version bump
+are served but not stored, so that a copy rendered before the replica
+caught up with the write isn't cached under the new version.
+
+The cache is disabled unless MAJOR_EVENT_LOG_PAGE_CACHE is set:
+
+    MAJOR_EVENT_LOG_PAGE_CACHE = {
+        'ALIAS': 'default',     # Django cache alias holding the pages.
+        'TIMEOUT': 60,          # Seconds a page is fresh for...
+        'TIMEOUTS': {'feed': 300},  # ...or per view, by cache name.
+        'STALE_TIMEOUT': 60,    # Seconds an outdated page may be served
+                                # while it is rendered again.
+        'LOCK_TIMEOUT': 10,     # Longest expected render, in seconds.
+        'WAIT': 2,              # Seconds to wait for a page without a
+                                # previous copy before rendering it too.
+    }
+"""
+import asyncio
+import functools
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from .metrics import render_response
+from .routers import read_your_writes_seconds, replica_for, wrote_recently
+
+DEFAULT_OPTIONS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 60,
+    'TIMEOUTS': {},
+    'STALE_TIMEOUT': 60,
+    'LOCK_TIMEOUT': 10,
+    'WAIT': 2,
+}
+# How often a request waiting for a page checks whether it is ready.
+POLL_INTERVAL = 0.05
+
+
+class PageCache(object):
+    """Cache of whole responses, invalidated by a log version stamp."""
+
+    key_prefix = 'major_event_log:page'
+
+    def __init__(self):
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    @property
+    def options(self):
+        options = getattr(settings, 'MAJOR_EVENT_LOG_PAGE_CACHE', None)
+        if not options:
+            return None
+        return dict(DEFAULT_OPTIONS, **options)
+
+    @property
+    def enabled(self):
+        return self.options is not None
+
+    @property
+    def version_key(self):
+        return self.key_prefix + ':version'
+
+    @property
+    def bumped_key(self):
+        # When the version last moved on, in seconds since the epoch.
+        return self.key_prefix + ':bumped'
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def make_key(self, name, request):
+        """Return the cache key of the page requested."""
+        query = sorted(request.GET.lists())
+        digest = hashlib.sha1('\0'.join([
+            request.scheme, request.get_host(), request.path, repr(query),
+        ]).encode('utf-8')).hexdigest()
+        return '{0}:{1}:{2}'.format(self.key_prefix, name, digest)
+
+    def _start_version(self, cache):
+        # Starting from the clock rather than from 1 keeps a version
+        # stamp that was evicted from coming back with a value that
+        # cached pages were already rendered at.
+        cache.add(self.version_key, time.time_ns(), None)
+        return cache.get(self.version_key)
+
+    async def _astart_version(self, cache):
+        await cache.aadd(self.version_key, time.time_ns(), None)
+        return await cache.aget(self.version_key)
+
+    def bump(self, alias=None):
+        """Move the log version on, retiring every cached page."""
+        options = self.options
+        if options is None:
+            return
+        cache = caches[alias or options['ALIAS']]
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            self._start_version(cache)
+        cache.set(self.bumped_key, time.time(), None)
+
+    def bump_on_commit(self, using=None):
+        """Move the log version on once the current transaction on the
+        database commits, so that pages rendered before then can't be
+        stored under the new version.
+        """
+        options = self.options
+        if options is not None:
+            transaction.on_commit(
+                functools.partial(self.bump, options['ALIAS']), using=using)
+
+    def timeout(self, options, name):
+        return options['TIMEOUTS'].get(name, options['TIMEOUT'])
+
+    def may_store(self, request, bumped_at):
+        """Whether a page rendered for the request may be cached, which
+        it may not if it was read from a replica that might still lag
+        behind the last write.
+        """
+        return (bumped_at is None or replica_for(request) is None or
+                time.time() - bumped_at >= read_your_writes_seconds())
+
+    def serve(self, name, request, render):
+        """Return the cached response to the request, calling `render`
+        to create it when there is no fresh copy.
+        """
+        options = self.options
+        if (options is None or request.method not in ('GET', 'HEAD') or
+                wrote_recently(request)):
+            return render()
+        cache = caches[options['ALIAS']]
+        key = self.make_key(name, request)
+        found = cache.get_many([self.version_key, self.bumped_key, key])
+        version = found.get(self.version_key)
+        if version is None:
+            version = self._start_version(cache)
+        entry = found.get(key)
+        if self.is_fresh(entry, version):
+            self._count('hits')
+            return self.cached_response(request, entry)
+
+        lock_key = key + ':lock'
+        if cache.add(lock_key, 1, options['LOCK_TIMEOUT']):
+            try:
+                self._count('misses')
+                response = render_response(render())
+                entry = self.make_entry(version, response,
+                                        self.timeout(options, name))
+                if entry is not None and self.may_store(
+                        request, found.get(self.bumped_key)):
+                    # Kept past its freshness, to be served while it's
+                    # rendered again.
+                    cache.set(key, entry, self.timeout(options, name) +
+                              options['STALE_TIMEOUT'])
+                return response
+            finally:
+                cache.delete(lock_key)
+
+        # Another request is rendering the page.
+        if entry is not None:
+            self._count('stale_hits')
+            return self.cached_response(request, entry)
+        deadline = time.monotonic() + options['WAIT']
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None and entry[0] == version:
+                self._count('hits')
+                return self.cached_response(request, entry)
+        self._count('misses')
+        return render()
+
+    async def aserve(self, name, request, render):
+        """Return the cached response to the request, awaiting `render`
+        to create it when there is no fresh copy, as `serve` does.
+        """
+        options = self.options
+        if (options is None or request.method not in ('GET', 'HEAD') or
+                wrote_recently(request)):
+            return await render()
+        cache = caches[options['ALIAS']]
+        key = self.make_key(name, request)
+        found = await cache.aget_many([self.version_key, self.bumped_key,
+                                       key])
+        version = found.get(self.version_key)
+        if version is None:
+            version = await self._astart_version(cache)
+        entry = found.get(key)
+        if self.is_fresh(entry, version):
+            self._count('hits')
+            return self.cached_response(request, entry)
+
+        lock_key = key + ':lock'
+        if await cache.aadd(lock_key, 1, options['LOCK_TIMEOUT']):
+            try:
+                self._count('misses')
+                # Templates may still read lazy querysets.
+                response = await sync_to_async(render_response)(
+                    await render())
+                entry = self.make_entry(version, response,
+                                        self.timeout(options, name))
+                if entry is not None and self.may_store(
+                        request, found.get(self.bumped_key)):
+                    await cache.aset(key, entry, self.timeout(options, name) +
+                                     options['STALE_TIMEOUT'])
+                return response
+            finally:
+                await cache.adelete(lock_key)
+
+        if entry is not None:
+            self._count('stale_hits')
+            return self.cached_response(request, entry)
+        deadline = time.monotonic() + options['WAIT']
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            entry = await cache.aget(key)
+            if entry is not None and entry[0] == version:
+                self._count('hits')
+                return self.cached_response(request, entry)
+        self._count('misses')
+        return await render()
+
+    def is_fresh(self, entry, version):
+        return (entry is not None and entry[0] == version and
+                time.time() < entry[1])
+
+    def make_entry(self, version, response, timeout):
+        """Return the cache entry of a response rendered at the log
+        version, or None if the response isn't to be cached.
+        """
+        if (response.status_code != 200 or response.streaming or
+                response.cookies):
+            return None
+        return (version, time.time() + timeout, response.status_code,
+                list(response.items()), response.content)
+
+    def cached_response(self, request, entry):
+        """Rebuild a cached response, or answer a conditional request
+        with it.
+        """
+        headers = dict(entry[3])
+        response = HttpResponse(entry[4], status=entry[2])
+        for header, value in headers.items():
+            response[header] = value
+        last_modified = headers.get('Last-Modified')
+        return get_conditional_response(
+            request, etag=headers.get('ETag'),
+            last_modified=(parse_http_date_safe(last_modified)
+                           if last_modified else None),
+            response=response)
+
+    def get_stats(self):
+        """Return a copy of the hit and miss counters."""
+        with self._stats_lock:
+            return {
+                'hits': self.stats['hits'],
+                'stale_hits': self.stats['stale_hits'],
+                'misses': self.stats['misses'],
+            }
+
+    def clear(self):
+        """Reset the counters."""
+        with self._stats_lock:
+            self.stats.clear()
+
+
+page_cache = PageCache()
+
+
+def cache_page(name):
+    """Decorator serving a view through the page cache, with its
+    entries named `name` (which selects the view's timeout).
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                return await page_cache.aserve(
+                    name, request,
+                    lambda: view(request, *args, **kwargs))
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return page_cache.serve(
+                name, request,
+                lambda: view(request, *args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,242 @@
+"""Keyset (cursor) pagination for event querysets.
+
+Page number pagination needs a COUNT(*) of the whole queryset and an
+OFFSET scan that grows with the depth of the page. The CursorPaginator
+instead remembers the ordering key of the rows at the edges of a page
+and asks the database for the rows strictly after (or before) that key,
+so every page costs one indexed range query no matter how deep it is.
+"""
+import base64
+import binascii
+import datetime
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils import timezone
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class CursorPage(object):
+    """A single page of results returned by CursorPaginator."""
+
+    def __init__(self, object_list, paginator, cursor=None,
+                 next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<CursorPage {0}>'.format(self.cursor or 'first')
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator(object):
+    """Paginates a queryset on a composite ordering key.
+
+    `ordering` names the fields of the key, most significant first, all
+    sorted in the same direction (e.g. ('-entry_created', '-id')). The
+    last field must be unique so that the key identifies a single row.
+
+    Cursors are opaque URL-safe tokens. A cursor points either forwards
+    (the rows following a key), backwards (the rows preceding a key), or
+    at the final page of the ordering (LAST_CURSOR).
+    """
+
+    LAST_CURSOR = 'last'
+    FORWARD = 'n'
+    BACKWARD = 'p'
+    is_keyset = True
+
+    def __init__(self, object_list, per_page,
+                 ordering=('-entry_created', '-id')):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = tuple(field.lstrip('-') for field in self.ordering)
+        self.descending = self.ordering[0].startswith('-')
+
+    def _key(self, item):
+        if isinstance(item, dict):
+            return tuple(item[field] for field in self.fields)
+        return tuple(getattr(item, field) for field in self.fields)
+
+    def _serialize(self, value):
+        if isinstance(value, datetime.datetime):
+            return 'd' + value.isoformat()
+        if isinstance(value, uuid.UUID):
+            return 'u' + value.hex
+        if isinstance(value, int):
+            return 'i' + str(value)
+        return 's' + str(value)
+
+    def _deserialize(self, value):
+        kind, value = value[:1], value[1:]
+        if kind == 'd':
+            return datetime.datetime.fromisoformat(value)
+        if kind == 'u':
+            return uuid.UUID(value)
+        if kind == 'i':
+            return int(value)
+        if kind == 's':
+            return value
+        raise ValueError('Unknown cursor value type')
+
+    def encode_cursor(self, direction, key):
+        """Build an opaque cursor token from a direction and a key."""
+        raw = direction + '|'.join(self._serialize(value) for value in key)
+        token = base64.urlsafe_b64encode(raw.encode('utf-8'))
+        return token.decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Return the (direction, key) pair encoded in a cursor token.
+
+        Raises InvalidCursor if the token can't be decoded.
+        """
+        if cursor == self.LAST_CURSOR:
+            return self.BACKWARD, None
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            raw = base64.urlsafe_b64decode(cursor + padding).decode('utf-8')
+            direction, values = raw[:1], raw[1:].split('|')
+            if direction not in (self.FORWARD, self.BACKWARD):
+                raise ValueError('Unknown cursor direction')
+            if len(values) != len(self.fields):
+                raise ValueError('Wrong number of cursor values')
+            key = tuple(self._deserialize(value) for value in values)
+            key = self._check_key(key)
+        except (TypeError, ValueError, ValidationError, UnicodeDecodeError,
+                binascii.Error):
+            raise InvalidCursor('Invalid cursor.')
+        return direction, key
+
+    def _check_key(self, key):
+        """Convert the values of a decoded key with the model fields they
+        are compared to, so that a well-formed token carrying values of
+        the wrong type is rejected rather than failing in the query.
+        """
+        model = getattr(self.object_list, 'model', None)
+        if model is None:
+            return key
+        values = []
+        for name, value in zip(self.fields, key):
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                values.append(value)
+                continue
+            value = field.to_python(value)
+            if value is None:
+                raise ValueError('Missing cursor value')
+            if (isinstance(value, datetime.datetime) and settings.USE_TZ and
+                    timezone.is_naive(value)):
+                raise ValueError('Naive cursor datetime')
+            values.append(value)
+        return tuple(values)
+
+    def cursor_after(self, item):
+        """Return a cursor for the rows that follow the given item."""
+        return self.encode_cursor(self.FORWARD, self._key(item))
+
+    def _after(self, key, descending):
+        """Build a filter that selects the rows that follow `key` in a
+        scan sorted in the given direction.
+
+        The leading `field <= value` (or `>=`) term gives the database a
+        plain range on the first index column to seek to.
+        """
+        op = 'lt' if descending else 'gt'
+        query = Q()
+        for position in reversed(range(len(self.fields))):
+            field = self.fields[position]
+            condition = Q(**{'{0}__{1}'.format(field, op): key[position]})
+            if position < len(self.fields) - 1:
+                condition |= Q(**{field: key[position]}) & query
+            query = condition
+        first = self.fields[0]
+        bound = Q(**{'{0}__{1}e'.format(first, op): key[0]})
+        return bound & query
+
+    def _order_by(self, descending):
+        prefix = '-' if descending else ''
+        return [prefix + field for field in self.fields]
+
+    def _query(self, cursor):
+        """Return the direction and key of a cursor, and the query for
+        the rows of its page (plus one, to tell if there are more).
+        """
+        if cursor:
+            direction, key = self.decode_cursor(cursor)
+        else:
+            direction, key = self.FORWARD, None
+
+        descending = self.descending
+        if direction == self.BACKWARD:
+            descending = not descending
+
+        queryset = self.object_list.order_by(*self._order_by(descending))
+        if key is not None:
+            queryset = queryset.filter(self._after(key, descending))
+        return direction, key, queryset[:self.per_page + 1]
+
+    def _page(self, items, cursor, direction, key):
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+
+        if direction == self.BACKWARD:
+            items.reverse()
+            has_next = key is not None
+            has_previous = has_more
+        else:
+            has_next = has_more
+            has_previous = key is not None
+
+        next_cursor = previous_cursor = None
+        if items and has_next:
+            next_cursor = self.cursor_after(items[-1])
+        if items and has_previous:
+            previous_cursor = self.encode_cursor(
+                self.BACKWARD, self._key(items[0]))
+        return CursorPage(items, self, cursor=cursor or None,
+                          next_cursor=next_cursor,
+                          previous_cursor=previous_cursor)
+
+    def page(self, cursor=None):
+        """Return the CursorPage for the given cursor.
+
+        A cursor of None returns the first page.
+        """
+        direction, key, queryset = self._query(cursor)
+        return self._page(list(queryset), cursor, direction, key)
+
+    async def apage(self, cursor=None):
+        """Return the CursorPage for the given cursor, read with the
+        async ORM.
+        """
+        direction, key, queryset = self._query(cursor)
+        items = [item async for item in queryset]
+        return self._page(items, cursor, direction, key)
@@ -0,0 +1,130 @@
+"""Lightweight read-only event records for the hot read paths.
+
+Building an Event model instance for every row of a large feed page or
+export costs far more than reading the row. An EventRecord holds the
+same values in slots, is built straight from a `values_list` row, and
+offers the few model helpers the feeds, exports and serializers use, so
+either can be passed to them.
+
+    records = as_records(Event.objects.order_by('date'), ('id', 'title'))
+
+returns a queryset that can still be filtered, ordered, sliced and
+paginated, but yields EventRecord objects holding only the named fields.
+The name and email address of the reporting agent are read as the
+`contact_name` and `contact_email` fields, joined from the agent table.
+"""
+from django.db.models import F
+from django.db.models.query import ValuesListIterable
+from django.urls import reverse
+
+from .chained import ChainedQuerySet
+from .models import Event
+
+RECORD_FIELDS = ('id', 'title', 'detail', 'outcome', 'outcome_detail', 'date',
+                 'entry_created', 'entry_modified', 'contact_name',
+                 'contact_email')
+# The record fields read from the reporting agent of an event.
+AGENT_FIELDS = {'contact_name': 'agent__name', 'contact_email': 'agent__email'}
+OUTCOME_LABELS = dict(Event.OUTCOME_CHOICES)
+
+
+class EventRecord(object):
+    """A read-only event holding some or all of the fields of an Event.
+
+    Reading a field that the record was not built with raises
+    AttributeError.
+    """
+
+    __slots__ = RECORD_FIELDS + ('agent_id',)
+
+    def __init__(self, **values):
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_row(cls, fields, row):
+        """Build a record from the values of the named fields."""
+        record = cls.__new__(cls)
+        for name, value in zip(fields, row):
+            object.__setattr__(record, name, value)
+        return record
+
+    def __setattr__(self, name, value):
+        raise AttributeError('EventRecord is read-only.')
+
+    def __delattr__(self, name):
+        raise AttributeError('EventRecord is read-only.')
+
+    def _values(self):
+        return {name: getattr(self, name) for name in self.__slots__
+                if hasattr(self, name)}
+
+    def __reduce__(self):
+        return (_rebuild_record, (self._values(),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        # Records are immutable, so copies can share them.
+        return self
+
+    def __eq__(self, other):
+        if isinstance(other, (EventRecord, Event)):
+            return self.pk == other.pk
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __repr__(self):
+        return '<EventRecord: {0}>'.format(getattr(self, 'id', None))
+
+    def __str__(self):
+        return self.title
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_absolute_url(self):
+        return reverse('major-event-log:event_details', args=[self.id])
+
+    def is_success(self):
+        return self.outcome == Event.SUCCESS
+
+    def get_outcome_display(self):
+        return OUTCOME_LABELS.get(self.outcome, self.outcome)
+
+
+def _rebuild_record(values):
+    return EventRecord(**values)
+
+
+class EventRecordIterable(ValuesListIterable):
+    """Yields an EventRecord for each row of a values_list() queryset."""
+
+    def __iter__(self):
+        fields = self.queryset._fields
+        from_row = EventRecord.from_row
+        for row in super().__iter__():
+            yield from_row(fields, row)
+
+
+def with_agent_fields(queryset, fields):
+    """Annotate an Event queryset with the agent fields among the given
+    fields, so that they can be read with values() or values_list().
+    """
+    return queryset.annotate(**{name: F(AGENT_FIELDS[name])
+                                for name in fields if name in AGENT_FIELDS})
+
+
+def as_records(queryset, fields=RECORD_FIELDS):
+    """Return a copy of an Event queryset, or of a chain of event
+    querysets, that yields EventRecord objects holding the given fields.
+    """
+    if isinstance(queryset, ChainedQuerySet):
+        return queryset.map(as_records, fields)
+    queryset = with_agent_fields(queryset, fields).values_list(*fields)
+    queryset._iterable_class = EventRecordIterable
+    return queryset
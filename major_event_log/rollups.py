@@ -0,0 +1,134 @@
+"""Daily rollups of events for the statistics page.
+
+Each EventRollup row holds the number of events of one day with one
+outcome and one reporting agent. The signal receivers in signals.py
+move events between rows as they are created, changed and deleted
+(but not archived), so statistics over any period are sums over rollup
+rows, whose number grows with the days and agents in the log rather
+than with the events.
+"""
+import datetime
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .counts import add_to_count
+from .models import ArchivedEvent, Event, EventRollup
+
+OUTCOME_LABELS = dict(Event.OUTCOME_CHOICES)
+
+
+def event_day(event):
+    date = event.date
+    if timezone.is_aware(date):
+        date = timezone.localtime(date)
+    return date.date()
+
+
+def rollup_key(event):
+    """Return the (day, outcome, agent id) rollup of an event."""
+    return (event_day(event), event.outcome, event.agent_id)
+
+
+def apply_deltas(deltas, using=None):
+    """Add to the counts of rollups, creating the missing ones.
+
+    `deltas` maps rollup keys to the amounts to add.
+    """
+    rollups = EventRollup.objects.using(using)
+    for (day, outcome, agent_id), delta in deltas.items():
+        if delta:
+            add_to_count(rollups, delta, day=day, outcome=outcome,
+                         agent_id=agent_id)
+
+
+def roll_up(events, delta=1, using=None):
+    """Add delta to the rollups of each event."""
+    deltas = Counter()
+    for event in events:
+        deltas[rollup_key(event)] += delta
+    apply_deltas(deltas, using=using)
+
+
+def move_event(before, after, using=None):
+    """Move an event from the rollup of its old values to that of its
+    new values."""
+    deltas = Counter()
+    deltas[rollup_key(before)] -= 1
+    deltas[rollup_key(after)] += 1
+    apply_deltas(deltas, using=using)
+
+
+def rebuild_rollups(using=None, batch_size=1000):
+    """Recount every rollup from the events, archived events included.
+    Returns the number of rollups stored.
+    """
+    counts = Counter()
+    for model in (Event, ArchivedEvent):
+        rows = (model.objects.using(using).order_by()
+                .annotate(day=TruncDate('date'))
+                .values_list('day', 'outcome', 'agent_id')
+                .annotate(count=Count('id')))
+        for day, outcome, agent_id, count in rows:
+            counts[day, outcome, agent_id] += count
+    rollups = [EventRollup(day=day, outcome=outcome, agent_id=agent_id,
+                           count=count)
+               for (day, outcome, agent_id), count in counts.items()]
+    with transaction.atomic(using=using):
+        EventRollup.objects.using(using).all().delete()
+        EventRollup.objects.using(using).bulk_create(rollups,
+                                                     batch_size=batch_size)
+    return len(rollups)
+
+
+def get_stats(since=None, until=None, agents=20):
+    """Return the statistics of the events dated in [since, until), two
+    dates, read from the rollups.
+
+    The result holds the totals per outcome, the events and failures of
+    each month, and the events of the agents with the most events.
+    """
+    rollups = EventRollup.objects.filter(count__gt=0)
+    if since is not None:
+        rollups = rollups.filter(day__gte=since)
+    if until is not None:
+        rollups = rollups.filter(day__lt=until)
+    rollups = rollups.order_by()
+
+    outcomes = {label: 0 for label in OUTCOME_LABELS.values()}
+    for row in rollups.values('outcome').annotate(total=Sum('count')):
+        label = OUTCOME_LABELS.get(row['outcome'], row['outcome'])
+        outcomes[label] = row['total']
+
+    months = {}
+    monthly = (rollups.annotate(month=TruncMonth('day'))
+               .values('month', 'outcome').annotate(total=Sum('count')))
+    for row in monthly:
+        month = months.setdefault(row['month'], {
+            'month': row['month'].strftime('%Y-%m'),
+            'events': 0, 'failures': 0})
+        month['events'] += row['total']
+        if row['outcome'] == Event.FAILURE:
+            month['failures'] += row['total']
+
+    agent_rows = (rollups.values('agent_id', 'agent__name')
+                  .annotate(total=Sum('count'),
+                            failures=Sum('count',
+                                         filter=Q(outcome=Event.FAILURE)))
+                  .order_by('-total', 'agent__name', 'agent_id')[:agents])
+    return {
+        'total': sum(outcomes.values()),
+        'outcomes': outcomes,
+        'months': [months[month] for month in sorted(months)],
+        'agents': [{'id': row['agent_id'], 'name': row['agent__name'],
+                    'events': row['total'], 'failures': row['failures'] or 0}
+                   for row in agent_rows],
+    }
+
+
+def parse_day(value):
+    """Parse an ISO 8601 date. Raises ValueError if it is invalid."""
+    return datetime.date.fromisoformat(value)
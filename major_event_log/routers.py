@@ -0,0 +1,204 @@
+"""Routing the reads of the read-only views to a database replica.
+
+The index, agent and event pages, the feeds, the exports, OAI-PMH and
+the statistics only read from the database. When
+MAJOR_EVENT_LOG_REPLICA names a database alias, the `read_from_replica`
+decorator (applied to those views in urls.py and async_urls.py) sends
+their queries to that alias through the ReplicaRouter, which must be
+listed in DATABASE_ROUTERS:
+
+    DATABASE_ROUTERS = ['major_event_log.routers.ReplicaRouter']
+    MAJOR_EVENT_LOG_REPLICA = 'replica'
+
+Everything else, the admin and ingest included, reads from and writes to
+the default database as before.
+
+Replicas lag behind. So that editors see their own changes, the
+ReadYourWritesMiddleware gives a client that saved or deleted an event
+or agent a cookie, and requests carrying it read from the default
+database for MAJOR_EVENT_LOG_READ_YOUR_WRITES_SECONDS afterwards.
+"""
+import contextvars
+import functools
+import time
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+
+from .metrics import render_response
+
+APP_LABEL = 'major_event_log'
+READ_YOUR_WRITES_COOKIE = 'major_event_log_wrote'
+DEFAULT_READ_YOUR_WRITES_SECONDS = 30
+# The alias the app's models are read from in the current context, if
+# not the default database.
+_read_alias = contextvars.ContextVar('major_event_log_read_alias',
+                                     default=None)
+# Whether the request being handled in the current context wrote to the
+# app's models, as a one item list, when the middleware is installed.
+_wrote = contextvars.ContextVar('major_event_log_wrote', default=None)
+
+
+def get_replica_alias():
+    """Return the alias of the configured replica, or None."""
+    return getattr(settings, 'MAJOR_EVENT_LOG_REPLICA', None)
+
+
+def is_replica(alias):
+    return alias is not None and alias == get_replica_alias()
+
+
+def read_your_writes_seconds():
+    return getattr(settings, 'MAJOR_EVENT_LOG_READ_YOUR_WRITES_SECONDS',
+                   DEFAULT_READ_YOUR_WRITES_SECONDS)
+
+
+class ReplicaRouter(object):
+    """Reads the app's models from the replica within the views
+    decorated with `read_from_replica`.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == APP_LABEL:
+            return _read_alias.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the default database.
+        if (obj1._meta.app_label == APP_LABEL and
+                obj2._meta.app_label == APP_LABEL):
+            return True
+        return None
+
+
+def wrote_recently(request):
+    """Whether the client saved or deleted an event or agent within the
+    read-your-writes window.
+    """
+    try:
+        wrote_at = float(request.COOKIES[READ_YOUR_WRITES_COOKIE])
+    except (KeyError, ValueError):
+        return False
+    return time.time() - wrote_at < read_your_writes_seconds()
+
+
+def replica_for(request):
+    """Return the alias to read the request's data from, or None for
+    the default database.
+    """
+    alias = get_replica_alias()
+    if alias is None or wrote_recently(request):
+        return None
+    return alias
+
+
+def _iterate_on(alias, chunks):
+    """Yield the chunks of a streaming response, reading from alias."""
+    chunks = iter(chunks)
+    while True:
+        token = _read_alias.set(alias)
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        finally:
+            _read_alias.reset(token)
+        yield chunk
+
+
+def _finish(response, alias):
+    """Render the response while reading from alias, and read the rest
+    of a streaming response from it too.
+    """
+    response = render_response(response)
+    if response.streaming and not response.is_async:
+        response.streaming_content = _iterate_on(
+            alias, response.streaming_content)
+    return response
+
+
+def read_from_replica(view):
+    """Decorator sending the queries of a read-only view, including
+    those made while rendering or streaming its response, to the
+    replica.
+    """
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            alias = replica_for(request)
+            if alias is None:
+                return await view(request, *args, **kwargs)
+            token = _read_alias.set(alias)
+            try:
+                response = await view(request, *args, **kwargs)
+                return await sync_to_async(_finish)(response, alias)
+            finally:
+                _read_alias.reset(token)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        alias = replica_for(request)
+        if alias is None:
+            return view(request, *args, **kwargs)
+        token = _read_alias.set(alias)
+        try:
+            return _finish(view(request, *args, **kwargs), alias)
+        finally:
+            _read_alias.reset(token)
+    return wrapper
+
+
+def note_write():
+    """Note that the request being handled wrote to the app's models."""
+    wrote = _wrote.get()
+    if wrote is not None:
+        wrote[0] = True
+
+
+class ReadYourWritesMiddleware(object):
+    """Gives clients that saved or deleted an event or agent the cookie
+    that keeps their reads on the default database for a while.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        wrote = [False]
+        token = _wrote.set(wrote)
+        try:
+            response = self.get_response(request)
+        finally:
+            _wrote.reset(token)
+        return self.remember_write(response, wrote[0])
+
+    async def __acall__(self, request):
+        # A list, so that the writes of views run in a thread by
+        # sync_to_async (in a copy of the context) are seen too.
+        wrote = [False]
+        token = _wrote.set(wrote)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _wrote.reset(token)
+        return self.remember_write(response, wrote[0])
+
+    def remember_write(self, response, wrote):
+        if wrote:
+            seconds = read_your_writes_seconds()
+            response.set_cookie(READ_YOUR_WRITES_COOKIE, str(time.time()),
+                                max_age=seconds, httponly=True,
+                                samesite='Lax')
+        return response
@@ -0,0 +1,221 @@
+"""Full-text search over the title, detail and outcome detail of events.
+
+Searches go through a backend chosen for the database an event queryset
+is read from:
+
+- SQLite: an FTS5 table (FTS_TABLE) holding the text of every event,
+  kept up to date by the signal receivers in signals.py, and ranked
+  with bm25. Its rows are keyed by integer rowids, which an indexed
+  table (FTS_IDS_TABLE) maps to event ids, so replacing or removing
+  the rows of some events doesn't scan the whole index.
+- PostgreSQL: a GIN index on a tsvector expression over the columns
+  (created by migration 0009), ranked with ts_rank. Nothing needs to be
+  kept in sync.
+- Anything else, or SQLite without FTS5: case-insensitive substring
+  matches, newest first.
+
+MAJOR_EVENT_LOG_SEARCH_BACKEND may name a backend class to use instead.
+Searched querysets are annotated with `search_rank` and ordered by it,
+lowest (best) first.
+"""
+import re
+import uuid
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+SEARCH_FIELDS = ('title', 'detail', 'outcome_detail')
+FTS_TABLE = 'major_event_log_event_fts'
+FTS_IDS_TABLE = 'major_event_log_event_fts_ids'
+# The number of event ids in each statement deleting rows of FTS_TABLE,
+# below the limit of SQLite on the number of parameters.
+FTS_DELETE_BATCH_SIZE = 500
+# The text search configuration and document of the PostgreSQL backend.
+# The expression must stay identical to the one migration 0009 indexes.
+PG_CONFIG = 'english'
+PG_DOCUMENT = ("to_tsvector('english', coalesce(title, '') || ' ' || "
+               "coalesce(detail, '') || ' ' || coalesce(outcome_detail, ''))")
+# Whether each database alias has the FTS5 table.
+_fts_available = {}
+
+
+def search_terms(query):
+    """Split a search query into words."""
+    return re.findall(r'\w+', query)
+
+
+def _hex(event_id):
+    """Return an event id as stored in SQLite."""
+    if not isinstance(event_id, uuid.UUID):
+        event_id = uuid.UUID(str(event_id))
+    return event_id.hex
+
+
+class BasicSearchBackend(object):
+    """Matches every word of the query anywhere in the searched fields.
+
+    Needs no index and so scans the events table.
+    """
+
+    def __init__(self, using):
+        self.using = using
+
+    def search(self, queryset, query):
+        for term in search_terms(query):
+            condition = Q()
+            for field in SEARCH_FIELDS:
+                condition |= Q(**{field + '__icontains': term})
+            queryset = queryset.filter(condition)
+        return queryset.annotate(
+            search_rank=Value(0.0, output_field=FloatField()),
+        ).order_by('-entry_created', '-id')
+
+    def index_events(self, events, created=False):
+        pass
+
+    def remove_events(self, event_ids):
+        pass
+
+    def rebuild(self):
+        return None
+
+
+class SQLiteSearchBackend(BasicSearchBackend):
+    """Searches an FTS5 table with a row for each event."""
+
+    @classmethod
+    def is_available(cls, connection):
+        if connection.alias not in _fts_available:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND "
+                    "name = %s", [FTS_TABLE])
+                _fts_available[connection.alias] = (
+                    cursor.fetchone() is not None)
+        return _fts_available[connection.alias]
+
+    def match_expression(self, query):
+        # Quote every word, so that the query syntax of FTS5 doesn't
+        # apply to what users type.
+        return ' '.join('"{0}"'.format(term) for term in search_terms(query))
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        event_table = queryset.model._meta.db_table
+        # The ids of the matching events, selected once.
+        matches = RawSQL(
+            'SELECT "{1}"."event_id" FROM "{0}" JOIN "{1}" ON '
+            '"{0}"."rowid" = "{1}"."fts_rowid" WHERE "{0}" MATCH %s'.format(
+                FTS_TABLE, FTS_IDS_TABLE),
+            [match])
+        # The row of each matching event, looked up by rowid.
+        rank = RawSQL(
+            'SELECT "rank" FROM "{0}" WHERE "{0}" MATCH %s AND "rowid" = '
+            '(SELECT "fts_rowid" FROM "{1}" WHERE "event_id" = '
+            '"{2}"."id")'.format(FTS_TABLE, FTS_IDS_TABLE, event_table),
+            [match], output_field=FloatField())
+        return queryset.filter(id__in=matches).annotate(
+            # bm25 scores are negative, best match first.
+            search_rank=rank,
+        ).order_by('search_rank', '-entry_created', '-id')
+
+    def rows(self, events):
+        return [(event.title, event.detail, event.outcome_detail,
+                 _hex(event.pk)) for event in events]
+
+    def index_events(self, events, created=False):
+        """Index the text of events. Events that were just created have
+        no rows to replace.
+        """
+        events = list(events)
+        if not events:
+            return
+        if not created:
+            self.remove_events([event.pk for event in events])
+        connection = connections[self.using]
+        rows = self.rows(events)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO {0} (event_id) VALUES (%s)'.format(FTS_IDS_TABLE),
+                [row[-1:] for row in rows])
+            cursor.executemany(
+                'INSERT INTO {0} (rowid, title, detail, outcome_detail) '
+                'SELECT fts_rowid, %s, %s, %s FROM {1} '
+                'WHERE event_id = %s'.format(FTS_TABLE, FTS_IDS_TABLE),
+                rows)
+
+    def remove_events(self, event_ids):
+        ids = [_hex(event_id) for event_id in event_ids]
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            for start in range(0, len(ids), FTS_DELETE_BATCH_SIZE):
+                batch = ids[start:start + FTS_DELETE_BATCH_SIZE]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(
+                    'DELETE FROM {0} WHERE rowid IN (SELECT fts_rowid '
+                    'FROM {1} WHERE event_id IN ({2}))'.format(
+                        FTS_TABLE, FTS_IDS_TABLE, placeholders),
+                    batch)
+                cursor.execute(
+                    'DELETE FROM {0} WHERE event_id IN ({1})'.format(
+                        FTS_IDS_TABLE, placeholders),
+                    batch)
+
+    def rebuild(self):
+        from .models import Event
+
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {0}'.format(FTS_TABLE))
+            cursor.execute('DELETE FROM {0}'.format(FTS_IDS_TABLE))
+        events = Event.objects.using(self.using).only('id', *SEARCH_FIELDS)
+        batch = []
+        for event in events.iterator(chunk_size=2000):
+            batch.append(event)
+            if len(batch) == 2000:
+                self.index_events(batch, created=True)
+                batch = []
+        self.index_events(batch, created=True)
+        return events.count()
+
+
+class PostgreSQLSearchBackend(BasicSearchBackend):
+    """Searches the tsvector expression index of the events table."""
+
+    def search(self, queryset, query):
+        tsquery = "websearch_to_tsquery('{0}', %s)".format(PG_CONFIG)
+        return queryset.filter(
+            RawSQL('{0} @@ {1}'.format(PG_DOCUMENT, tsquery), [query],
+                   output_field=BooleanField()),
+        ).annotate(
+            # Negated so that, as with bm25, the best match sorts first.
+            search_rank=RawSQL('-ts_rank({0}, {1})'.format(PG_DOCUMENT,
+                                                           tsquery),
+                               [query], output_field=FloatField()),
+        ).order_by('search_rank', '-entry_created', '-id')
+
+
+def get_search_backend(using='default'):
+    """Return the search backend for a database alias."""
+    path = getattr(settings, 'MAJOR_EVENT_LOG_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)(using)
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return PostgreSQLSearchBackend(using)
+    if (connection.vendor == 'sqlite' and
+            SQLiteSearchBackend.is_available(connection)):
+        return SQLiteSearchBackend(using)
+    return BasicSearchBackend(using)
+
+
+def search_events(queryset, query):
+    """Return the events of the queryset matching the query, best
+    matches first. An empty query matches nothing.
+    """
+    if not search_terms(query):
+        return queryset.none()
+    return get_search_backend(queryset.db).search(queryset, query)
@@ -0,0 +1,127 @@
+"""Template-free serializers for the PREMIS and Atom records of events.
+
+These write the same documents as the `event_premis.xml` and
+`event_atom.xml` templates, but build them directly as a stream of
+escaped text chunks, which is much cheaper than going through the
+template engine. The chunk generators can be fed straight into a
+StreamingHttpResponse or a file to write many records in bulk.
+
+Anything with the attributes of an Event can be serialized.
+"""
+from xml.sax.saxutils import escape, quoteattr
+
+from django.utils import timezone
+
+PREMIS_NAMESPACE = 'info:lc/xmlns/premis-v2'
+ATOM_NAMESPACE = 'http://www.w3.org/2005/Atom'
+PREMIS_VERSION = '2.0'
+IDENTIFIER_TYPE = (
+    'http://purl.org/net/untl/vocabularies/identifier-qualifiers/#UUID')
+EVENT_TYPE = (
+    'http://purl.org/net/untl/vocabularies/preservationEvents/#majorEvent')
+AGENT_TYPE = 'Reporting Agent'
+AUTHOR_NAME = 'Major Event Log'
+AUTHOR_URI = 'http://digital2.library.unt.edu/name/nm0005293/'
+
+
+def format_datetime(value):
+    """Format a datetime like the templates' `date:'Y-m-d\\TH:i:s'`,
+    which displays aware values in the current time zone.
+    """
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def start_tag(name, attrs=None):
+    """Return the start tag of an element with the given attributes."""
+    if not attrs:
+        return '<{0}>'.format(name)
+    attributes = ''.join(
+        ' {0}={1}'.format(key, quoteattr(str(value)))
+        for key, value in attrs.items())
+    return '<{0}{1}>'.format(name, attributes)
+
+
+def end_tag(name):
+    return '</{0}>'.format(name)
+
+
+def text_element(name, text, attrs=None):
+    """Return an element holding the escaped text."""
+    return '{0}{1}{2}'.format(
+        start_tag(name, attrs), escape(str(text)), end_tag(name))
+
+
+def premis_event_chunks(event, declare_namespace=True):
+    """Yield the PREMIS event record of the event as text chunks.
+
+    Pass declare_namespace=False when the record is written inside an
+    element that already declares the `premis` prefix.
+    """
+    attrs = {'xmlns:premis': PREMIS_NAMESPACE} if declare_namespace else None
+    yield start_tag('premis:event', attrs)
+    yield start_tag('premis:eventIdentifier')
+    yield text_element('premis:eventIdentifierType', IDENTIFIER_TYPE)
+    yield text_element('premis:eventIdentifierValue', event.id)
+    yield end_tag('premis:eventIdentifier')
+    yield text_element('premis:eventType', EVENT_TYPE)
+    yield text_element('premis:eventDateTime', format_datetime(event.date))
+    yield text_element('premis:eventDetail', event.detail)
+    yield start_tag('premis:eventOutcomeInformation')
+    yield text_element('premis:eventOutcome', event.outcome)
+    yield start_tag('premis:eventOutcomeDetail')
+    yield text_element('premis:eventOutcomeDetailNote', event.outcome_detail)
+    yield end_tag('premis:eventOutcomeDetail')
+    yield end_tag('premis:eventOutcomeInformation')
+    yield start_tag('premis:linkingAgentIdentifier')
+    yield text_element('premis:linkingAgentIdentifierType', AGENT_TYPE)
+    yield text_element('premis:linkingAgentIdentifierValue',
+                       event.contact_name)
+    yield end_tag('premis:linkingAgentIdentifier')
+    yield end_tag('premis:event')
+
+
+def premis_container_chunks(events):
+    """Yield a `premis:premis` document holding every event given.
+
+    The events are consumed lazily, one record at a time.
+    """
+    yield "<?xml version='1.0' encoding='utf-8'?>\n"
+    yield start_tag('premis:premis', {'xmlns:premis': PREMIS_NAMESPACE,
+                                      'version': PREMIS_VERSION})
+    yield '\n'
+    for event in events:
+        yield ''.join(premis_event_chunks(event, declare_namespace=False))
+        yield '\n'
+    yield end_tag('premis:premis')
+    yield '\n'
+
+
+def atom_entry_chunks(event, event_details_url):
+    """Yield the Atom entry of the event as text chunks."""
+    yield start_tag('entry', {'xmlns': ATOM_NAMESPACE})
+    yield text_element('title', event.id)
+    yield text_element('id', event_details_url)
+    yield text_element('updated',
+                       format_datetime(event.entry_modified) + 'Z')
+    yield start_tag('author')
+    yield text_element('name', AUTHOR_NAME)
+    yield text_element('uri', AUTHOR_URI)
+    yield end_tag('author')
+    yield '<link href={0} rel="alternate"/>'.format(
+        quoteattr(event_details_url))
+    yield start_tag('content', {'type': 'application/xml'})
+    yield from premis_event_chunks(event)
+    yield end_tag('content')
+    yield end_tag('entry')
+
+
+def serialize_premis(event):
+    """Return the PREMIS event record of the event as UTF-8 bytes."""
+    return ''.join(premis_event_chunks(event)).encode('utf-8')
+
+
+def serialize_atom(event, event_details_url):
+    """Return the Atom entry of the event as UTF-8 bytes."""
+    return ''.join(atom_entry_chunks(event, event_details_url)).encode('utf-8')
@@ -0,0 +1,182 @@
+"""Signal receivers that keep derived data in step with events."""
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .cache import render_cache
+from .counts import TOTAL_COUNTER, adjust_counter
+from . import facets, rollups
+from .facets import event_facets
+from .models import Agent, ArchivedEvent, Event
+from .pagecache import page_cache
+from .routers import note_write
+from .records import EventRecord
+from .search import get_search_backend
+
+# Sent with the list of `events` after they are created in bulk, which
+# bypasses the post_save signal.
+events_created = Signal()
+# Sent with the list of `events` moved to the archive (see archive.py),
+# within the transaction that moved them. The events stay counted in the
+# rollups, so nothing listens to it in rollups.py.
+events_archived = Signal()
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def invalidate_rendered_records(sender, instance, **kwargs):
+    """Drop the cached PREMIS and Atom records of a changed event."""
+    render_cache.invalidate(instance.pk)
+
+
+@receiver(pre_save, sender=Agent)
+def remember_agent_contact(sender, instance, raw, using, **kwargs):
+    """Note the name and email address of an existing agent before it
+    is saved.
+    """
+    instance._contact_before = None
+    if instance._state.adding or raw:
+        return
+    instance._contact_before = Agent.objects.using(using).filter(
+        pk=instance.pk).values_list('name', 'email').first()
+
+
+@receiver(post_save, sender=Agent)
+def touch_events_of_renamed_agent(sender, instance, using, **kwargs):
+    """Mark the events of an agent whose name or email address changed
+    as modified, since their records show them. This changes their
+    validators and render cache keys, and puts them in the changes feed.
+    """
+    before = getattr(instance, '_contact_before', None)
+    if before is None or before == (instance.name, instance.email):
+        return
+    now = timezone.now()
+    for model in (Event, ArchivedEvent):
+        model.objects.using(using).filter(agent=instance).update(
+            entry_modified=now)
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=Agent)
+@receiver(post_delete, sender=Agent)
+def retire_cached_pages(sender, using, **kwargs):
+    """Move the log version on, retiring the cached listing pages."""
+    page_cache.bump_on_commit(using=using)
+
+
+@receiver(events_created, sender=Event)
+@receiver(events_archived, sender=Event)
+def retire_cached_pages_in_bulk(sender, using=None, **kwargs):
+    page_cache.bump_on_commit(using=using)
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=Agent)
+@receiver(post_delete, sender=Agent)
+@receiver(events_created, sender=Event)
+@receiver(events_archived, sender=Event)
+def remember_write(sender, **kwargs):
+    """Keep the reads of the writing client on the default database."""
+    note_write()
+
+
+@receiver(post_save, sender=Event)
+def count_saved_event(sender, instance, created, using, **kwargs):
+    if created:
+        adjust_counter(TOTAL_COUNTER, 1, using=using)
+
+
+@receiver(post_delete, sender=Event)
+def count_deleted_event(sender, instance, using, **kwargs):
+    adjust_counter(TOTAL_COUNTER, -1, using=using)
+
+
+@receiver(events_created, sender=Event)
+def count_created_events(sender, events, using=None, **kwargs):
+    adjust_counter(TOTAL_COUNTER, len(events), using=using)
+
+
+@receiver(events_archived, sender=Event)
+def count_archived_events(sender, events, using=None, **kwargs):
+    adjust_counter(TOTAL_COUNTER, -len(events), using=using)
+
+
+@receiver(post_save, sender=Event)
+def index_saved_event(sender, instance, created, using, **kwargs):
+    get_search_backend(using).index_events([instance], created=created)
+
+
+@receiver(post_delete, sender=Event)
+def unindex_deleted_event(sender, instance, using, **kwargs):
+    get_search_backend(using).remove_events([instance.pk])
+
+
+@receiver(events_created, sender=Event)
+def index_created_events(sender, events, using=None, **kwargs):
+    get_search_backend(using or 'default').index_events(events,
+                                                        created=True)
+
+
+@receiver(events_archived, sender=Event)
+def unindex_archived_events(sender, events, using=None, **kwargs):
+    get_search_backend(using or 'default').remove_events(
+        [event.pk for event in events])
+
+
+@receiver(pre_save, sender=Event)
+def remember_counted_values(sender, instance, raw, using, **kwargs):
+    """Note the values an existing event is counted under (in the facet
+    counts and rollups) before it is saved.
+    """
+    instance._counted_before = None
+    if instance._state.adding or raw:
+        return
+    row = Event.objects.using(using).filter(pk=instance.pk).values(
+        'outcome', 'date', 'agent_id').first()
+    if row is not None:
+        instance._counted_before = EventRecord(**row)
+
+
+@receiver(post_save, sender=Event)
+def count_saved_facets(sender, instance, created, using, **kwargs):
+    before = getattr(instance, '_counted_before', None)
+    if before is not None:
+        facets.move_event(event_facets(before), instance, using=using)
+    elif created:
+        facets.count_events([instance], using=using)
+
+
+@receiver(post_delete, sender=Event)
+def count_deleted_facets(sender, instance, using, **kwargs):
+    facets.count_events([instance], delta=-1, using=using)
+
+
+@receiver(events_created, sender=Event)
+def count_created_facets(sender, events, using=None, **kwargs):
+    facets.count_events(events, using=using)
+
+
+@receiver(events_archived, sender=Event)
+def count_archived_facets(sender, events, using=None, **kwargs):
+    facets.count_events(events, delta=-1, using=using)
+
+
+@receiver(post_save, sender=Event)
+def roll_up_saved_event(sender, instance, created, using, **kwargs):
+    before = getattr(instance, '_counted_before', None)
+    if before is not None:
+        rollups.move_event(before, instance, using=using)
+    elif created:
+        rollups.roll_up([instance], using=using)
+
+
+@receiver(post_delete, sender=Event)
+def roll_up_deleted_event(sender, instance, using, **kwargs):
+    rollups.roll_up([instance], delta=-1, using=using)
+
+
+@receiver(events_created, sender=Event)
+def roll_up_created_events(sender, events, using=None, **kwargs):
+    rollups.roll_up(events, using=using)
@@ -0,0 +1,391 @@
+"""Rendering the public pages to static files.
+
+`build_static_site` writes the index, the Atom feed, the about page and
+the details, Atom and PREMIS records of every event (archived events
+included) to a directory that a web server such as nginx can serve
+without calling Django. The pages are rendered by the app's own views
+and templates, from requests made with a RequestFactory for the site's
+base URL.
+
+Builds are incremental. A manifest in the output directory records a
+signature of every page: the entry_modified value of each event, and
+the ids and entry_modified values of the events listed on each index
+and feed page (plus the facet counts of the index sidebar), and a hash
+of the about page. Later builds only render the pages whose signature
+changed and delete the files of the pages that are gone.
+
+So that adding events doesn't move every event to another page, the
+static index and feed pages are cut from the oldest event: each page
+beyond the first holds `per_page` events that stay together as newer
+events arrive. The first page holds the rest, between `per_page` and
+twice that many of the newest events. Page links are cursor links that
+the live views serve as well, so pages missing from the build (or asked
+for with other query parameters) can be passed on to Django.
+
+Pages are rendered in parallel by a pool of processes, each with its
+own database connections. With one worker they are rendered in the
+current process.
+"""
+import json
+import os
+import tempfile
+import urllib.parse
+
+from django.contrib.syndication.views import Feed
+from django.db import connections
+from django.http import QueryDict
+from django.test import RequestFactory
+from django.urls import reverse
+
+from . import views
+from .conditional import make_etag
+from .facets import facet_sidebar
+from .feeds import LatestEventsFeed
+from .metrics import render_response
+from .models import ArchivedEvent, Event
+from .pagination import CursorPaginator
+
+MANIFEST_NAME = '.major-event-log-manifest.json'
+MANIFEST_VERSION = 1
+# The order the static index and feed pages are cut in, oldest first.
+LISTING_ORDERING = ('entry_created', 'id')
+# The number of rows read from the database at a time while planning.
+PLAN_CHUNK_SIZE = 2000
+# The builder of the current worker process.
+_worker_site = None
+
+
+class StaticEventList(views.EventList):
+    """The index, showing a page planned by `plan_pages`."""
+
+    static_page = None
+
+    def has_numbered_pages(self):
+        return False
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = CursorPaginator(queryset, self.static_page['per_page'])
+        page = static_page(paginator, self.static_page)
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
+class StaticEventsFeed(LatestEventsFeed):
+    """The Atom feed, showing a page planned by `plan_pages`."""
+
+    def __init__(self, spec):
+        self.static_page = spec
+
+    def has_numbered_pages(self, request):
+        return False
+
+    def get_paginator(self, request, items):
+        paginator = CursorPaginator(items, self.static_page['per_page'],
+                                    ordering=self.cursor_ordering)
+        return paginator, self.static_page['cursor']
+
+    def get_current_page(self):
+        if getattr(self, '_current_page', None) is None:
+            self._current_page = static_page(self.paginator,
+                                             self.static_page)
+        return self._current_page
+
+
+def static_page(paginator, spec):
+    """Return the page of a plan, linked to its neighbours in the plan.
+
+    A previous cursor of '' links to the first page.
+    """
+    page = paginator.page(spec['cursor'])
+    page.previous_cursor = spec['previous']
+    page.next_cursor = spec['next']
+    return page
+
+
+def plan_pages(rows, per_page):
+    """Cut the events into pages from the oldest one.
+
+    `rows` is an iterable of the (entry_created, id, entry_modified)
+    values of the events, oldest first, which is read once while at most
+    three pages of rows are held. Yields a (cursor, spec, rows) triple
+    for each page, with a cursor of None for the first page and
+    LAST_CURSOR for the copy of the oldest page that the Last links
+    point at.
+    """
+    paginator = CursorPaginator(None, per_page)
+
+    def cursor_before(row):
+        # The page of the events older than row.
+        return paginator.encode_cursor(paginator.FORWARD, row[:2])
+
+    # The rows from the start of the next block on.
+    buffer = []
+    block = 0
+
+    def cut_block(previous):
+        # A block is only cut once the rows show that it isn't the
+        # oldest part of the first page.
+        block_rows = buffer[:per_page]
+        spec = {
+            'cursor': cursor_before(buffer[per_page]),
+            'per_page': per_page,
+            'previous': previous,
+            'next': cursor_before(buffer[0]) if block else None,
+        }
+        yield spec['cursor'], spec, block_rows
+        if block == 0:
+            yield paginator.LAST_CURSOR, dict(
+                spec, cursor=paginator.LAST_CURSOR), block_rows
+        del buffer[:per_page]
+
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) == 3 * per_page:
+            yield from cut_block(cursor_before(buffer[2 * per_page]))
+            block += 1
+    if len(buffer) >= 2 * per_page:
+        yield from cut_block('')
+        block += 1
+    yield None, {
+        'cursor': None,
+        'per_page': max(len(buffer), per_page),
+        'previous': None,
+        'next': cursor_before(buffer[0]) if block else None,
+    }, buffer
+
+
+class StaticSite(object):
+    """Renders the public pages to files below a root directory."""
+
+    def __init__(self, root, base_url):
+        self.root = root
+        self.base_url = base_url
+        parts = urllib.parse.urlsplit(base_url)
+        self.factory = RequestFactory(HTTP_HOST=parts.netloc)
+        self.secure = parts.scheme == 'https'
+
+    def request(self, path, cursor=None):
+        return self.factory.get(path, {'cursor': cursor} if cursor else {},
+                                secure=self.secure)
+
+    def file_path(self, path, cursor=None, extension='.html'):
+        """Return the file, relative to the root, serving a URL path
+        and cursor.
+        """
+        path = path.lstrip('/')
+        if not path or path.endswith('/'):
+            name = 'cursor-' + cursor if cursor else 'index'
+            path += name + extension
+        return path
+
+    def write(self, path, response):
+        """Write a response to a file atomically, returning the file's
+        path, or None if the response is an error.
+        """
+        response = render_response(response)
+        if response.status_code != 200:
+            return None
+        full_path = os.path.join(self.root, path)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as stream:
+                stream.write(response.content)
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, full_path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+        return path
+
+    def render_event(self, event_id):
+        pages = [
+            ('event_details', views.event_details, '.html'),
+            ('event_atom', views.event_atom, '.xml'),
+            ('event_premis', views.event_premis, '.xml'),
+        ]
+        files = []
+        for name, view, extension in pages:
+            path = reverse('major-event-log:' + name, args=[event_id])
+            files.append(self.write(self.file_path(path, extension=extension),
+                                    view(self.request(path), event_id)))
+        return files
+
+    def render_index(self, spec):
+        path = reverse('major-event-log:index')
+        response = StaticEventList.as_view(static_page=spec)(
+            self.request(path, spec['cursor']))
+        return [self.write(self.file_path(path, spec['cursor']), response)]
+
+    def render_feed(self, spec):
+        path = str(LatestEventsFeed.link)
+        request = self.request(path, spec['cursor'])
+        # Rendered unconditionally, without ConditionalFeedMixin.
+        response = Feed.__call__(StaticEventsFeed(spec), request)
+        return [self.write(self.file_path(path, spec['cursor'], '.xml'),
+                           response)]
+
+    def render_about(self, spec):
+        path = reverse('major-event-log:about')
+        return [self.write(self.file_path(path),
+                           views.about(self.request(path)))]
+
+    def render(self, job):
+        """Render the page of a job, returning its key and the files
+        written, or None if the page no longer exists.
+        """
+        key, kind, argument = job
+        files = getattr(self, 'render_' + kind)(argument)
+        if None in files:
+            self.remove([path for path in files if path])
+            return key, None
+        return key, files
+
+    def plan(self):
+        """Yield the key, signature and job of every page, reading the
+        events in chunks.
+        """
+        # The about page reads nothing from the database, so it is
+        # rendered to tell whether its templates changed.
+        path = reverse('major-event-log:about')
+        about = render_response(views.about(self.request(path)))
+        yield 'about', make_etag(about.content), ('about', 'about', None)
+        for model in (Event, ArchivedEvent):
+            rows = model.objects.values_list('id', 'entry_modified')
+            for event_id, modified in rows.iterator(
+                    chunk_size=PLAN_CHUNK_SIZE):
+                key = 'event:{0}'.format(event_id)
+                yield key, modified.isoformat(), (key, 'event', str(event_id))
+
+        sidebar = repr(facet_sidebar(QueryDict()))
+        for kind, per_page in (('index', StaticEventList.paginate_by),
+                               ('feed', LatestEventsFeed.items_per_page)):
+            rows = Event.objects.order_by(*LISTING_ORDERING).values_list(
+                'entry_created', 'id', 'entry_modified')
+            pages = plan_pages(rows.iterator(chunk_size=PLAN_CHUNK_SIZE),
+                               per_page)
+            for cursor, spec, page_rows in pages:
+                key = '{0}:{1}'.format(kind, cursor or '')
+                parts = [spec[name] for name in sorted(spec)]
+                if kind == 'index':
+                    # Every index page shows the facet counts.
+                    parts.append(sidebar)
+                parts += [part for row in page_rows for part in row[1:]]
+                yield key, make_etag(*parts), (key, kind, spec)
+
+    def remove(self, files):
+        for path in files:
+            full_path = os.path.join(self.root, path)
+            if os.path.exists(full_path):
+                os.remove(full_path)
+            directory = os.path.dirname(full_path)
+            if directory != self.root and not os.listdir(directory):
+                os.rmdir(directory)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, MANIFEST_NAME)
+
+    def options(self):
+        return {
+            'version': MANIFEST_VERSION,
+            'base_url': self.base_url,
+            'index_per_page': StaticEventList.paginate_by,
+            'feed_per_page': LatestEventsFeed.items_per_page,
+        }
+
+    def read_manifest(self):
+        """Return the pages of the previous build, unless it was made
+        with other options.
+        """
+        try:
+            with open(self.manifest_path) as stream:
+                manifest = json.load(stream)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('options') != self.options():
+            return {}
+        return manifest.get('pages', {})
+
+    def write_manifest(self, pages):
+        handle, temporary = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(handle, 'w') as stream:
+            json.dump({'options': self.options(), 'pages': pages}, stream,
+                      sort_keys=True)
+        os.replace(temporary, self.manifest_path)
+
+
+def _start_worker(root, base_url):
+    global _worker_site
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        # Started without fork, with the settings of the environment.
+        django.setup()
+    _worker_site = StaticSite(root, base_url)
+
+
+def _render(job):
+    return _worker_site.render(job)
+
+
+def render_jobs(site, jobs, workers):
+    """Yield the result of rendering each job, in a pool of `workers`
+    processes, or in this process if `workers` is 1.
+    """
+    if workers == 1 or len(jobs) < 2:
+        yield from map(site.render, jobs)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+
+    # The workers open their own connections, rather than sharing
+    # those of this process.
+    connections.close_all()
+    chunksize = max(1, min(100, len(jobs) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker,
+                             initargs=(site.root, site.base_url)) as pool:
+        yield from pool.map(_render, jobs, chunksize=chunksize)
+
+
+def build_static_site(root, base_url, workers=None, full=False):
+    """Render the public pages below root for the site at base_url.
+
+    Only the pages that changed since the last build are rendered,
+    unless `full` is true. Returns a dictionary with the number of
+    pages rendered, unchanged and removed.
+    """
+    root = os.path.abspath(root)
+    os.makedirs(root, exist_ok=True)
+    site = StaticSite(root, base_url)
+    previous = {} if full else site.read_manifest()
+
+    # The pages kept from the previous build, and the signatures of
+    # those to render, compared as the plan is read.
+    pages = {}
+    signatures = {}
+    jobs = []
+    for key, signature, job in site.plan():
+        entry = previous.get(key)
+        if entry is not None and entry['signature'] == signature:
+            pages[key] = entry
+        else:
+            signatures[key] = signature
+            jobs.append(job)
+    result = {'rendered': 0, 'unchanged': len(pages), 'removed': 0}
+
+    for key, files in render_jobs(site, jobs, workers or os.cpu_count() or 1):
+        old_files = previous.get(key, {}).get('files', [])
+        site.remove(set(old_files) - set(files or []))
+        if files is None:
+            result['removed'] += 1
+            continue
+        pages[key] = {'signature': signatures[key], 'files': files}
+        result['rendered'] += 1
+
+    for key, entry in previous.items():
+        if key not in pages and key not in signatures:
+            site.remove(entry['files'])
+            result['removed'] += 1
+    site.write_manifest(pages)
+    return result
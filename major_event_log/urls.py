@@ -7,11 +7,15 @@ from django.urls import path
 
 from . import views
 from . import feeds
+from . import oai
+from .pagecache import cache_page
+from .routers import read_from_replica
 
 
 urlpatterns = [
     # Matches root index of app ('/').
-    path('', views.EventList.as_view(), name='index'),
+    path('', cache_page('index')(
+        read_from_replica(views.EventList.as_view())), name='index'),
     # Matches urls like 'event/123a-4b56c-78d.premis.xml'.
     path('event/<slug:event_id>.premis.xml',
          views.event_premis, name='event_premis'),
@@ -21,8 +25,29 @@ urlpatterns = [
     # Matches URLs like 'event/123a-4b56c-78d/'.
     path('event/<slug:event_id>/', views.event_details,
          name='event_details'),
+    # Matches URLs like 'agent/12/'.
+    path('agent/<int:agent_id>/',
+         read_from_replica(views.AgentEventList.as_view()),
+         name='agent_events'),
+    # Matches 'events.premis.xml'.
+    path('events.premis.xml', views.premis_export, name='premis_export'),
     # Matches 'feed/'.
-    path('feed/', feeds.LatestEventsFeed(), name='feed'),
+    path('feed/', cache_page('feed')(
+        read_from_replica(feeds.LatestEventsFeed())), name='feed'),
+    # Matches 'changes/'.
+    path('changes/', read_from_replica(feeds.EventChangesFeed()), name='changes'),
+    # Matches 'changes.jsonl'.
+    path('changes.jsonl', views.changes_jsonl, name='changes_jsonl'),
+    # Matches 'ingest/'.
+    path('ingest/', views.ingest_events, name='ingest'),
+    # Matches 'oai/'.
+    path('oai/', oai.oai_pmh, name='oai'),
+    # Matches 'stats/'.
+    path('stats/', views.stats, name='stats'),
+    # Matches 'stats.json'.
+    path('stats.json', views.stats_json, name='stats_json'),
+    # Matches 'metrics/'.
+    path('metrics/', views.metrics, name='metrics'),
     # Matches 'about/'.
     path('about/', views.about, name='about'),
 ]
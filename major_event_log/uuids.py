@@ -0,0 +1,53 @@
+"""Event identifiers.
+
+Version 4 UUIDs are random, so each new event lands on a random leaf of
+the primary key index. Version 7 UUIDs (RFC 9562) start with a
+millisecond Unix timestamp, so new events are appended to the end of the
+index instead, which keeps it compact and makes inserts cheaper. They
+are ordinary UUIDs and are stored and looked up like any other.
+
+New events get version 7 identifiers when MAJOR_EVENT_LOG_UUID_VERSION
+is set to 7. The default is 4.
+"""
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_last_timestamp = 0
+_last_sequence = 0
+
+
+def uuid7():
+    """Return a version 7 UUID.
+
+    Identifiers made by one process increase strictly: within a
+    millisecond the 12 bit `rand_a` field is used as a counter (RFC 9562
+    method 1), and the clock is advanced if it overflows or goes back.
+    """
+    global _last_timestamp, _last_sequence
+    with _lock:
+        timestamp = time.time_ns() // 1000000
+        if timestamp > _last_timestamp:
+            sequence = int.from_bytes(os.urandom(2), 'big') & 0x7ff
+        else:
+            timestamp = _last_timestamp
+            sequence = _last_sequence + 1
+            if sequence > 0xfff:
+                timestamp += 1
+                sequence = 0
+        _last_timestamp, _last_sequence = timestamp, sequence
+    rand_b = int.from_bytes(os.urandom(8), 'big') & 0x3fffffffffffffff
+    value = ((timestamp & 0xffffffffffff) << 80 | 0x7 << 76 | sequence << 64 |
+             0x2 << 62 | rand_b)
+    return uuid.UUID(int=value)
+
+
+def event_id():
+    """Return a new event identifier of the configured UUID version."""
+    if getattr(settings, 'MAJOR_EVENT_LOG_UUID_VERSION', 4) == 7:
+        return uuid7()
+    return uuid.uuid4()
@@ -3,13 +3,45 @@
 These views will render the appropriate web pages based on
 templates defined in the 'templates/major-event-log' directory.
 """
+import hmac
 import uuid
 
+from django.conf import settings
+from django.core.exceptions import BadRequest
 from django.shortcuts import render, get_object_or_404
-from django.http import Http404
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         JsonResponse, StreamingHttpResponse)
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.views.generic import ListView
 
-from .models import Event
+from .cache import render_cache
+from .chained import all_events
+from .conditional import event_condition, get_event_modified
+from .changes import (TOKEN_FIELD, changes_paginator, resume_token,
+                      settled_changes)
+from .counts import CountingPaginator
+from .export import (EXPORT_FIELDS, encode_chunks, gzip_chunks, json_line,
+                     modified_events, parse_timestamp, premis_export_chunks)
+from .facets import (FILTER_PARAMS, facet_sidebar, facet_url, filter_events,
+                     parse_filters)
+from .ingest import (DEFAULT_BATCH_SIZE, PREMIS_DEFAULT_FIELDS, IngestConflict,
+                     IngestError, build_events, check_idempotency_key,
+                     load_events, parse_jsonl, parse_premis)
+from .metrics import registry, rendering
+from .models import Agent, ArchivedEvent, Event
+from .pagination import CursorPaginator, InvalidCursor
+from .records import with_agent_fields
+from .routers import read_from_replica
+from .rollups import get_stats, parse_day
+from .search import search_events
+from .serializers import serialize_atom, serialize_premis
+
+# Default and maximum number of changes returned by changes_jsonl.
+CHANGES_LIMIT = 1000
+CHANGES_MAX_LIMIT = 10000
 
 
 def get_event_or_404(event_id):
@@ -20,46 +52,354 @@ def get_event_or_404(event_id):
     valid UUID, then the get_object_or_404 function is called to check
     that the valid UUID actually refers to an event that has already
     been created in the db. If either of these checks fail, then an
-    HTTP 404 response is sent.
+    HTTP 404 response is sent. The reporting agent is read along with
+    the event. Events moved to the archive are looked up there.
     """
     try:
         uuid.UUID(event_id)
     except ValueError:
         raise Http404('Invalid event ID')
-    return get_object_or_404(Event.objects, id=event_id)
+    try:
+        return Event.objects.select_related('agent').get(id=event_id)
+    except Event.DoesNotExist:
+        return get_object_or_404(ArchivedEvent.objects.select_related('agent'),
+                                 id=event_id)
 
 
-class EventList(ListView):
-    template_name = 'major-event-log/index.html'
-    queryset = Event.objects.order_by('-entry_created')
+class CursorListView(ListView):
+    """Lists events newest first, a page at a time."""
+    # Only the columns the listings display, plus the pagination key;
+    # the detail fields can be large and are never shown here.
+    queryset = Event.objects.only(
+        'id', 'title', 'date', 'outcome', 'entry_created',
+    ).order_by('-entry_created', '-id')
     context_object_name = 'events'
     paginate_by = 10
+    paginator_class = CountingPaginator
+    cursor_kwarg = 'cursor'
+
+    def has_numbered_pages(self):
+        """Whether to paginate by page number instead of by cursor."""
+        return self.page_kwarg in self.request.GET
+
+    def paginate_queryset(self, queryset, page_size):
+        """Paginate the queryset by cursor unless a page number is given.
+
+        Requests carrying the `page` parameter keep the numbered pages
+        (and their COUNT/OFFSET queries) for existing links; all other
+        requests are served with keyset pagination.
+        """
+        if self.has_numbered_pages():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise BadRequest('Invalid cursor.')
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context.get('page_obj')
+        if page is not None and not getattr(page.paginator, 'is_keyset',
+                                            False):
+            # Links to the pages around the current one and at either
+            # end, rather than to every page of the log.
+            context['page_range'] = page.paginator.get_elided_page_range(
+                page.number)
+        # The other query parameters, to carry over to the page links.
+        params = self.request.GET.copy()
+        for name in (self.page_kwarg, self.cursor_kwarg):
+            params.pop(name, None)
+        context['extra_query'] = '&' + params.urlencode() if params else ''
+        return context
+
+
+class EventList(CursorListView):
+    template_name = 'major-event-log/index.html'
+    search_kwarg = 'q'
+
+    def get_search_query(self):
+        return self.request.GET.get(self.search_kwarg, '').strip()
+
+    def get_filters(self):
+        """Return the facet filters of the request, memoized."""
+        if not hasattr(self, '_filters'):
+            try:
+                self._filters = parse_filters(self.request.GET)
+            except ValueError as error:
+                raise BadRequest(str(error))
+        return self._filters
+
+    def get_facets(self):
+        return facet_sidebar(self.request.GET)
+
+    def get_queryset(self):
+        queryset = filter_events(super().get_queryset(), self.get_filters())
+        query = self.get_search_query()
+        if query:
+            queryset = search_events(queryset, query)
+        return queryset
+
+    def has_numbered_pages(self):
+        # Search results are ordered by rank, and so always numbered.
+        return super().has_numbered_pages() or bool(self.get_search_query())
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.get_search_query()
+        context['filters'] = self.get_filters()
+        context['filter_params'] = FILTER_PARAMS
+        context['facets'] = self.get_facets()
+        context['clear_filters_url'] = facet_url(
+            self.request.GET, **{name: None for name in FILTER_PARAMS})
+        return context
 
+
+class AgentEventList(CursorListView):
+    """Lists the events reported by one agent, read by the agent's key
+    through the event_agent_created_id_idx index.
+    """
+    template_name = 'major-event-log/agent_events.html'
+
+    def get(self, request, *args, **kwargs):
+        self.agent = get_object_or_404(Agent, pk=kwargs['agent_id'])
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return super().get_queryset().filter(agent=self.agent)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['agent'] = self.agent
+        return context
+
+
+@read_from_replica
+@event_condition
 def event_details(request, event_id):
     """Loads the event details page of the event with the given ID."""
     event = get_event_or_404(event_id)
     context = {'event': event}
-    return render(request, 'major-event-log/event_details.html', context)
+    with rendering():
+        return render(request, 'major-event-log/event_details.html', context)
 
 
+@read_from_replica
+@event_condition
 def event_atom(request, event_id):
     """Loads the Atom record for the event with the given ID."""
-    event = get_event_or_404(event_id)
-    event_detail_url = request.build_absolute_uri(event.get_absolute_url())
-    context = {'event': event, 'event_details_url': event_detail_url}
-    return render(request, 'major-event-log/event_atom.xml', context,
-                  content_type='text/xml; charset=utf-8')
+    content = None
+    modified = get_event_modified(request, event_id)
+    if modified is not None:
+        event_detail_url = request.build_absolute_uri(
+            reverse('major-event-log:event_details',
+                    args=[uuid.UUID(event_id)]))
+        content = render_cache.get('atom', event_id, modified,
+                                   variant=event_detail_url)
+    if content is None:
+        event = get_event_or_404(event_id)
+        event_detail_url = request.build_absolute_uri(
+            event.get_absolute_url())
+        with rendering():
+            content = serialize_atom(event, event_detail_url)
+        render_cache.set('atom', event_id, event.entry_modified, content,
+                         variant=event_detail_url)
+    return HttpResponse(content, content_type='text/xml; charset=utf-8')
 
 
+@read_from_replica
+@event_condition
 def event_premis(request, event_id):
     """Loads the PREMIS event item for the event with the given ID."""
-    event = get_event_or_404(event_id)
-    context = {'event': event}
-    return render(request, 'major-event-log/event_premis.xml', context,
-                  content_type='text/xml; charset=utf-8')
+    modified = get_event_modified(request, event_id)
+    content = render_cache.get('premis', event_id, modified)
+    if content is None:
+        event = get_event_or_404(event_id)
+        with rendering():
+            content = serialize_premis(event)
+        render_cache.set('premis', event_id, event.entry_modified, content)
+    return HttpResponse(content, content_type='text/xml; charset=utf-8')
+
+
+@read_from_replica
+def premis_export(request):
+    """Streams every event as a single PREMIS document.
+
+    The optional `since` and `until` parameters limit the export to the
+    events modified in that interval, and `gzip` compresses the output.
+    """
+    bounds = {}
+    for name in ('since', 'until'):
+        if request.GET.get(name):
+            try:
+                bounds[name] = parse_timestamp(request.GET[name])
+            except ValueError as error:
+                return HttpResponseBadRequest(str(error))
+
+    chunks = encode_chunks(premis_export_chunks(modified_events(**bounds)))
+    if request.GET.get('gzip'):
+        response = StreamingHttpResponse(gzip_chunks(chunks),
+                                         content_type='application/gzip')
+        response['Content-Disposition'] = (
+            'attachment; filename="major-event-log.premis.xml.gz"')
+        return response
+    return StreamingHttpResponse(chunks,
+                                 content_type='text/xml; charset=utf-8')
+
+
+@read_from_replica
+def changes_jsonl(request):
+    """Returns the events created or modified after a resume token as
+    JSON lines, oldest change first.
+
+    The token to resume from next time is sent in the X-Resume-Token
+    header and in a `next` Link header. At most `limit` events are
+    returned per request.
+    """
+    try:
+        limit = int(request.GET.get('limit', CHANGES_LIMIT))
+    except ValueError:
+        return HttpResponseBadRequest('Invalid limit.')
+    if not 0 < limit <= CHANGES_MAX_LIMIT:
+        return HttpResponseBadRequest(
+            'The limit must be between 1 and {0}.'.format(CHANGES_MAX_LIMIT))
+
+    token = request.GET.get(TOKEN_FIELD) or None
+    events = with_agent_fields(settled_changes(all_events()), EXPORT_FIELDS)
+    paginator = changes_paginator(events.values(*EXPORT_FIELDS), limit)
+    try:
+        page = paginator.page(token)
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid resume token.')
+
+    with rendering():
+        content = ''.join(json_line(row) for row in page)
+    response = HttpResponse(content,
+                            content_type='application/x-ndjson; charset=utf-8')
+    next_token = resume_token(page, token)
+    if next_token is not None:
+        query = {TOKEN_FIELD: next_token}
+        if 'limit' in request.GET:
+            query['limit'] = limit
+        next_url = request.build_absolute_uri(
+            '{0}?{1}'.format(request.path, urlencode(query)))
+        response['X-Resume-Token'] = next_token
+        response['Link'] = '<{0}>; rel="next"'.format(next_url)
+    return response
+
+
+def has_ingest_token(request):
+    """Check the request's bearer token against the configured
+    MAJOR_EVENT_LOG_INGEST_TOKENS.
+    """
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return False
+    tokens = getattr(settings, 'MAJOR_EVENT_LOG_INGEST_TOKENS', ())
+    return any(hmac.compare_digest(token.encode('utf-8'), known.encode('utf-8'))
+               for known in tokens)
+
+
+@csrf_exempt
+@require_POST
+def ingest_events(request):
+    """Creates the events posted as JSON lines or as PREMIS XML.
+
+    Requires a bearer token from MAJOR_EVENT_LOG_INGEST_TOKENS. Every
+    record is validated before any event is written. Clients may send
+    an Idempotency-Key header so that a retried request does not create
+    the events again. PREMIS records take their title, contact_name and
+    contact_email, when missing, from query parameters of those names.
+    """
+    if not has_ingest_token(request):
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key:
+        try:
+            check_idempotency_key(idempotency_key)
+        except IngestError as error:
+            return JsonResponse({'error': error.message}, status=400)
+
+    content_type = request.content_type
+    if content_type in ('application/x-ndjson', 'application/jsonl',
+                        'application/json'):
+        records = parse_jsonl(request)
+    elif content_type in ('application/xml', 'text/xml'):
+        defaults = {name: request.GET[name] for name in PREMIS_DEFAULT_FIELDS
+                    if name in request.GET}
+        records = parse_premis(request, defaults=defaults)
+    else:
+        return JsonResponse(
+            {'error': 'Unsupported content type: {0}'.format(content_type)},
+            status=415)
+
+    try:
+        events = list(build_events(records))
+    except IngestError as error:
+        return JsonResponse({'error': error.message, 'line': error.line},
+                            status=400)
+    batch_size = getattr(settings, 'MAJOR_EVENT_LOG_INGEST_BATCH_SIZE',
+                         DEFAULT_BATCH_SIZE)
+    try:
+        result = load_events(events, batch_size=batch_size,
+                             idempotency_key=idempotency_key)
+    except IngestConflict as error:
+        # The batches before the failing one stay written.
+        return JsonResponse({'error': 'An event with one of the given ids '
+                                      'already exists.',
+                             'created': error.created, 'batch': error.batch},
+                            status=409)
+    return JsonResponse(result, status=201 if result['created'] else 200)
+
+
+def get_stats_or_400(request):
+    """Returns the statistics for the since and until dates of the
+    request, or None if a date is invalid.
+    """
+    bounds = {}
+    for name in ('since', 'until'):
+        if request.GET.get(name):
+            try:
+                bounds[name] = parse_day(request.GET[name])
+            except ValueError:
+                return None
+    return get_stats(**bounds)
+
+
+@read_from_replica
+def stats(request):
+    """Loads the statistics page, read from the daily rollups."""
+    context = {'stats': get_stats_or_400(request)}
+    if context['stats'] is None:
+        return HttpResponseBadRequest('Invalid date.')
+    context['since'] = request.GET.get('since', '')
+    context['until'] = request.GET.get('until', '')
+    with rendering():
+        return render(request, 'major-event-log/stats.html', context)
+
+
+@read_from_replica
+def stats_json(request):
+    """Returns the statistics of the stats page as JSON."""
+    data = get_stats_or_400(request)
+    if data is None:
+        return JsonResponse({'error': 'Invalid date.'}, status=400)
+    return JsonResponse(data)
 
 
 def about(request):
     """Loads the 'about' page."""
-    return render(request, 'major-event-log/about.html')
+    with rendering():
+        return render(request, 'major-event-log/about.html')
+
+
+def metrics(request):
+    """Returns the request metrics of the app's views in the Prometheus
+    text format, when MAJOR_EVENT_LOG_METRICS_ENDPOINT is enabled.
+    """
+    if not getattr(settings, 'MAJOR_EVENT_LOG_METRICS_ENDPOINT', False):
+        raise Http404('Metrics are not enabled.')
+    return HttpResponse(registry.prometheus(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
@@ -0,0 +1,574 @@
+"""Benchmarks for django-major-event-log.
+
+Run all of the benchmarks, or only the named ones, with the test
+settings:
+
+    $ python -m tests.benchmarks [name ...]
+
+The scale benchmarks run against SQLite databases seeded with 10,000,
+100,000 and 1,000,000 synthetic events (or the --scales given). The
+events are generated from a fixed seed, so every run measures the same
+data, and each seeded database is kept in --database-dir to be reused by
+later runs.
+
+Results are printed (or written to --output) as JSON, along with the
+versions and commit they were measured with, so that runs can be
+compared across commits.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+import uuid
+
+BENCHMARKS = {}
+SCALE_BENCHMARKS = {}
+DEFAULT_SCALES = (10000, 100000, 1000000)
+DEFAULT_SEED = 1
+WORDS = ('migrated', 'storage', 'fixity', 'check', 'replicated', 'tape',
+         'ingest', 'audit', 'format', 'normalized', 'restored', 'object',
+         'collection', 'checksum', 'virus', 'scan', 'deaccessioned', 'copy')
+
+
+def benchmark(func):
+    """Register a benchmark function under its name."""
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def scale_benchmark(func):
+    """Register a benchmark run against each seeded database.
+
+    The function is given a Scale and returns a dictionary of results.
+    """
+    SCALE_BENCHMARKS[func.__name__] = func
+    return func
+
+
+def time_per_call(func, number):
+    """Return the best time per call of func, in seconds."""
+    timer = timeit.Timer(func)
+    return min(timer.repeat(repeat=3, number=number)) / number
+
+
+def make_event(**kwargs):
+    """Build an unsaved event (and agent) with realistic field sizes."""
+    from django.utils import timezone
+    from major_event_log.models import Agent, Event
+
+    fields = {
+        'title': 'Migrated the preservation store',
+        'detail': 'Copied every object & its <metadata> to new storage. ' * 8,
+        'outcome': Event.SUCCESS,
+        'outcome_detail': 'All fixity checks passed. ' * 4,
+        'date': timezone.now(),
+        'entry_created': timezone.now(),
+        'entry_modified': timezone.now(),
+        'agent': Agent(name='Digital Projects Unit', email='dpu@example.com'),
+    }
+    fields.update(kwargs)
+    return Event(**fields)
+
+
+@benchmark
+def record_rendering(number=2000):
+    """Compare the serializers to rendering the templates."""
+    from django.template.loader import render_to_string
+    from major_event_log import serializers
+
+    event = make_event()
+    url = 'http://example.com/major-event-log/event/{0}/'.format(event.id)
+    cases = {
+        'premis_template': lambda: render_to_string(
+            'major-event-log/event_premis.xml', {'event': event}),
+        'premis_serializer': lambda: serializers.serialize_premis(event),
+        'atom_template': lambda: render_to_string(
+            'major-event-log/event_atom.xml',
+            {'event': event, 'event_details_url': url}),
+        'atom_serializer': lambda: serializers.serialize_atom(event, url),
+    }
+    results = {name: time_per_call(func, number)
+               for name, func in cases.items()}
+    results['premis_speedup'] = (results['premis_template']
+                                 / results['premis_serializer'])
+    results['atom_speedup'] = (results['atom_template']
+                               / results['atom_serializer'])
+    return results
+
+
+@benchmark
+def event_rows(rows=100000):
+    """Compare building Event instances and EventRecords from rows."""
+    from major_event_log.models import Event
+    from major_event_log.records import RECORD_FIELDS, EventRecord
+
+    event = make_event()
+    row = tuple(getattr(event, field) for field in RECORD_FIELDS)
+    field_names = [field.attname for field in Event._meta.concrete_fields]
+    model_row = tuple(getattr(event, name) for name in field_names)
+    cases = {
+        # Model.from_db is what a queryset calls for every row.
+        'model': lambda: [Event.from_db('default', field_names, model_row)
+                          for _ in range(rows)],
+        'record': lambda: [EventRecord.from_row(RECORD_FIELDS, row)
+                           for _ in range(rows)],
+    }
+    results = {'rows': rows}
+    for name, func in cases.items():
+        results[name + '_seconds'] = time_per_call(func, 1)
+        tracemalloc.start()
+        objects = func()
+        results[name + '_bytes'] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del objects
+    results['speedup'] = results['model_seconds'] / results['record_seconds']
+    results['memory_ratio'] = results['model_bytes'] / results['record_bytes']
+    return results
+
+
+@benchmark
+def event_ids(rows=100000, batch_size=500):
+    """Compare inserting events with version 4 and version 7 ids on
+    SQLite, and the size of the resulting primary key index.
+    """
+    import uuid
+    from major_event_log.uuids import uuid7
+
+    results = {'rows': rows}
+    for name, make_id in (('uuid4', uuid.uuid4), ('uuid7', uuid7)):
+        with tempfile.TemporaryDirectory() as directory:
+            connection = sqlite3.connect(os.path.join(directory, 'ids.db'))
+            # The id column as Django creates it for a UUIDField.
+            connection.execute(
+                'CREATE TABLE event (id char(32) NOT NULL PRIMARY KEY, '
+                'title varchar(100) NOT NULL)')
+            started = time.perf_counter()
+            for _ in range(rows // batch_size):
+                with connection:
+                    connection.executemany(
+                        'INSERT INTO event VALUES (?, ?)',
+                        [(make_id().hex, 'Migrated the preservation store')
+                         for _ in range(batch_size)])
+            elapsed = time.perf_counter() - started
+            index_bytes, = connection.execute(
+                "SELECT SUM(pgsize) FROM dbstat "
+                "WHERE name = 'sqlite_autoindex_event_1'").fetchone()
+            connection.close()
+        results[name + '_rows_per_second'] = rows / elapsed
+        results[name + '_index_bytes'] = index_bytes
+    return results
+
+
+def seed_events(scale, seed, batch_size=5000):
+    """Fill the default database with `scale` synthetic events spread
+    over ten years and fifty agents, generated from the seed.
+
+    The events are written with bulk_create and the derived data (counts,
+    search index and rollups) is then rebuilt from them.
+    """
+    from django.db import transaction
+    from django.db.models import F
+    from major_event_log import counts, facets, rollups
+    from major_event_log.models import Agent, Event
+    from major_event_log.search import get_search_backend
+
+    rng = random.Random(seed)
+    start = datetime.datetime(2015, 1, 1, tzinfo=datetime.timezone.utc)
+    with transaction.atomic():
+        agents = Agent.objects.bulk_create([
+            Agent(name='Agent {0}'.format(number),
+                  email='agent{0}@example.com'.format(number))
+            for number in range(50)])
+        batch = []
+        for _ in range(scale):
+            batch.append(Event(
+                id=uuid.UUID(int=rng.getrandbits(128), version=4),
+                title=' '.join(rng.sample(WORDS, 3)).capitalize(),
+                detail=' '.join(rng.choice(WORDS) for _ in range(60)),
+                outcome=(Event.FAILURE if rng.random() < 0.1
+                         else Event.SUCCESS),
+                outcome_detail=' '.join(rng.choice(WORDS) for _ in range(20)),
+                date=start + datetime.timedelta(
+                    seconds=rng.randrange(10 * 365 * 86400)),
+                agent=rng.choice(agents)))
+            if len(batch) == batch_size:
+                Event.objects.bulk_create(batch)
+                batch = []
+        Event.objects.bulk_create(batch)
+        # Entered when they happened, rather than all at once.
+        Event.objects.update(entry_created=F('date'), entry_modified=F('date'))
+        counts.rebuild_counters()
+        facets.rebuild_facet_counts()
+        rollups.rebuild_rollups()
+        get_search_backend().rebuild()
+
+
+class Scale(object):
+    """A database seeded with a number of events, and clients to
+    request the app from.
+    """
+
+    def __init__(self, events, sample_id, client, admin_client):
+        self.events = events
+        self.sample_id = sample_id
+        self.client = client
+        self.admin_client = admin_client
+
+
+def open_scale(scale, seed, directory):
+    """Point the default database at a seeded database, seeding it
+    first if it doesn't exist yet, and return its Scale.
+    """
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test import Client
+    from major_event_log.models import Event
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory,
+                        'events-{0}-{1}.sqlite3'.format(scale, seed))
+    if not os.path.exists(path):
+        # Seeded under another name, so that an interrupted run leaves
+        # no database behind to be mistaken for a complete one.
+        partial = path + '.partial'
+        if os.path.exists(partial):
+            os.remove(partial)
+        connection.close()
+        connection.settings_dict['NAME'] = partial
+        call_command('migrate', verbosity=0)
+        seed_events(scale, seed)
+        connection.close()
+        os.replace(partial, path)
+    connection.close()
+    connection.settings_dict['NAME'] = path
+    # Brings databases seeded by older commits up to date.
+    call_command('migrate', verbosity=0)
+    user, _ = User.objects.get_or_create(
+        username='benchmark', defaults={'is_staff': True,
+                                        'is_superuser': True})
+    admin_client = Client()
+    admin_client.force_login(user)
+    sample_id = Event.objects.order_by('id').values_list(
+        'id', flat=True)[scale // 2]
+    return Scale(scale, sample_id, Client(), admin_client)
+
+
+def request_times(client, url, number=3):
+    """Request a URL `number` times and return the best time, the
+    number of queries and the size of the response.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    best = None
+    for _ in range(number):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(url)
+            content = b''.join(response) if response.streaming else (
+                response.content)
+            elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            raise RuntimeError('{0} returned HTTP {1}'.format(
+                url, response.status_code))
+        best = elapsed if best is None else min(best, elapsed)
+    return {'seconds': best, 'queries': len(queries), 'bytes': len(content)}
+
+
+@scale_benchmark
+def index_pages(scale):
+    """The index at shallow and deep numbered pages and cursors."""
+    from django.urls import reverse
+    from major_event_log.pagination import CursorPaginator
+
+    url = reverse('major-event-log:index')
+    last_page = max(1, -(-scale.events // 10))
+    return {
+        'first': request_times(scale.client, url),
+        'page_2': request_times(scale.client, url + '?page=2'),
+        'middle_page': request_times(
+            scale.client, url + '?page={0}'.format(last_page // 2 or 1)),
+        'last_page': request_times(
+            scale.client, url + '?page={0}'.format(last_page)),
+        'last_cursor': request_times(
+            scale.client,
+            url + '?cursor={0}'.format(CursorPaginator.LAST_CURSOR)),
+        'search': request_times(scale.client, url + '?q=fixity+tape'),
+        'filtered': request_times(scale.client,
+                                  url + '?outcome=failure&since=2020-01-01'),
+    }
+
+
+@scale_benchmark
+def feed_pages(scale):
+    """The Atom feed at shallow and deep pages."""
+    from django.urls import reverse
+
+    url = reverse('major-event-log:feed')
+    last_page = max(1, -(-scale.events // 10))
+    return {
+        'first': request_times(scale.client, url),
+        'page_2': request_times(scale.client, url + '?p=2'),
+        'last_page': request_times(
+            scale.client, url + '?p={0}'.format(last_page)),
+        'changes': request_times(scale.client,
+                                 reverse('major-event-log:changes')),
+    }
+
+
+@scale_benchmark
+def record_views(scale):
+    """The details page and the PREMIS and Atom records of one event."""
+    from django.urls import reverse
+
+    return {name: request_times(scale.client, reverse(
+        'major-event-log:' + name, args=[scale.sample_id]))
+        for name in ('event_details', 'event_premis', 'event_atom')}
+
+
+@scale_benchmark
+def admin_changelist(scale):
+    """The admin changelist, unfiltered, filtered and at its last page."""
+    url = '/admin/major_event_log/event/'
+    last_page = max(1, -(-scale.events // 100))
+    return {
+        'first': request_times(scale.admin_client, url),
+        'outcome': request_times(
+            scale.admin_client, url + '?outcome__exact={0}'.format(
+                'http://purl.org/NET/UNTL/vocabularies/eventOutcomes/'
+                '%23failure')),
+        'last_page': request_times(
+            scale.admin_client, url + '?p={0}'.format(last_page)),
+    }
+
+
+@scale_benchmark
+def bulk_create(scale, events=1000, number=3):
+    """Loading events in bulk into the seeded log, rolled back after
+    each load.
+    """
+    from django.db import transaction
+    from major_event_log import ingest
+
+    records = [(line, {
+        'title': 'Bulk event {0}'.format(line), 'detail': 'Loaded in bulk.',
+        'outcome': 'Success', 'outcome_detail': 'none',
+        'date': '2024-01-02T03:04:05Z', 'contact_name': 'Agent 1',
+        'contact_email': 'agent1@example.com'}) for line in range(events)]
+    best = None
+    for _ in range(number):
+        with transaction.atomic():
+            started = time.perf_counter()
+            ingest.load_events(ingest.build_events(records))
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        best = elapsed if best is None else min(best, elapsed)
+    return {'events': events, 'seconds': best,
+            'events_per_second': events / best}
+
+
+@scale_benchmark
+def static_site(scale, max_events=10000):
+    """Full builds of the static site in this process and in a process
+    pool, and an incremental build with nothing to render.
+    """
+    from major_event_log.static_site import build_static_site
+
+    if scale.events > max_events:
+        return {'skipped': 'more than {0} events'.format(max_events)}
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        for workers in sorted({1, os.cpu_count() or 1}):
+            started = time.perf_counter()
+            build = build_static_site(root, 'http://testserver',
+                                      workers=workers, full=True)
+            results['full_{0}_workers'.format(workers)] = {
+                'seconds': time.perf_counter() - started,
+                'pages': build['rendered'],
+            }
+        started = time.perf_counter()
+        build = build_static_site(root, 'http://testserver')
+        results['incremental'] = {'seconds': time.perf_counter() - started,
+                                  'pages': build['rendered']}
+    return results
+
+
+async def asgi_get(application, path):
+    """Request a path from an ASGI application and return the status."""
+    import asyncio
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path,
+        'raw_path': path.encode('utf-8'), 'query_string': b'',
+        'headers': [(b'host', b'testserver')],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+    }
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    status = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # The client never disconnects.
+        await asyncio.Future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+async def request_concurrently(application, paths, requests, clients):
+    """Make `requests` requests, cycling through the paths, with at most
+    `clients` of them in flight at once, and return the time taken.
+    """
+    import asyncio
+
+    semaphore = asyncio.Semaphore(clients)
+
+    async def request(path):
+        async with semaphore:
+            status = await asgi_get(application, path)
+        if status != 200:
+            raise RuntimeError('{0} returned HTTP {1}'.format(path, status))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(request(paths[number % len(paths)])
+                           for number in range(requests)))
+    return time.perf_counter() - started
+
+
+@scale_benchmark
+def asgi_concurrency(scale, requests=300, concurrency=(1, 10, 50)):
+    """Throughput of the synchronous views and of the async views of
+    async_urls.py, served by Django's ASGI handler to several numbers of
+    concurrent clients.
+    """
+    import asyncio
+    from django.conf import settings
+    from django.core.handlers.asgi import ASGIHandler
+    from django.urls import clear_url_caches, reverse
+
+    paths = [
+        reverse('major-event-log:index'),
+        reverse('major-event-log:feed'),
+        reverse('major-event-log:event_details', args=[scale.sample_id]),
+        reverse('major-event-log:event_premis', args=[scale.sample_id]),
+    ]
+    urlconf = settings.ROOT_URLCONF
+    results = {}
+    try:
+        for name, views_urlconf in (('sync', 'tests.urls'),
+                                    ('async', 'tests.async_urls')):
+            settings.ROOT_URLCONF = views_urlconf
+            clear_url_caches()
+            application = ASGIHandler()
+            for clients in concurrency:
+                seconds = asyncio.run(request_concurrently(
+                    application, paths, requests, clients))
+                results.setdefault(name, {})[str(clients)] = {
+                    'seconds': seconds,
+                    'requests_per_second': requests / seconds,
+                }
+    finally:
+        settings.ROOT_URLCONF = urlconf
+        clear_url_caches()
+    return results
+
+
+def environment():
+    """Describe what the results were measured with."""
+    import django
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m tests.benchmarks', description='Run benchmarks.')
+    parser.add_argument(
+        'names', nargs='*', metavar='name',
+        help='Benchmarks to run (default: all of them): {0}.'.format(
+            ', '.join(sorted(set(BENCHMARKS) | set(SCALE_BENCHMARKS)))))
+    parser.add_argument(
+        '--scales', default=','.join(str(n) for n in DEFAULT_SCALES),
+        help='Comma separated numbers of events to seed the scale '
+             'benchmarks with.')
+    parser.add_argument(
+        '--seed', type=int, default=DEFAULT_SEED,
+        help='Seed of the synthetic events.')
+    parser.add_argument(
+        '--database-dir', default=os.path.join(tempfile.gettempdir(),
+                                               'major-event-log-benchmarks'),
+        help='Directory keeping the seeded databases between runs.')
+    parser.add_argument(
+        '--output', help='File to write the results to instead of standard '
+                         'output.')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    options = parse_args(argv)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings.test')
+    import django
+    django.setup()
+
+    names = options.names or sorted(set(BENCHMARKS) | set(SCALE_BENCHMARKS))
+    unknown = set(names) - set(BENCHMARKS) - set(SCALE_BENCHMARKS)
+    if unknown:
+        sys.exit('Unknown benchmarks: {0}'.format(', '.join(sorted(unknown))))
+    results = {name: BENCHMARKS[name]() for name in names
+               if name in BENCHMARKS}
+
+    scale_names = [name for name in names if name in SCALE_BENCHMARKS]
+    if scale_names:
+        from django.conf import settings
+        from django.test.utils import setup_test_environment
+
+        # Measure the pages as served in production.
+        settings.DEBUG = False
+        setup_test_environment(debug=False)
+        for events in sorted(int(n) for n in options.scales.split(',')):
+            scale = open_scale(events, options.seed, options.database_dir)
+            for name in scale_names:
+                results.setdefault(name, {})[str(events)] = (
+                    SCALE_BENCHMARKS[name](scale))
+
+    output = {'environment': environment(), 'seed': options.seed,
+              'results': results}
+    if options.output:
+        with open(options.output, 'w') as stream:
+            json.dump(output, stream, indent=2, sort_keys=True)
+            stream.write('\n')
+    else:
+        json.dump(output, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
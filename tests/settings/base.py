@@ -28,6 +28,8 @@ MIDDLEWARE = (
 
 ROOT_URLCONF = 'tests.urls'
 
+DATABASE_ROUTERS = ['major_event_log.routers.ReplicaRouter']
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -5,5 +5,14 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': ':memory:',
-    }
+    },
+    # A separate database standing in for a replica, so that tests can
+    # tell which one a view read from.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
 }
+
+# Serve changes as soon as they are made; TestChangesFeed checks the lag.
+MAJOR_EVENT_LOG_CHANGES_LAG = 0
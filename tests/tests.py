@@ -1,15 +1,55 @@
+import base64
+import copy
+import csv
+import datetime
+import gzip
+import io
+import json
 import os
+import re
+import tempfile
+import time
+import uuid
+from unittest import mock
 
+from asgiref.sync import iscoroutinefunction, sync_to_async
 from lxml import etree
 
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
 from django.urls import reverse, resolve
-from django.test import TestCase, RequestFactory
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.template.loader import render_to_string
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import DatabaseError, connection, connections
 from django.utils import timezone
-from django.http import Http404
+from django.http import Http404, HttpResponse
 
-from major_event_log.models import Event
+from major_event_log.models import (Agent, ArchivedEvent, Event,
+                                    EventCounter, EventRollup, IngestBatch)
 from major_event_log import views
+from major_event_log import archive
+from major_event_log import async_views
 from major_event_log import feeds
+from major_event_log.cache import render_cache
+from major_event_log.pagecache import page_cache
+from major_event_log import counts
+from major_event_log import facets
+from major_event_log import export
+from major_event_log import ingest
+from major_event_log import rollups
+from major_event_log import metrics
+from major_event_log import routers
+from major_event_log import search
+from major_event_log import serializers
+from major_event_log import static_site
+from major_event_log import uuids
+from major_event_log.pagination import CursorPaginator, InvalidCursor
+from major_event_log.records import EventRecord, as_records
 
 
 def create_event(title='test', outcome='Success', name='John Doe'):
@@ -21,14 +61,14 @@ def create_event(title='test', outcome='Success', name='John Doe'):
         outcome = ('http://purl.org/NET/UNTL/vocabularies/eventOutcomes/'
                    '#failure')
     date = timezone.now()
+    agent, _ = Agent.objects.get_or_create(name=name, email='admin@email.com')
     event = Event.objects.create(
         title=title,
         detail='none',
         outcome=outcome,
         outcome_detail='none',
         date=date,
-        contact_name=name,
-        contact_email='admin@email.com')
+        agent=agent)
     return event
 
 
@@ -133,6 +173,15 @@ class TestFeed(TestCase):
         )
         self.assertTrue('/feed/?p=3' in link[0].attrib.get('href'))
 
+    def test_pages_kept_per_request(self):
+        """Check that a shared feed keeps no page between requests."""
+        feed = feeds.LatestEventsFeed()
+        factory = RequestFactory()
+        feed(factory.get('/', {'p': 2, 'outcome': 'success'}))
+        self.assertEqual(vars(feed), {})
+        response = feed(factory.get('/'))
+        self.assertNotIn(b'outcome=success', response.content)
+
     def test_has_previous_link(self):
         """Check that the href on the `previous` link is present and
         correct.
@@ -225,17 +274,17 @@ class TestTemplateUsed(TestCase):
         template = 'major-event-log/event_details.html'
         self.assertTemplateUsed(self.client.get(url), template)
 
-    def test_event_atom_template_used(self):
-        """Check that the correct template is used by the event_atom view."""
+    def test_event_atom_template_not_used(self):
+        """Check that the event_atom view is serialized without a template."""
         url = reverse('major-event-log:event_atom', args=[self.event.id])
         template = 'major-event-log/event_atom.xml'
-        self.assertTemplateUsed(self.client.get(url), template)
+        self.assertTemplateNotUsed(self.client.get(url), template)
 
-    def test_event_premis_template_used(self):
-        """Check that the correct template is used by the event_premis view."""
+    def test_event_premis_template_not_used(self):
+        """Check that the event_premis view is serialized without a template."""
         url = reverse('major-event-log:event_premis', args=[self.event.id])
         template = 'major-event-log/event_premis.xml'
-        self.assertTemplateUsed(self.client.get(url), template)
+        self.assertTemplateNotUsed(self.client.get(url), template)
 
     def test_about_template_used(self):
         """Check that the correct template is used by the about view."""
@@ -328,13 +377,15 @@ class TestEventsUsed(TestCase):
         """Check that the event_atom page is using the correct event."""
         response = self.client.get(reverse('major-event-log:event_atom',
                                            args=[self.events[0].id]))
-        self.assertEqual(response.context['event'], self.events[0])
+        self.assertContains(response, self.events[0].id)
+        self.assertNotContains(response, self.events[1].id)
 
     def test_event_premis_event(self):
         """Check that the event_premis page is using the correct event."""
         response = self.client.get(reverse('major-event-log:event_premis',
                                            args=[self.events[0].id]))
-        self.assertEqual(response.context['event'], self.events[0])
+        self.assertContains(response, self.events[0].id)
+        self.assertNotContains(response, self.events[1].id)
 
     def test_feed_events(self):
         """Check that only the latest 10 events are included in the feed."""
@@ -387,3 +438,2379 @@ class TestXML(TestCase):
         premis = etree.fromstring(response.content)
         schema = self.get_schema('atom_schema.xsd')
         self.assertTrue(schema.validate(premis))
+
+
+class TestCursorPagination(TestCase):
+    """Test the keyset pagination of the index and the feed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.events = [create_event(title=str(i)) for i in range(25)]
+
+    def get_feed_link(self, feed, rel):
+        link = feed.xpath(
+            '/ns:feed/ns:link[@rel=\'{0}\']'.format(rel),
+            namespaces={'ns': 'http://www.w3.org/2005/Atom'}
+        )
+        return link[0].attrib.get('href') if link else None
+
+    def test_paginator_walks_forwards_and_backwards(self):
+        """Check that following the cursors visits every event once."""
+        paginator = CursorPaginator(
+            Event.objects.order_by('-entry_created', '-id'), 10)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        seen = [event.pk for page in pages for event in page]
+        expected = [event.pk for event in reversed(self.events)]
+        self.assertEqual(seen, expected)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+
+        previous = paginator.page(pages[2].previous_cursor)
+        self.assertEqual(list(previous), list(pages[1]))
+        self.assertTrue(previous.has_next())
+        self.assertTrue(previous.has_previous())
+
+    def test_paginator_last_page(self):
+        """Check that the last cursor returns the oldest events."""
+        paginator = CursorPaginator(Event.objects.all(), 10)
+        page = paginator.page(paginator.LAST_CURSOR)
+        self.assertEqual([event.pk for event in page],
+                         [event.pk for event in reversed(self.events[:10])])
+        self.assertFalse(page.has_next())
+        self.assertTrue(page.has_previous())
+
+    def test_paginator_invalid_cursor(self):
+        """Check that a malformed cursor raises InvalidCursor."""
+        paginator = CursorPaginator(Event.objects.all(), 10)
+        with self.assertRaises(InvalidCursor):
+            paginator.page('not-a-cursor')
+
+    def test_cursor_values_of_wrong_type(self):
+        """Check that well-formed tokens carrying values of the wrong
+        type are rejected everywhere cursors are read.
+        """
+        paginator = CursorPaginator(Event.objects.all(), 10)
+        tokens = [paginator.encode_cursor(paginator.FORWARD, key)
+                  for key in (('abc', 'def'), (5, uuid.uuid4()),
+                              (datetime.datetime(2001, 1, 1), uuid.uuid4()))]
+        for token in tokens:
+            with self.assertRaises(InvalidCursor):
+                paginator.page(token)
+            for name, field in (('index', 'cursor'), ('feed', 'cursor'),
+                                ('changes', 'token'),
+                                ('changes_jsonl', 'token')):
+                response = self.client.get(
+                    reverse('major-event-log:' + name), {field: token})
+                self.assertEqual(response.status_code, 400)
+            oai_token = base64.urlsafe_b64encode(json.dumps(
+                {'metadataPrefix': 'premis', 'cursor': token}).encode())
+            response = self.client.get(reverse('major-event-log:oai'), {
+                'verb': 'ListRecords', 'resumptionToken': oai_token})
+            self.assertIn(b'badResumptionToken',
+                          b''.join(response.streaming_content))
+
+    def test_index_uses_one_query(self):
+        """Check that a cursor page of the index needs a single query of
+        the events table (the other three read the facet counters and
+        the names of the agents in the sidebar).
+        """
+        first = self.client.get(reverse('major-event-log:index'))
+        cursor = first.context['page_obj'].next_cursor
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('major-event-log:index'),
+                                       {'cursor': cursor})
+        self.assertEqual(list(response.context['events']),
+                         list(reversed(self.events[5:15])))
+        self.assertContains(response, '?cursor={0}'.format(
+            response.context['page_obj'].next_cursor))
+
+    def test_index_page_links_are_elided(self):
+        """Check that numbered pages only link to the nearby pages and
+        the pages at either end.
+        """
+        with mock.patch.object(views.EventList, 'paginate_by', 1):
+            response = self.client.get(reverse('major-event-log:index'),
+                                       {'page': 12})
+        self.assertContains(response, '?page=9')
+        self.assertContains(response, '?page=25')
+        self.assertNotContains(response, '?page=5&')
+        self.assertNotContains(response, "?page=5'")
+        self.assertContains(response, '<span>…</span>', count=2)
+
+    def test_index_invalid_cursor(self):
+        """Check that an invalid cursor receives an HTTP 400 error."""
+        response = self.client.get(reverse('major-event-log:index'),
+                                   {'cursor': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_index_page_number_still_works(self):
+        """Check that numbered pages are still served."""
+        response = self.client.get(reverse('major-event-log:index'),
+                                   {'page': 2})
+        self.assertEqual(response.context['page_obj'].number, 2)
+        self.assertContains(response, '?page=3')
+
+    def test_feed_cursor_links(self):
+        """Check the feed links when paginating by cursor."""
+        url = reverse('major-event-log:feed')
+        feed = etree.fromstring(self.client.get(url).content)
+        self.assertTrue(self.get_feed_link(feed, 'first').endswith('/feed/'))
+        self.assertIsNone(self.get_feed_link(feed, 'previous'))
+        self.assertIn('/feed/?cursor=last', self.get_feed_link(feed, 'last'))
+
+        next_href = self.get_feed_link(feed, 'next')
+        self.assertIn('/feed/?cursor=', next_href)
+        cursor = next_href.split('cursor=')[1]
+        feed = etree.fromstring(self.client.get(url, {'cursor': cursor}).content)
+        self.assertIn('cursor={0}'.format(cursor), self.get_feed_link(feed, 'self'))
+        self.assertIn('/feed/?cursor=', self.get_feed_link(feed, 'previous'))
+
+    def test_feed_invalid_cursor(self):
+        """Check that an invalid feed cursor receives an HTTP 400 error."""
+        url = reverse('major-event-log:feed')
+        response = self.client.get(url, {'cursor': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestQueryPlans(TestCase):
+    """Test that the app's queries are answered from an index on SQLite."""
+
+    @classmethod
+    def setUpTestData(cls):
+        [create_event(outcome='Failure' if i % 3 else 'Success')
+         for i in range(20)]
+        cls.user = User.objects.create_superuser(
+            'admin', 'admin@email.com', 'password')
+        cls.factory = RequestFactory()
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        self.assertIn('USING INDEX', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_index_query_plan(self):
+        """Check the query plans of the first and a later index page."""
+        paginator = CursorPaginator(views.EventList.queryset, 10)
+        page = paginator.page()
+        queryset = paginator.object_list.order_by('-entry_created', '-id')
+        self.assertUsesIndex(queryset[:11])
+        _, key = paginator.decode_cursor(page.next_cursor)
+        self.assertUsesIndex(
+            queryset.filter(paginator._after(key, True))[:11])
+
+    def test_feed_query_plan(self):
+        """Check the query plan of the feed's items."""
+        request = self.factory.get('/', {'p': 2})
+        feed = feeds.LatestEventsFeed()
+        feed.get_object(request)
+        self.assertUsesIndex(feed.items(None))
+
+    def test_admin_changelist_query_plan(self):
+        """Check the query plans of the admin changelist."""
+        model_admin = admin.site._registry[Event]
+        for params in ({}, {'outcome__exact': Event.FAILURE}):
+            request = self.factory.get('/admin/major_event_log/event/', params)
+            request.user = self.user
+            changelist = model_admin.get_changelist_instance(request)
+            self.assertUsesIndex(changelist.queryset)
+
+
+class TestConditionalGet(TestCase):
+    """Test the ETag and Last-Modified handling of the views and feed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.events = [create_event() for _ in range(15)]
+        cls.event = cls.events[0]
+
+    def event_urls(self):
+        for name in ('event_details', 'event_atom', 'event_premis'):
+            yield reverse('major-event-log:{0}'.format(name),
+                          args=[self.event.id])
+
+    def test_event_views_send_validators(self):
+        """Check that the event views send an ETag and Last-Modified."""
+        for url in self.event_urls():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.has_header('ETag'))
+            self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_event_views_if_none_match(self):
+        """Check that a matching ETag gets an HTTP 304 from one query."""
+        for url in self.event_urls():
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+    def test_event_views_if_modified_since(self):
+        """Check that an up to date Last-Modified gets an HTTP 304."""
+        for url in self.event_urls():
+            last_modified = self.client.get(url)['Last-Modified']
+            response = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 304)
+
+    def test_event_views_modified_event(self):
+        """Check that editing the event changes its ETag."""
+        url = reverse('major-event-log:event_premis', args=[self.event.id])
+        etag = self.client.get(url)['ETag']
+        self.event.detail = 'changed'
+        self.event.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_event_views_missing_event(self):
+        """Check that unknown and malformed ids still get an HTTP 404."""
+        for event_id in ('d7768443-04e2-45d2-b71f-2b716bf13f13', 'abcd-1234'):
+            url = reverse('major-event-log:event_premis', args=[event_id])
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_feed_if_none_match(self):
+        """Check that the feed answers a matching ETag with an HTTP 304."""
+        url = reverse('major-event-log:feed')
+        for params in ({}, {'p': 2}):
+            etag = self.client.get(url, params)['ETag']
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_feed_etag_changes_with_page(self):
+        """Check that a new event changes the ETag of the first page."""
+        url = reverse('major-event-log:feed')
+        response = self.client.get(url)
+        etag = response['ETag']
+        create_event()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(MAJOR_EVENT_LOG_RENDER_CACHE={'LRU_SIZE': 10})
+class TestRenderCache(TestCase):
+    """Test the cache of rendered PREMIS and Atom records."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.event = create_event()
+
+    def setUp(self):
+        caches['default'].clear()
+        render_cache.clear()
+
+    def test_premis_served_from_cache(self):
+        """Check that a repeated request is answered from the cache."""
+        url = reverse('major-event-log:event_premis', args=[self.event.id])
+        first = self.client.get(url)
+        with self.assertNumQueries(1):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(render_cache.get_stats(),
+                         {'lru_hits': 1, 'hits': 0, 'misses': 1})
+
+    def test_atom_served_from_cache(self):
+        """Check that a repeated Atom request is answered from the cache."""
+        url = reverse('major-event-log:event_atom', args=[self.event.id])
+        first = self.client.get(url)
+        with self.assertNumQueries(1):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'example.com'])
+    def test_atom_varies_by_host(self):
+        """Check that Atom records for another host are not reused."""
+        url = reverse('major-event-log:event_atom', args=[self.event.id])
+        self.client.get(url)
+        response = self.client.get(url, HTTP_HOST='example.com')
+        self.assertContains(response, 'http://example.com/')
+
+    def test_shared_tier(self):
+        """Check that the Django cache tier backs the in-process tier."""
+        url = reverse('major-event-log:event_premis', args=[self.event.id])
+        self.client.get(url)
+        render_cache.lru.clear()
+        self.client.get(url)
+        self.assertEqual(render_cache.get_stats()['hits'], 1)
+
+    @override_settings(ROOT_URLCONF='tests.async_urls')
+    async def test_async_views(self):
+        """Check that the async views read and fill the cache with its
+        async methods.
+        """
+        urls = [reverse('major-event-log:event_premis', args=[self.event.id]),
+                reverse('major-event-log:event_atom', args=[self.event.id])]
+        with mock.patch.object(render_cache, 'get', side_effect=AssertionError), \
+                mock.patch.object(render_cache, 'set',
+                                  side_effect=AssertionError):
+            for url in urls:
+                first = await self.async_client.get(url)
+                render_cache.lru.clear()
+                second = await self.async_client.get(url)
+                self.assertEqual(first.content, second.content)
+        self.assertEqual(render_cache.get_stats(),
+                         {'lru_hits': 0, 'hits': 2, 'misses': 2})
+
+    def test_save_invalidates(self):
+        """Check that saving an event drops its cached records."""
+        url = reverse('major-event-log:event_premis', args=[self.event.id])
+        self.client.get(url)
+        self.event.detail = 'a new detail'
+        self.event.save()
+        self.assertEqual(len(render_cache.lru), 0)
+        self.assertContains(self.client.get(url), 'a new detail')
+
+    def test_stale_entry_not_served(self):
+        """Check that an entry rendered from an older row is a miss."""
+        url = reverse('major-event-log:event_premis', args=[self.event.id])
+        self.client.get(url)
+        Event.objects.filter(pk=self.event.pk).update(
+            detail='updated elsewhere', entry_modified=timezone.now())
+        self.assertContains(self.client.get(url), 'updated elsewhere')
+
+    def test_delete_invalidates(self):
+        """Check that deleting an event drops its cached records."""
+        url = reverse('major-event-log:event_premis', args=[self.event.id])
+        self.client.get(url)
+        self.event.delete()
+        self.assertEqual(len(render_cache.lru), 0)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(MAJOR_EVENT_LOG_RENDER_CACHE=None)
+    def test_disabled(self):
+        """Check that nothing is cached unless the cache is configured."""
+        url = reverse('major-event-log:event_premis', args=[self.event.id])
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(len(render_cache.lru), 0)
+        self.assertEqual(render_cache.get_stats()['misses'], 0)
+
+
+@override_settings(MAJOR_EVENT_LOG_PAGE_CACHE={'TIMEOUT': 60, 'WAIT': 0})
+class TestPageCache(TestCase):
+    """Test the cache of the index and feed pages."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.event = create_event(title='first')
+
+    def setUp(self):
+        caches['default'].clear()
+        page_cache.clear()
+
+    def page_key(self, name, url):
+        return page_cache.make_key(name, RequestFactory().get(url))
+
+    def test_index_served_from_cache(self):
+        """Check that a repeated request is answered without queries."""
+        url = reverse('major-event-log:index')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(page_cache.get_stats(),
+                         {'hits': 1, 'stale_hits': 0, 'misses': 1})
+
+    def test_pages_cached_separately(self):
+        """Check that each page and set of parameters has its own entry."""
+        url = reverse('major-event-log:feed')
+        self.client.get(url)
+        self.client.get(url + '?p=1')
+        self.client.get(url + '?q=first')
+        self.assertEqual(page_cache.get_stats()['misses'], 3)
+
+    def test_write_retires_pages(self):
+        """Check that saving an event retires every cached page."""
+        index = reverse('major-event-log:index')
+        feed = reverse('major-event-log:feed')
+        self.client.get(index)
+        self.client.get(feed)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_event(title='second')
+        self.assertContains(self.client.get(index), 'second')
+        self.assertContains(self.client.get(feed), 'second')
+        self.assertEqual(page_cache.get_stats()['misses'], 4)
+
+    def test_write_retires_pages_after_commit(self):
+        """Check that the version only moves on when the write commits."""
+        self.client.get(reverse('major-event-log:index'))
+        version = caches['default'].get(page_cache.version_key)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.event.save()
+            self.assertEqual(
+                caches['default'].get(page_cache.version_key), version)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_stale_page_served_while_rendering(self):
+        """Check that a page being rendered again by another request is
+        answered with the previous copy.
+        """
+        url = reverse('major-event-log:index')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_event(title='second')
+        caches['default'].add(self.page_key('index', url) + ':lock', 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertNotContains(response, 'second')
+        self.assertEqual(page_cache.get_stats()['stale_hits'], 1)
+
+    def test_rendered_without_copy_to_serve(self):
+        """Check that a page without a previous copy is rendered after
+        waiting for another request rendering it.
+        """
+        url = reverse('major-event-log:index')
+        caches['default'].add(self.page_key('index', url) + ':lock', 1)
+        self.assertContains(self.client.get(url), 'first')
+        self.assertIsNone(caches['default'].get(self.page_key('index', url)))
+
+    def test_conditional_request_from_cache(self):
+        """Check that a cached feed page answers conditional requests."""
+        url = reverse('major-event-log:feed')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_errors_not_cached(self):
+        """Check that only successful responses are cached."""
+        url = reverse('major-event-log:index') + '?cursor=invalid'
+        self.client.get(url)
+        self.assertIsNone(caches['default'].get(self.page_key('index', url)))
+
+    @override_settings(MAJOR_EVENT_LOG_PAGE_CACHE=None)
+    def test_disabled(self):
+        """Check that nothing is cached unless the cache is configured."""
+        url = reverse('major-event-log:index')
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(page_cache.get_stats()['misses'], 0)
+
+
+class TestSerializers(TestCase):
+    """Test that the serializers match the PREMIS and Atom templates."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.event = create_event(title='Tom & Jerry <"quoted">',
+                                 name='O\'Brien & Sons')
+        cls.event.detail = 'Moved <files> & "folders" to \'tape\'\nüñí'
+        cls.event.outcome_detail = '<![CDATA[ not really ]]> & more'
+        cls.event.save()
+        cls.url = 'http://testserver/event/?a=1&b=<2>'
+
+    def canonicalize(self, content):
+        parser = etree.XMLParser(remove_blank_text=True)
+        return etree.tostring(etree.fromstring(content, parser),
+                              method='c14n')
+
+    def test_premis_matches_template(self):
+        """Check the PREMIS record against the event_premis template."""
+        expected = render_to_string('major-event-log/event_premis.xml',
+                                    {'event': self.event})
+        self.assertEqual(
+            self.canonicalize(serializers.serialize_premis(self.event)),
+            self.canonicalize(expected.encode('utf-8')))
+
+    def test_atom_matches_template(self):
+        """Check the Atom entry against the event_atom template."""
+        expected = render_to_string('major-event-log/event_atom.xml',
+                                    {'event': self.event,
+                                     'event_details_url': self.url})
+        self.assertEqual(
+            self.canonicalize(serializers.serialize_atom(self.event, self.url)),
+            self.canonicalize(expected.encode('utf-8')))
+
+    @override_settings(TIME_ZONE='America/Chicago')
+    def test_dates_use_current_time_zone(self):
+        """Check that dates are shown in the current time zone like the
+        template's date filter.
+        """
+        expected = render_to_string('major-event-log/event_premis.xml',
+                                    {'event': self.event})
+        self.assertEqual(
+            self.canonicalize(serializers.serialize_premis(self.event)),
+            self.canonicalize(expected.encode('utf-8')))
+
+    def test_views_use_serializers(self):
+        """Check that the views return the serialized records."""
+        url = reverse('major-event-log:event_premis', args=[self.event.id])
+        self.assertEqual(self.client.get(url).content,
+                         serializers.serialize_premis(self.event))
+        url = reverse('major-event-log:event_atom', args=[self.event.id])
+        details_url = 'http://testserver' + self.event.get_absolute_url()
+        self.assertEqual(self.client.get(url).content,
+                         serializers.serialize_atom(self.event, details_url))
+
+
+class TestPremisExport(TestCase):
+    """Test the streaming PREMIS export endpoint and command."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.events = [create_event(title=str(i)) for i in range(5)]
+        base = timezone.now() - datetime.timedelta(days=10)
+        for day, event in enumerate(cls.events):
+            Event.objects.filter(pk=event.pk).update(
+                entry_modified=base + datetime.timedelta(days=day))
+        cls.middle = base + datetime.timedelta(days=2)
+
+    def get_ids(self, content):
+        document = etree.fromstring(content)
+        return document.xpath(
+            '/premis:premis/premis:event/premis:eventIdentifier/'
+            'premis:eventIdentifierValue/text()',
+            namespaces={'premis': serializers.PREMIS_NAMESPACE})
+
+    def test_export_streams_all_events(self):
+        """Check that the export holds every event, oldest change first."""
+        response = self.client.get(reverse('major-event-log:premis_export'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(self.get_ids(b''.join(response.streaming_content)),
+                         [str(event.id) for event in self.events])
+
+    def test_export_since_until(self):
+        """Check that since and until filter on entry_modified."""
+        response = self.client.get(
+            reverse('major-event-log:premis_export'),
+            {'since': self.middle.isoformat(),
+             'until': (self.middle + datetime.timedelta(days=2)).isoformat()})
+        self.assertEqual(self.get_ids(b''.join(response.streaming_content)),
+                         [str(event.id) for event in self.events[2:4]])
+
+    def test_export_gzip(self):
+        """Check that the export can be gzip compressed."""
+        response = self.client.get(reverse('major-event-log:premis_export'),
+                                   {'gzip': 1})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        content = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(len(self.get_ids(content)), 5)
+
+    def test_export_bad_date(self):
+        """Check that an invalid date receives an HTTP 400 error."""
+        response = self.client.get(reverse('major-event-log:premis_export'),
+                                   {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_command_stdout(self):
+        """Check that the command writes the document to stdout."""
+        out = io.StringIO()
+        call_command('export_premis', '--since', self.middle.isoformat(),
+                     '--chunk-size', '2', stdout=out)
+        self.assertEqual(self.get_ids(out.getvalue().encode('utf-8')),
+                         [str(event.id) for event in self.events[2:]])
+
+    def test_command_gzip_file(self):
+        """Check that the command writes a gzip file."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'events.premis.xml.gz')
+            call_command('export_premis', '--gzip', '--output', path)
+            with gzip.open(path) as export:
+                self.assertEqual(len(self.get_ids(export.read())), 5)
+
+    def test_command_bad_date(self):
+        """Check that the command rejects an invalid date."""
+        with self.assertRaises(CommandError):
+            call_command('export_premis', '--until', 'tomorrow')
+
+
+class TestChangesFeed(TestCase):
+    """Test the Atom and JSON-lines changes feeds."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.events = [create_event(title=str(i)) for i in range(5)]
+
+    def get_jsonl(self, **params):
+        response = self.client.get(reverse('major-event-log:changes_jsonl'),
+                                   params)
+        if response.status_code != 200:
+            return response, None
+        rows = [json.loads(line) for line in response.content.splitlines()]
+        return response, rows
+
+    def get_atom(self, **params):
+        response = self.client.get(reverse('major-event-log:changes'), params)
+        feed = etree.fromstring(response.content)
+        ns = {'ns': 'http://www.w3.org/2005/Atom'}
+        titles = feed.xpath('/ns:feed/ns:entry/ns:title/text()', namespaces=ns)
+        link = feed.xpath('/ns:feed/ns:link[@rel=\'next\']', namespaces=ns)
+        return titles, link[0].attrib['href'] if link else None
+
+    @override_settings(MAJOR_EVENT_LOG_CHANGES_LAG=60)
+    def test_recent_changes_held_back(self):
+        """Check that changes within the lag aren't served yet, so that
+        later commits of earlier changes can't be skipped.
+        """
+        for minutes, event in ((3, self.events[0]), (2, self.events[1])):
+            Event.objects.filter(pk=event.pk).update(
+                entry_modified=timezone.now() -
+                datetime.timedelta(minutes=minutes))
+        expected = [str(event.id) for event in self.events[:2]]
+        response, rows = self.get_jsonl()
+        self.assertEqual([row['id'] for row in rows], expected)
+        titles, link = self.get_atom()
+        self.assertEqual(titles, ['0', '1'])
+        response = self.client.get(reverse('major-event-log:oai'), {
+            'verb': 'ListIdentifiers', 'metadataPrefix': 'premis'})
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(re.findall(r'oai:testserver:([0-9a-f-]+)', content),
+                         expected)
+
+    def test_jsonl_in_order_of_change(self):
+        """Check that changes are listed oldest change first."""
+        response, rows = self.get_jsonl()
+        self.assertEqual([row['id'] for row in rows],
+                         [str(event.id) for event in self.events])
+        self.assertTrue(response.has_header('X-Resume-Token'))
+        self.assertIn('rel="next"', response['Link'])
+
+    def test_jsonl_resume(self):
+        """Check that resuming returns only later changes."""
+        response, rows = self.get_jsonl(limit=3)
+        self.assertEqual(len(rows), 3)
+        token = response['X-Resume-Token']
+        response, rows = self.get_jsonl(token=token)
+        self.assertEqual([row['id'] for row in rows],
+                         [str(event.id) for event in self.events[3:]])
+
+        token = response['X-Resume-Token']
+        response, rows = self.get_jsonl(token=token)
+        self.assertEqual(rows, [])
+        self.assertEqual(response['X-Resume-Token'], token)
+
+        self.events[0].title = 'edited'
+        self.events[0].save()
+        response, rows = self.get_jsonl(token=token)
+        self.assertEqual([row['title'] for row in rows], ['edited'])
+
+    def test_jsonl_bad_parameters(self):
+        """Check that bad tokens and limits receive an HTTP 400 error."""
+        for params in ({'token': 'bogus'}, {'limit': 0}, {'limit': 'ten'},
+                       {'limit': 10 ** 6}):
+            response, _ = self.get_jsonl(**params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_atom_resume(self):
+        """Check that the Atom feed resumes from its next link."""
+        titles, next_href = self.get_atom()
+        self.assertEqual(titles, [event.title for event in self.events])
+        token = next_href.split('token=')[1]
+
+        create_event(title='new')
+        titles, resumed_href = self.get_atom(token=token)
+        self.assertEqual(titles, ['new'])
+
+        titles, same_href = self.get_atom(
+            token=resumed_href.split('token=')[1])
+        self.assertEqual(titles, [])
+        self.assertEqual(same_href, resumed_href)
+
+    def test_tokens_are_shared(self):
+        """Check that a JSON-lines token resumes the Atom feed."""
+        response, _ = self.get_jsonl(limit=4)
+        titles, _ = self.get_atom(token=response['X-Resume-Token'])
+        self.assertEqual(titles, [self.events[4].title])
+
+
+@override_settings(MAJOR_EVENT_LOG_OAI_BATCH_SIZE=2)
+class TestOAIPMH(TestCase):
+    """Test the OAI-PMH provider."""
+
+    namespaces = {'oai': 'http://www.openarchives.org/OAI/2.0/',
+                  'premis': 'info:lc/xmlns/premis-v2'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.events = [create_event(title=str(i)) for i in range(5)]
+
+    def oai(self, **params):
+        response = self.client.get(reverse('major-event-log:oai'), params)
+        self.assertEqual(response.status_code, 200)
+        return etree.fromstring(b''.join(response.streaming_content))
+
+    def xpath(self, document, path):
+        return document.xpath(path, namespaces=self.namespaces)
+
+    def error_code(self, document):
+        codes = self.xpath(document, '/oai:OAI-PMH/oai:error/@code')
+        return codes[0] if codes else None
+
+    def identifier(self, event):
+        return 'oai:testserver:{0}'.format(event.id)
+
+    def test_identify(self):
+        """Check the Identify response."""
+        document = self.oai(verb='Identify')
+        self.assertEqual(self.xpath(
+            document, '//oai:Identify/oai:granularity/text()'),
+            ['YYYY-MM-DDThh:mm:ssZ'])
+        self.assertEqual(self.xpath(
+            document, '//oai:Identify/oai:protocolVersion/text()'), ['2.0'])
+
+    def test_identify_reads_before_streaming(self):
+        """Check that Identify fails before its response streams."""
+        with mock.patch('major_event_log.oai.all_events',
+                        side_effect=DatabaseError('down')):
+            with self.assertRaises(DatabaseError):
+                self.client.get(reverse('major-event-log:oai'),
+                                {'verb': 'Identify'})
+
+    def test_list_metadata_formats(self):
+        """Check that the premis metadata format is listed."""
+        document = self.oai(verb='ListMetadataFormats',
+                            identifier=self.identifier(self.events[0]))
+        self.assertEqual(self.xpath(
+            document, '//oai:metadataFormat/oai:metadataPrefix/text()'),
+            ['premis'])
+
+    def test_list_records_with_resumption(self):
+        """Check that the resumption tokens walk the whole list."""
+        seen = []
+        document = self.oai(verb='ListRecords', metadataPrefix='premis')
+        while True:
+            seen += self.xpath(document, '//premis:eventIdentifierValue/text()')
+            token = self.xpath(document, '//oai:resumptionToken/text()')
+            if not token:
+                break
+            document = self.oai(verb='ListRecords', resumptionToken=token[0])
+        self.assertEqual(seen, [str(event.id) for event in self.events])
+        # The last batch of the list ends with an empty token.
+        self.assertEqual(len(self.xpath(document, '//oai:resumptionToken')), 1)
+
+    def test_list_identifiers(self):
+        """Check that ListIdentifiers returns headers only."""
+        document = self.oai(verb='ListIdentifiers', metadataPrefix='premis')
+        self.assertEqual(
+            self.xpath(document, '//oai:header/oai:identifier/text()'),
+            [self.identifier(event) for event in self.events[:2]])
+        self.assertEqual(self.xpath(document, '//oai:metadata'), [])
+
+    def test_list_from_until(self):
+        """Check that from and until select by modification time."""
+        Event.objects.filter(pk=self.events[0].pk).update(
+            entry_modified=datetime.datetime(
+                2001, 1, 1, 12, tzinfo=datetime.timezone.utc))
+        document = self.oai(verb='ListIdentifiers', metadataPrefix='premis',
+                            until='2001-01-01')
+        self.assertEqual(
+            self.xpath(document, '//oai:header/oai:identifier/text()'),
+            [self.identifier(self.events[0])])
+        document = self.oai(verb='ListIdentifiers', metadataPrefix='premis',
+                            **{'from': '2001-01-01T12:00:01Z',
+                               'until': '2001-12-31T00:00:00Z'})
+        self.assertEqual(self.error_code(document), 'noRecordsMatch')
+
+    def test_get_record(self):
+        """Check that GetRecord returns the PREMIS record."""
+        document = self.oai(verb='GetRecord', metadataPrefix='premis',
+                            identifier=self.identifier(self.events[3]))
+        self.assertEqual(
+            self.xpath(document, '//premis:eventIdentifierValue/text()'),
+            [str(self.events[3].id)])
+
+    def test_errors(self):
+        """Check the error conditions."""
+        cases = [
+            ({}, 'badVerb'),
+            ({'verb': 'Explode'}, 'badVerb'),
+            ({'verb': 'ListRecords'}, 'badArgument'),
+            ({'verb': 'ListRecords', 'metadataPrefix': 'premis',
+              'from': 'yesterday'}, 'badArgument'),
+            ({'verb': 'ListRecords', 'metadataPrefix': 'premis',
+              'from': '2001-01-01', 'until': '2001-01-01T00:00:00Z'},
+             'badArgument'),
+            ({'verb': 'ListRecords', 'metadataPrefix': 'oai_dc'},
+             'cannotDisseminateFormat'),
+            ({'verb': 'ListRecords', 'resumptionToken': 'bogus'},
+             'badResumptionToken'),
+            ({'verb': 'ListSets'}, 'noSetHierarchy'),
+            ({'verb': 'GetRecord', 'metadataPrefix': 'premis',
+              'identifier': 'oai:testserver:abc'}, 'idDoesNotExist'),
+            ({'verb': 'GetRecord', 'metadataPrefix': 'premis',
+              'identifier': 'oai:testserver:{0}'.format(uuid.uuid4())},
+             'idDoesNotExist'),
+        ]
+        for params, code in cases:
+            self.assertEqual(self.error_code(self.oai(**params)), code,
+                             params)
+
+    def test_malformed_tokens(self):
+        """Check that tokens with arguments of the wrong type or an
+        undecodable cursor are reported as bad resumption tokens.
+        """
+        document = self.oai(verb='ListRecords', metadataPrefix='premis')
+        token = self.xpath(document, '//oai:resumptionToken/text()')[0]
+        data = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        cases = [
+            [data],
+            dict(data, metadataPrefix=['premis']),
+            dict(data, cursor={'a': 1}),
+            dict(data, cursor='bogus'),
+            dict(data, set='all'),
+        ]
+        for case in cases:
+            token = base64.urlsafe_b64encode(
+                json.dumps(case).encode('utf-8')).decode('ascii')
+            document = self.oai(verb='ListRecords', resumptionToken=token)
+            self.assertEqual(self.error_code(document), 'badResumptionToken',
+                             case)
+
+    def test_post(self):
+        """Check that requests can be sent with POST."""
+        response = self.client.post(reverse('major-event-log:oai'),
+                                    {'verb': 'Identify'})
+        document = etree.fromstring(b''.join(response.streaming_content))
+        self.assertEqual(len(self.xpath(document, '//oai:Identify')), 1)
+
+
+@override_settings(MAJOR_EVENT_LOG_INGEST_TOKENS=['secret'],
+                   MAJOR_EVENT_LOG_INGEST_BATCH_SIZE=2)
+class TestIngest(TestCase):
+    """Test the bulk ingest endpoint and the load_events command."""
+
+    def record(self, title='ingested', **fields):
+        record = {'title': title, 'detail': 'none', 'outcome': 'Success',
+                  'outcome_detail': 'none', 'date': '2001-02-03T04:05:06Z',
+                  'contact_name': 'John Doe',
+                  'contact_email': 'admin@email.com'}
+        record.update(fields)
+        return record
+
+    def jsonl(self, records):
+        return ''.join(json.dumps(record) + '\n' for record in records)
+
+    def ingest(self, body, content_type='application/x-ndjson', token='secret',
+               **extra):
+        if token:
+            extra['HTTP_AUTHORIZATION'] = 'Bearer ' + token
+        return self.client.post(reverse('major-event-log:ingest'), body,
+                                content_type=content_type, **extra)
+
+    def test_ingest_jsonl(self):
+        """Check that JSON lines are created in batches."""
+        records = [self.record(title=str(i)) for i in range(5)]
+        response = self.ingest(self.jsonl(records))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(),
+                         {'created': 5, 'skipped': 0, 'batches': 3})
+        self.assertEqual(sorted(Event.objects.values_list('title', flat=True)),
+                         ['0', '1', '2', '3', '4'])
+        self.assertTrue(Event.objects.get(title='0').is_success())
+
+    def test_ingest_requires_token(self):
+        """Check that ingest is refused without a known bearer token."""
+        body = self.jsonl([self.record()])
+        self.assertEqual(self.ingest(body, token=None).status_code, 401)
+        self.assertEqual(self.ingest(body, token='wrong').status_code, 401)
+        with override_settings(MAJOR_EVENT_LOG_INGEST_TOKENS=[]):
+            self.assertEqual(self.ingest(body).status_code, 401)
+        self.assertFalse(Event.objects.exists())
+
+    def test_ingest_idempotency_key(self):
+        """Check that a retried request doesn't create the events again."""
+        body = self.jsonl([self.record(title=str(i)) for i in range(3)])
+        first = self.ingest(body, HTTP_IDEMPOTENCY_KEY='load-1')
+        retry = self.ingest(body, HTTP_IDEMPOTENCY_KEY='load-1')
+        self.assertEqual(first.json()['created'], 3)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(),
+                         {'created': 0, 'skipped': 3, 'batches': 2})
+        self.assertEqual(Event.objects.count(), 3)
+        self.assertEqual(IngestBatch.objects.count(), 2)
+
+    def test_ingest_invalid_record(self):
+        """Check that an invalid record rejects the whole request."""
+        records = [self.record(), self.record(contact_email='nobody'),
+                   self.record()]
+        response = self.ingest(self.jsonl(records))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['line'], 2)
+        self.assertIn('contact_email', response.json()['error'])
+        response = self.ingest('{"title": \n')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Event.objects.exists())
+
+    def test_ingest_values_of_wrong_type(self):
+        """Check that values of the wrong JSON type are reported with
+        their line rather than failing the request.
+        """
+        for fields in ({'date': 5}, {'date': ['2001-02-03']},
+                       {'date': {'year': 2001}}, {'title': 7},
+                       {'outcome': ['Success']}, {'id': 12},
+                       {'contact_email': {'a': 1}}):
+            response = self.ingest(self.jsonl([self.record(), self.record(
+                **fields)]))
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['line'], 2)
+            self.assertIn(next(iter(fields)), response.json()['error'])
+        self.assertFalse(Event.objects.exists())
+
+    def test_ingest_premis_defaults(self):
+        """Check that query parameters only fill in the allowed fields."""
+        event = create_event(title='original')
+        body = serializers.serialize_premis(event)
+        Event.objects.filter(pk=event.pk).delete()
+        response = self.ingest(
+            body, content_type='application/xml',
+            QUERY_STRING='contact_email=admin@email.com&'
+                         'entry_created=2000-01-01')
+        self.assertEqual(response.status_code, 201)
+        copied = Event.objects.get(pk=event.pk)
+        self.assertGreater(copied.entry_created, event.entry_created)
+        self.assertEqual(copied.title, event.detail[:100])
+
+    def test_ingest_existing_id(self):
+        """Check that reusing an existing id is a conflict."""
+        event = create_event()
+        response = self.ingest(self.jsonl([self.record(id=str(event.id))]))
+        self.assertEqual(response.status_code, 409)
+
+    def test_ingest_conflict_after_batches(self):
+        """Check that a conflict reports the batches already written."""
+        event = create_event()
+        records = [self.record(title=str(i)) for i in range(3)]
+        records.append(self.record(id=str(event.id)))
+        response = self.ingest(self.jsonl(records))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(response.json()['batch'], 1)
+        self.assertEqual(Event.objects.count(), 3)
+
+    def test_ingest_invalid_idempotency_key(self):
+        """Check that long or unprintable keys are refused."""
+        for key in ('k' * 250, 'bad\tkey'):
+            response = self.ingest(self.jsonl([self.record()]),
+                                   HTTP_IDEMPOTENCY_KEY=key)
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Event.objects.exists())
+        self.assertFalse(IngestBatch.objects.exists())
+
+    def test_ingest_premis(self):
+        """Check that PREMIS records round trip through ingest."""
+        event = create_event(title='original')
+        body = serializers.serialize_premis(event)
+        Event.objects.filter(pk=event.pk).delete()
+        response = self.ingest(
+            body, content_type='application/xml',
+            QUERY_STRING='title=copied&contact_email=admin@email.com')
+        self.assertEqual(response.status_code, 201)
+        copied = Event.objects.get(pk=event.pk)
+        self.assertEqual(copied.title, 'copied')
+        self.assertEqual(copied.contact_name, event.contact_name)
+        self.assertEqual(copied.outcome, event.outcome)
+
+    def test_ingest_unsupported_type(self):
+        """Check that other content types are refused."""
+        response = self.ingest('title=x', content_type='text/plain')
+        self.assertEqual(response.status_code, 415)
+
+    def test_command(self):
+        """Check that the command loads a file in batches."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'events.jsonl')
+            with open(path, 'w') as events:
+                events.write(self.jsonl(
+                    [self.record(title=str(i)) for i in range(3)]))
+            out = io.StringIO()
+            call_command('load_events', path, '--batch-size', '2',
+                         '--idempotency-key', 'file', stdout=out)
+            call_command('load_events', path, '--batch-size', '2',
+                         '--idempotency-key', 'file', stdout=out)
+        self.assertIn('Created 3 events', out.getvalue())
+        self.assertIn('skipped 3', out.getvalue())
+        self.assertEqual(Event.objects.count(), 3)
+
+    def test_command_invalid_record(self):
+        """Check that the command reports the line of an invalid record."""
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as events:
+            events.write(self.jsonl([self.record(outcome='Maybe')]))
+            events.flush()
+            with self.assertRaisesMessage(CommandError, 'Line 1'):
+                call_command('load_events', events.name)
+
+
+class TestEventExport(TestCase):
+    """Test the export_events management command."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.events = [create_event(title=str(i),
+                                   outcome='Failure' if i == 3 else 'Success')
+                      for i in range(5)]
+        base = timezone.now() - datetime.timedelta(days=10)
+        for day, event in enumerate(cls.events):
+            Event.objects.filter(pk=event.pk).update(
+                date=base + datetime.timedelta(days=day))
+        cls.middle = base + datetime.timedelta(days=2)
+
+    def export(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('export_events', *args, stdout=out, stderr=err)
+        self.assertIn('Exported', err.getvalue())
+        return out.getvalue()
+
+    def test_jsonl(self):
+        """Check that every event is written as a line of JSON."""
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual([row['id'] for row in rows],
+                         [str(event.id) for event in self.events])
+        self.assertEqual(rows[0]['title'], '0')
+        self.assertEqual(rows[0]['contact_email'], 'admin@email.com')
+
+    def test_csv(self):
+        """Check that the CSV has a header and a row per event."""
+        rows = list(csv.DictReader(io.StringIO(self.export('--format',
+                                                           'csv'))))
+        self.assertEqual([row['id'] for row in rows],
+                         [str(event.id) for event in self.events])
+        self.assertEqual(
+            datetime.datetime.fromisoformat(rows[0]['date']),
+            Event.objects.get(pk=self.events[0].pk).date)
+
+    def test_filters(self):
+        """Check that the date and outcome filters select the events."""
+        lines = self.export('--since', self.middle.isoformat(),
+                            '--outcome', 'success')
+        self.assertEqual([json.loads(line)['title']
+                          for line in lines.splitlines()], ['2', '4'])
+        lines = self.export('--until', self.middle.isoformat(),
+                            '--outcome', Event.SUCCESS)
+        self.assertEqual(len(lines.splitlines()), 2)
+
+    def test_gzip_file(self):
+        """Check that the command writes a gzip file."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'events.csv.gz')
+            self.export('--format', 'csv', '--gzip', '-o', path)
+            with gzip.open(path, 'rt') as export:
+                self.assertEqual(len(list(csv.DictReader(export))), 5)
+
+    def test_bad_arguments(self):
+        """Check that the command rejects invalid filters."""
+        with self.assertRaises(CommandError):
+            self.export('--outcome', 'maybe')
+        with self.assertRaises(CommandError):
+            self.export('--since', 'yesterday')
+        with self.assertRaisesMessage(CommandError, 'binary data'):
+            self.export('--gzip')
+
+
+class TestCounts(TestCase):
+    """Test the maintained event counts and the counting paginator."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.events = [create_event(outcome='Failure' if i % 3 else 'Success')
+                      for i in range(12)]
+        cls.user = User.objects.create_superuser(
+            'admin', 'admin@email.com', 'password')
+
+    def counter(self):
+        return EventCounter.objects.get(name=counts.TOTAL_COUNTER).count
+
+    def count_queries(self, queries):
+        return [query['sql'] for query in queries
+                if 'COUNT(' in query['sql'].upper() and
+                'major_event_log_event' in query['sql']]
+
+    def test_counter_follows_events(self):
+        """Check that saves, deletes and bulk loads adjust the counter."""
+        self.assertEqual(self.counter(), 12)
+        create_event()
+        self.assertEqual(self.counter(), 13)
+        self.events[0].save()
+        self.assertEqual(self.counter(), 13)
+        Event.objects.filter(pk__in=[e.pk for e in self.events[:3]]).delete()
+        self.assertEqual(self.counter(), 10)
+        ingest.load_events([Event(**{
+            field: getattr(self.events[3], field) for field in
+            ('title', 'detail', 'outcome', 'outcome_detail', 'date',
+             'agent')}) for _ in range(4)])
+        self.assertEqual(self.counter(), 14)
+
+    def test_missing_counter_is_counted(self):
+        """Check that a missing counter is answered with an exact count,
+        without being created from it, and that writes don't create it.
+        """
+        EventCounter.objects.filter(name=counts.TOTAL_COUNTER).delete()
+        self.assertEqual(counts.count_events(Event.objects.all()), 12)
+        create_event()
+        self.assertFalse(EventCounter.objects.filter(
+            name=counts.TOTAL_COUNTER).exists())
+        self.assertEqual(counts.count_events(Event.objects.all()), 13)
+        call_command('rebuild_event_counters', stdout=io.StringIO())
+        self.assertEqual(self.counter(), 13)
+
+    def test_rebuild_command(self):
+        """Check that the command corrects a drifted counter."""
+        EventCounter.objects.update(count=3)
+        out = io.StringIO()
+        call_command('rebuild_event_counters', stdout=out)
+        self.assertEqual(self.counter(), 12)
+        self.assertIn('events: 12', out.getvalue())
+
+    def test_filtered_count_is_exact(self):
+        """Check that filtered querysets are counted, not looked up."""
+        EventCounter.objects.update(count=1000)
+        self.assertEqual(counts.count_events(
+            Event.objects.filter(outcome=Event.SUCCESS)), 4)
+        self.assertEqual(counts.count_events(Event.objects.all()), 1000)
+
+    @override_settings(MAJOR_EVENT_LOG_COUNT_PROVIDER=(
+        'major_event_log.counts.ExactCountProvider'))
+    def test_provider_setting(self):
+        """Check that the count provider can be replaced."""
+        EventCounter.objects.update(count=1000)
+        paginator = counts.CountingPaginator(Event.objects.all(), 10)
+        self.assertEqual(paginator.num_pages, 2)
+
+    def test_index_and_feed_skip_count(self):
+        """Check that numbered pages don't count the events table."""
+        for url, params in ((reverse('major-event-log:index'), {'page': 2}),
+                            (reverse('major-event-log:feed'), {'p': 2})):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.count_queries(queries), [], url)
+
+    def test_admin_changelist_skips_count(self):
+        """Check that the unfiltered admin changelist doesn't count."""
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:major_event_log_event_changelist'))
+        self.assertContains(response, '12 events')
+        self.assertEqual(self.count_queries(queries), [])
+
+
+class TestColumnProjection(TestCase):
+    """Test that the list queries only select the columns they show."""
+
+    @classmethod
+    def setUpTestData(cls):
+        [create_event(title=str(i)) for i in range(12)]
+        cls.user = User.objects.create_superuser(
+            'admin', 'admin@email.com', 'password')
+
+    def event_selects(self, queries):
+        return [query['sql'] for query in queries
+                if query['sql'].startswith('SELECT') and
+                'FROM "major_event_log_event"' in query['sql'] and
+                'COUNT(' not in query['sql']]
+
+    def selected_columns(self, sql):
+        columns = sql[len('SELECT '):sql.index(' FROM ')]
+        return {column.strip().split('.')[-1].strip('"')
+                for column in columns.split(',')}
+
+    def get(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return self.event_selects(queries)
+
+    def test_index_columns(self):
+        """Check that the index doesn't load the detail columns."""
+        for params in ({}, {'page': 2}):
+            selects = self.get(reverse('major-event-log:index'), params)
+            self.assertEqual(len(selects), 1, selects)
+            self.assertEqual(self.selected_columns(selects[0]),
+                             {'id', 'title', 'date', 'outcome',
+                              'entry_created'})
+
+    def test_feed_columns(self):
+        """Check that the feeds only load the columns of their items."""
+        for url in (reverse('major-event-log:feed'),
+                    reverse('major-event-log:changes')):
+            selects = self.get(url)
+            columns = [self.selected_columns(sql) for sql in selects]
+            self.assertIn({'id', 'title', 'detail', 'entry_created',
+                           'entry_modified'}, columns, url)
+            for selected in columns:
+                self.assertNotIn('outcome_detail', selected, url)
+                self.assertNotIn('contact_email', selected, url)
+
+    def test_admin_changelist_columns(self):
+        """Check that the changelist only loads the displayed columns."""
+        self.client.force_login(self.user)
+        selects = self.get(reverse('admin:major_event_log_event_changelist'),
+                           {'outcome__exact': Event.SUCCESS})
+        self.assertEqual(len(selects), 1, selects)
+        self.assertEqual(self.selected_columns(selects[0]),
+                         {'id', 'title', 'date', 'entry_created', 'outcome'})
+
+
+class TestEventRecords(TestCase):
+    """Test the read-only event records."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.events = [create_event(title=str(i),
+                                   outcome='Failure' if i % 2 else 'Success')
+                      for i in range(5)]
+
+    def test_record_matches_event(self):
+        """Check that a record offers the same values and helpers."""
+        event = Event.objects.get(pk=self.events[1].pk)
+        record = as_records(Event.objects.filter(pk=event.pk)).get()
+        self.assertIsInstance(record, EventRecord)
+        self.assertEqual(record, event)
+        for name in ('id', 'pk', 'title', 'date', 'contact_email'):
+            self.assertEqual(getattr(record, name), getattr(event, name))
+        self.assertEqual(record.is_success(), event.is_success())
+        self.assertEqual(record.get_outcome_display(),
+                         event.get_outcome_display())
+        self.assertEqual(record.get_absolute_url(), event.get_absolute_url())
+        self.assertEqual(str(record), str(event))
+
+    def test_record_is_read_only(self):
+        """Check that records can't be changed."""
+        record = EventRecord.from_row(('id', 'title'), (uuid.uuid4(), 'a'))
+        with self.assertRaises(AttributeError):
+            record.title = 'b'
+        with self.assertRaises(AttributeError):
+            record.detail
+        self.assertIs(copy.deepcopy(record), record)
+
+    def test_serializers_accept_records(self):
+        """Check that records serialize exactly like events."""
+        event = Event.objects.get(pk=self.events[0].pk)
+        record = as_records(Event.objects.filter(pk=event.pk)).get()
+        self.assertEqual(serializers.serialize_premis(record),
+                         serializers.serialize_premis(event))
+        self.assertEqual(serializers.serialize_atom(record, 'http://x/'),
+                         serializers.serialize_atom(event, 'http://x/'))
+
+    def test_records_paginate(self):
+        """Check that record querysets page like event querysets."""
+        records = as_records(Event.objects.all(), ('id', 'entry_created'))
+        paginator = CursorPaginator(records, 2)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        self.assertEqual([record.pk for record in list(first) + list(second)],
+                         [event.pk for event in reversed(self.events[1:])])
+
+    def test_feed_items_are_records(self):
+        """Check that the feed builds records rather than events."""
+        request = RequestFactory().get('/')
+        feed = feeds.LatestEventsFeed()
+        feed.get_object(request)
+        items = list(feed.items(None))
+        self.assertEqual(len(items), 5)
+        self.assertTrue(all(isinstance(item, EventRecord) for item in items))
+
+
+class TestEventIds(TestCase):
+    """Test the version 4 and time-ordered version 7 event ids."""
+
+    def test_uuid7(self):
+        """Check the layout and ordering of version 7 UUIDs."""
+        before = int(timezone.now().timestamp() * 1000)
+        ids = [uuids.uuid7() for _ in range(5000)]
+        for value in ids[:10]:
+            self.assertEqual(value.version, 7)
+            self.assertEqual(value.variant, uuid.RFC_4122)
+            self.assertGreaterEqual(value.int >> 80, before)
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_default_is_uuid4(self):
+        """Check that events get version 4 ids unless configured."""
+        self.assertEqual(create_event().id.version, 4)
+
+    @override_settings(MAJOR_EVENT_LOG_UUID_VERSION=7)
+    def test_uuid7_setting(self):
+        """Check that events get version 7 ids when configured."""
+        events = [create_event() for _ in range(3)]
+        self.assertEqual([event.id.version for event in events], [7, 7, 7])
+        self.assertEqual(views.get_event_or_404(str(events[0].id)),
+                         events[0])
+        response = self.client.get(events[1].get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+
+
+class TestSearch(TestCase):
+    """Test full-text search of the index, feed and admin."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixity = create_event(title='Fixity check')
+        cls.fixity.detail = 'Checked the fixity of the storage array.'
+        cls.fixity.save()
+        cls.migration = create_event(title='Storage migration')
+        cls.migration.detail = 'Moved every file to the new storage.'
+        cls.migration.outcome_detail = 'Fixity verified after the move.'
+        cls.migration.save()
+        cls.others = [create_event(title='Other {0}'.format(i))
+                      for i in range(12)]
+        cls.user = User.objects.create_superuser(
+            'admin', 'admin@email.com', 'password')
+
+    def search(self, query, queryset=None):
+        if queryset is None:
+            queryset = Event.objects.all()
+        return list(search.search_events(queryset, query))
+
+    def test_sqlite_backend(self):
+        """Check that the test database searches with FTS5."""
+        self.assertIsInstance(search.get_search_backend(),
+                              search.SQLiteSearchBackend)
+
+    def test_search_ranks_matches(self):
+        """Check that matches in any field are found, best first."""
+        self.assertEqual(self.search('storage migration'), [self.migration])
+        self.assertEqual(self.search('fixity'),
+                         [self.fixity, self.migration])
+        self.assertEqual(self.search('fixity')[0].search_rank,
+                         min(event.search_rank
+                             for event in self.search('fixity')))
+        self.assertEqual(self.search('nothing'), [])
+        self.assertEqual(self.search('   '), [])
+
+    def test_search_ignores_query_syntax(self):
+        """Check that FTS5 operators in a query are taken as words."""
+        self.assertEqual(self.search('"storage" (migration*'),
+                         [self.migration])
+        self.assertEqual(self.search('NEAR("'), [])
+
+    def test_index_follows_events(self):
+        """Check that the index is updated on save, delete and ingest."""
+        self.others[0].title = 'Quarantine'
+        self.others[0].save()
+        self.assertEqual(self.search('quarantine'), [self.others[0]])
+        self.assertEqual(self.search('other 0'), [])
+        self.others[0].delete()
+        self.assertEqual(self.search('quarantine'), [])
+        event = Event(title='Bulk quarantine', detail='none',
+                      outcome=Event.SUCCESS, outcome_detail='none',
+                      date=timezone.now(),
+                      agent=Agent(name='John Doe', email='admin@email.com'))
+        ingest.load_events([event])
+        self.assertEqual(self.search('quarantine'), [event])
+
+    @override_settings(MAJOR_EVENT_LOG_SEARCH_BACKEND=(
+        'major_event_log.search.BasicSearchBackend'))
+    def test_basic_backend(self):
+        """Check the substring search backend."""
+        self.assertEqual(self.search('FIXITY'),
+                         [self.migration, self.fixity])
+        self.assertEqual(self.search('stor migr'), [self.migration])
+
+    def test_rows_removed_by_index(self):
+        """Check that the rows of an event are found through the indexed
+        mapping of event ids, and removed with the event.
+        """
+        ids = [search._hex(self.fixity.pk)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'EXPLAIN QUERY PLAN SELECT fts_rowid FROM {0} '
+                'WHERE event_id IN (%s)'.format(search.FTS_IDS_TABLE), ids)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('USING', plan)
+        self.assertNotIn('SCAN', plan)
+        self.fixity.delete()
+
+        def count(table):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT COUNT(*) FROM {0}'.format(table))
+                return cursor.fetchone()[0]
+
+        self.assertEqual(count(search.FTS_TABLE), Event.objects.count())
+        self.assertEqual(count(search.FTS_IDS_TABLE), Event.objects.count())
+
+    def test_rebuild_command(self):
+        """Check that the command rebuilds the index."""
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {0}'.format(search.FTS_TABLE))
+        self.assertEqual(self.search('fixity'), [])
+        out = io.StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 14 events', out.getvalue())
+        self.assertEqual(len(self.search('fixity')), 2)
+
+    def test_index_view(self):
+        """Check that the index searches with q and keeps it in links."""
+        response = self.client.get(reverse('major-event-log:index'),
+                                   {'q': 'fixity'})
+        self.assertEqual(list(response.context['events']),
+                         [self.fixity, self.migration])
+        self.assertContains(response, "value='fixity'")
+        response = self.client.get(reverse('major-event-log:index'),
+                                   {'q': 'other'})
+        self.assertEqual(response.context['paginator'].count, 12)
+        self.assertContains(response, '?page=2&amp;q=other')
+        response = self.client.get(reverse('major-event-log:index'),
+                                   {'q': 'nothing'})
+        self.assertContains(response, 'No events match your search.')
+
+    def test_feed(self):
+        """Check that the feed searches with q and keeps it in links."""
+        response = self.client.get(reverse('major-event-log:feed'),
+                                   {'q': 'other'})
+        document = etree.fromstring(response.content)
+        namespaces = {'atom': 'http://www.w3.org/2005/Atom'}
+        self.assertEqual(len(document.xpath('//atom:entry',
+                                            namespaces=namespaces)), 10)
+        next_link, = document.xpath('//atom:link[@rel="next"]/@href',
+                                    namespaces=namespaces)
+        self.assertTrue(next_link.endswith('/feed/?p=2&q=other'))
+
+    def test_admin_search(self):
+        """Check that the admin changelist searches every text field,
+        best match first unless a column is sorted.
+        """
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('admin:major_event_log_event_changelist'),
+            {'q': 'storage'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         self.search('storage'))
+        self.assertEqual(self.search('storage'),
+                         [self.migration, self.fixity])
+        response = self.client.get(
+            reverse('admin:major_event_log_event_changelist'),
+            {'q': 'storage', 'o': '1'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.fixity, self.migration])
+
+
+class TestFacets(TestCase):
+    """Test the facet filters and their maintained counts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.events = [
+            create_event(title=str(i),
+                         outcome='Failure' if i % 3 == 0 else 'Success',
+                         name='Jane Doe' if i % 2 else 'John Doe')
+            for i in range(8)]
+        for event in cls.events[:3]:
+            event.date = datetime.datetime(2001, 6, 1,
+                                           tzinfo=datetime.timezone.utc)
+            event.save()
+        cls.year = timezone.now().year
+        cls.jane = Agent.objects.get(name='Jane Doe')
+        cls.john = Agent.objects.get(name='John Doe')
+        cls.jim = Agent.objects.create(name='Jim Doe', email='admin@email.com')
+
+    def count(self, facet, value):
+        try:
+            return EventCounter.objects.get(
+                name=facets.counter_name(facet, value)).count
+        except EventCounter.DoesNotExist:
+            return 0
+
+    def titles(self, response):
+        return sorted(event.title for event in response.context['events'])
+
+    def test_counts_follow_events(self):
+        """Check that creates, changes and deletes adjust the counts."""
+        self.assertEqual(self.count('outcome', Event.FAILURE), 3)
+        self.assertEqual(self.count('outcome', Event.SUCCESS), 5)
+        self.assertEqual(self.count('year', 2001), 3)
+        self.assertEqual(self.count('year', self.year), 5)
+        self.assertEqual(self.count('agent', self.jane.pk), 4)
+
+        event = self.events[0]
+        event.outcome = Event.SUCCESS
+        event.agent = self.jim
+        event.save()
+        self.assertEqual(self.count('outcome', Event.FAILURE), 2)
+        self.assertEqual(self.count('outcome', Event.SUCCESS), 6)
+        self.assertEqual(self.count('agent', self.john.pk), 3)
+        self.assertEqual(self.count('agent', self.jim.pk), 1)
+
+        event.delete()
+        self.assertEqual(self.count('agent', self.jim.pk), 0)
+        self.assertEqual(self.count('year', 2001), 2)
+
+        ingest.load_events([Event(
+            title='bulk', detail='none', outcome=Event.FAILURE,
+            outcome_detail='none', agent=self.jim,
+            date=datetime.datetime(2001, 1, 1, 12,
+                                   tzinfo=datetime.timezone.utc))])
+        self.assertEqual(self.count('agent', self.jim.pk), 1)
+        self.assertEqual(self.count('year', 2001), 3)
+
+    def test_rebuild(self):
+        """Check that the rebuild command restores drifted counts."""
+        Event.objects.filter(pk=self.events[1].pk).update(agent=self.jim)
+        call_command('rebuild_event_counters', stdout=io.StringIO())
+        self.assertEqual(self.count('agent', self.jim.pk), 1)
+        self.assertEqual(self.count('agent', self.jane.pk), 3)
+        self.assertEqual(self.count('outcome', Event.FAILURE), 3)
+
+    def test_index_filters(self):
+        """Check the outcome, date range and agent filters of the index."""
+        url = reverse('major-event-log:index')
+        response = self.client.get(url, {'outcome': 'failure'})
+        self.assertEqual(self.titles(response), ['0', '3', '6'])
+        response = self.client.get(url, {'since': '2001-01-01',
+                                         'until': '2002-01-01',
+                                         'agent': self.john.pk})
+        self.assertEqual(self.titles(response), ['0', '2'])
+        response = self.client.get(url, {'agent': 'John Doe'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {'agent': '9' * 30})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {'outcome': 'maybe'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sidebar(self):
+        """Check that the sidebar is read from the counters."""
+        url = reverse('major-event-log:index')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'outcome': 'success',
+                                             'q': 'doe'})
+        for query in queries:
+            self.assertNotIn('GROUP BY', query['sql'])
+        sidebar = response.context['facets']
+        self.assertEqual(
+            [(item['label'], item['count'], item['active'])
+             for item in sidebar['outcome']],
+            [('Failure', 3, False), ('Success', 5, True)])
+        self.assertEqual([(item['label'], item['count'])
+                          for item in sidebar['year']],
+                         [(str(self.year), 5), ('2001', 3)])
+        self.assertEqual([(item['label'], item['value'])
+                          for item in sidebar['agent']],
+                         [('Jane Doe', str(self.jane.pk)),
+                          ('John Doe', str(self.john.pk))])
+        self.assertEqual(sidebar['year'][1]['url'],
+                         '?outcome=success&q=doe&since=2001-01-01'
+                         '&until=2002-01-01')
+        self.assertContains(response, "name='outcome' value='success'")
+        self.assertContains(response, 'Clear filters')
+        self.assertContains(response, 'Counts are of the whole log')
+        self.assertNotContains(self.client.get(url),
+                               'Counts are of the whole log')
+
+    def test_feed_filters(self):
+        """Check that the feed filters and keeps the filters in links."""
+        response = self.client.get(reverse('major-event-log:feed'),
+                                   {'agent': self.jane.pk, 'outcome': 'success'})
+        document = etree.fromstring(response.content)
+        namespaces = {'atom': 'http://www.w3.org/2005/Atom'}
+        self.assertEqual(
+            sorted(document.xpath('//atom:entry/atom:title/text()',
+                                  namespaces=namespaces)),
+            ['1', '5', '7'])
+        first_link, = document.xpath('//atom:link[@rel="first"]/@href',
+                                     namespaces=namespaces)
+        self.assertTrue(first_link.endswith(
+            '/feed/?outcome=success&agent={0}'.format(self.jane.pk)))
+        response = self.client.get(reverse('major-event-log:feed'),
+                                   {'until': 'soon'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestRollups(TestCase):
+    """Test the daily rollups and the statistics read from them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        dates = [datetime.datetime(2001, 1, day, 12,
+                                   tzinfo=datetime.timezone.utc)
+                 for day in (1, 1, 2, 20)]
+        dates += [datetime.datetime(2001, 2, 3, 12,
+                                    tzinfo=datetime.timezone.utc)] * 2
+        cls.events = []
+        for i, date in enumerate(dates):
+            event = create_event(title=str(i),
+                                 outcome='Failure' if i % 2 else 'Success',
+                                 name='Jane Doe' if i < 4 else 'John Doe')
+            event.date = date
+            event.save()
+            cls.events.append(event)
+
+    def rollups(self):
+        rollups = EventRollup.objects.select_related('agent')
+        return {(rollup.day.isoformat(), rollup.get_outcome_display(),
+                 rollup.agent.name): rollup.count
+                for rollup in rollups.filter(count__gt=0)}
+
+    def test_rollups_follow_events(self):
+        """Check that creates, changes and deletes adjust the rollups."""
+        self.assertEqual(self.rollups(), {
+            ('2001-01-01', 'Success', 'Jane Doe'): 1,
+            ('2001-01-01', 'Failure', 'Jane Doe'): 1,
+            ('2001-01-02', 'Success', 'Jane Doe'): 1,
+            ('2001-01-20', 'Failure', 'Jane Doe'): 1,
+            ('2001-02-03', 'Success', 'John Doe'): 1,
+            ('2001-02-03', 'Failure', 'John Doe'): 1,
+        })
+        self.events[1].outcome = Event.SUCCESS
+        self.events[1].save()
+        self.events[2].delete()
+        rollups = self.rollups()
+        self.assertEqual(rollups[('2001-01-01', 'Success', 'Jane Doe')], 2)
+        self.assertNotIn(('2001-01-01', 'Failure', 'Jane Doe'), rollups)
+        self.assertNotIn(('2001-01-02', 'Success', 'Jane Doe'), rollups)
+
+    def test_rebuild_command(self):
+        """Check that the command recounts drifted rollups."""
+        expected = self.rollups()
+        EventRollup.objects.update(count=7)
+        out = io.StringIO()
+        call_command('rebuild_event_rollups', stdout=out)
+        self.assertEqual(self.rollups(), expected)
+        self.assertIn('Rebuilt 6 rollups', out.getvalue())
+
+    def test_stats_json(self):
+        """Check the statistics and that they only read the rollups."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('major-event-log:stats_json'))
+        for query in queries:
+            self.assertNotIn('"major_event_log_event"', query['sql'])
+        self.assertEqual(response.json(), {
+            'total': 6,
+            'outcomes': {'Success': 3, 'Failure': 3},
+            'months': [
+                {'month': '2001-01', 'events': 4, 'failures': 2},
+                {'month': '2001-02', 'events': 2, 'failures': 1},
+            ],
+            'agents': [
+                {'id': self.events[0].agent_id, 'name': 'Jane Doe',
+                 'events': 4, 'failures': 2},
+                {'id': self.events[4].agent_id, 'name': 'John Doe',
+                 'events': 2, 'failures': 1},
+            ],
+        })
+
+    def test_stats_period(self):
+        """Check that since and until select days of the rollups."""
+        response = self.client.get(reverse('major-event-log:stats_json'),
+                                   {'since': '2001-01-02',
+                                    'until': '2001-02-01'})
+        self.assertEqual(response.json()['total'], 2)
+        response = self.client.get(reverse('major-event-log:stats_json'),
+                                   {'since': 'last week'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_stats_page(self):
+        """Check that the statistics page renders the tables."""
+        response = self.client.get(reverse('major-event-log:stats'))
+        self.assertTemplateUsed(response, 'major-event-log/stats.html')
+        self.assertContains(response, '<td>2001-02</td>')
+        self.assertContains(response, '>Jane Doe</a></td>')
+
+
+class TestAgents(TestCase):
+    """Test the reporting agents shared by events."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.events = [create_event(title=str(i),
+                                   name='Jane Doe' if i % 2 else 'John Doe')
+                      for i in range(5)]
+        cls.jane = cls.events[1].agent
+
+    def test_events_share_agents(self):
+        """Check that events of the same contact share an agent."""
+        self.assertEqual(Agent.objects.count(), 2)
+        self.assertEqual(self.events[3].agent, self.jane)
+        self.assertEqual(self.events[1].contact_name, 'Jane Doe')
+        self.assertEqual(self.events[1].contact_email, 'admin@email.com')
+
+    def test_load_reuses_agents(self):
+        """Check that loaded records are linked to existing agents, and
+        that new agents are created once.
+        """
+        records = [{'title': str(i), 'detail': 'none', 'outcome': 'Success',
+                    'outcome_detail': 'none', 'date': '2001-02-03T04:05:06Z',
+                    'contact_name': name, 'contact_email': 'admin@email.com'}
+                   for i, name in enumerate(['Jane Doe', 'Jim Doe'] * 3)]
+        result = ingest.load_events(ingest.build_events(enumerate(records)),
+                                    batch_size=2)
+        self.assertEqual(result['created'], 6)
+        self.assertEqual(Agent.objects.count(), 3)
+        self.assertEqual(self.jane.events.count(), 5)
+
+    def test_details_read_agent_with_event(self):
+        """Check that the event is read along with its agent."""
+        with self.assertNumQueries(1):
+            event = views.get_event_or_404(str(self.events[1].pk))
+            self.assertEqual(event.contact_name, 'Jane Doe')
+        response = self.client.get(self.events[1].get_absolute_url())
+        self.assertContains(response, self.jane.get_absolute_url())
+
+    def test_agent_events(self):
+        """Check that the agent page lists only the agent's events."""
+        response = self.client.get(self.jane.get_absolute_url())
+        self.assertTemplateUsed(response, 'major-event-log/agent_events.html')
+        self.assertEqual([event.title for event in response.context['events']],
+                         ['3', '1'])
+        response = self.client.get(reverse('major-event-log:agent_events',
+                                           args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(MAJOR_EVENT_LOG_RENDER_CACHE={'LRU_SIZE': 10})
+    def test_rename_renews_records(self):
+        """Check that renaming an agent renews the records and the
+        validators of its events, and leaves other events alone.
+        """
+        event, other = self.events[1], self.events[0]
+        url = reverse('major-event-log:event_premis', args=[event.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        modified = Event.objects.get(pk=other.pk).entry_modified
+        self.jane.save()
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.jane.name = 'Jane Roe'
+        self.jane.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Jane Roe', response.content)
+        self.assertEqual(Event.objects.get(pk=other.pk).entry_modified,
+                         modified)
+
+    def test_records_join_agent(self):
+        """Check that records and export rows read the agent fields."""
+        events = Event.objects.filter(pk=self.events[1].pk)
+        record, = as_records(events, ('id', 'contact_name', 'contact_email'))
+        self.assertEqual((record.contact_name, record.contact_email),
+                         ('Jane Doe', 'admin@email.com'))
+        row, = export.event_rows(events, ('contact_name', 'id'))
+        self.assertEqual(row, ('Jane Doe', self.events[1].pk))
+
+
+@override_settings(
+    MIDDLEWARE=['major_event_log.metrics.MetricsMiddleware'] + list(
+        settings.MIDDLEWARE),
+    MAJOR_EVENT_LOG_METRICS_ENDPOINT=True)
+class TestMetrics(TestCase):
+    """Test the request metrics of the views."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.event = create_event()
+
+    def setUp(self):
+        metrics.registry.reset()
+
+    def test_views_are_measured(self):
+        """Check the Server-Timing header and the recorded totals."""
+        urls = {
+            'major-event-log:index': reverse('major-event-log:index'),
+            'major-event-log:event_details': self.event.get_absolute_url(),
+            'major-event-log:event_atom': reverse(
+                'major-event-log:event_atom', args=[self.event.pk]),
+            'major-event-log:event_premis': reverse(
+                'major-event-log:event_premis', args=[self.event.pk]),
+            'major-event-log:feed': reverse('major-event-log:feed'),
+        }
+        for view, url in urls.items():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertRegex(response['Server-Timing'],
+                             r'^db;dur=[\d.]+;desc="{0} queries", '
+                             r'render;dur=[\d.]+, total;dur=[\d.]+$'.format(
+                                 len(queries)))
+            stats = metrics.registry.get_stats()[view]
+            self.assertEqual(stats['requests'], 1)
+            self.assertEqual(stats['queries'], len(queries))
+            self.assertEqual(stats['response_bytes'], len(response.content))
+            self.assertGreater(stats['render_seconds'], 0)
+        self.client.get('/admin/login/')
+        self.assertEqual(set(metrics.registry.get_stats()), set(urls))
+
+    def test_prometheus_endpoint(self):
+        """Check the metrics in the Prometheus text format."""
+        self.client.get(reverse('major-event-log:index'))
+        self.client.get(reverse('major-event-log:index'))
+        response = self.client.get(reverse('major-event-log:metrics'))
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        lines = response.content.decode('utf-8').splitlines()
+        self.assertIn('# TYPE major_event_log_view_requests_total counter',
+                      lines)
+        self.assertIn('major_event_log_view_requests_total'
+                      '{view="major-event-log:index"} 2', lines)
+        self.assertIn('major_event_log_view_request_duration_seconds_bucket'
+                      '{view="major-event-log:index",le="+Inf"} 2', lines)
+        with override_settings(MAJOR_EVENT_LOG_METRICS_ENDPOINT=False):
+            response = self.client.get(reverse('major-event-log:metrics'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_decorator(self):
+        """Check that a decorated view is measured once, under its path."""
+        view = metrics.instrument_view(views.about)
+        request = RequestFactory().get('/')
+        with override_settings(MAJOR_EVENT_LOG_SERVER_TIMING=False):
+            response = view(request)
+        self.assertFalse(response.has_header('Server-Timing'))
+        stats = metrics.registry.get_stats()
+        self.assertEqual(stats['major_event_log.views.about']['requests'], 1)
+        with metrics.measuring():
+            view(request)
+        stats = metrics.registry.get_stats()
+        self.assertEqual(stats['major_event_log.views.about']['requests'], 1)
+
+
+@override_settings(ROOT_URLCONF='tests.async_urls')
+class TestAsyncViews(TestCase):
+    """Test the async views under the ASGI test client."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.events = [create_event(title='event {0}'.format(number))
+                      for number in range(12)]
+        cls.event = cls.events[0]
+
+    def test_async_views_used(self):
+        """Check that the async URLconf routes to the async views."""
+        self.assertEqual(resolve(self.event.get_absolute_url()).func,
+                         async_views.event_details)
+        for url in (reverse('major-event-log:index'),
+                    reverse('major-event-log:feed')):
+            self.assertTrue(iscoroutinefunction(resolve(url).func))
+        self.assertEqual(resolve(reverse('major-event-log:about')).func,
+                         views.about)
+
+    async def test_event_views(self):
+        """Check the details page and the records of an event."""
+        response = await self.async_client.get(self.event.get_absolute_url())
+        self.assertContains(response, 'event 0')
+        self.assertTemplateUsed(response,
+                                'major-event-log/event_details.html')
+        response = await self.async_client.get(reverse(
+            'major-event-log:event_premis', args=[self.event.pk]))
+        self.assertEqual(response.content,
+                         serializers.serialize_premis(self.event))
+        response = await self.async_client.get(reverse(
+            'major-event-log:event_atom', args=[self.event.pk]))
+        self.assertContains(response,
+                            'http://testserver' +
+                            self.event.get_absolute_url())
+
+    async def test_event_not_found(self):
+        """Check HTTP 404 for malformed and unknown event ids."""
+        for event_id in ('not-a-uuid', str(uuid.uuid4())):
+            response = await self.async_client.get(
+                reverse('major-event-log:event_premis', args=[event_id]))
+            self.assertEqual(response.status_code, 404)
+
+    async def test_event_conditional_get(self):
+        """Check that the async event views answer conditional requests."""
+        url = reverse('major-event-log:event_premis', args=[self.event.pk])
+        response = await self.async_client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        response = await self.async_client.get(
+            url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_index_pages(self):
+        """Check the cursor and numbered pages of the index."""
+        url = reverse('major-event-log:index')
+        response = await self.async_client.get(url)
+        self.assertContains(response, 'event 11')
+        self.assertNotContains(response, 'event 1<')
+        next_cursor = response.context['page_obj'].next_cursor
+        response = await self.async_client.get(
+            url, {'cursor': next_cursor})
+        self.assertContains(response, 'event 1<')
+        response = await self.async_client.get(url, {'page': 2})
+        self.assertContains(response, 'event 1<')
+        response = await self.async_client.get(url, {'q': 'event'})
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(url, {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_index_facets(self):
+        """Check that the facet sidebar is read by the async view."""
+        response = await self.async_client.get(
+            reverse('major-event-log:index'))
+        agents = response.context['facets']['agent']
+        self.assertEqual([(agent['label'], agent['count'])
+                          for agent in agents], [('John Doe', 12)])
+
+    async def test_feed_matches_sync_feed(self):
+        """Check that the async feed serves the synchronous feed's pages
+        and validators.
+        """
+        url = reverse('major-event-log:feed')
+        response = await self.async_client.get(url)
+        with override_settings(ROOT_URLCONF='tests.urls'):
+            expected = await sync_to_async(self.client.get)(url)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response['ETag'], expected['ETag'])
+        response = await self.async_client.get(
+            url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(url, {'p': 2})
+        self.assertContains(response, 'event 1<')
+
+    @override_settings(MIDDLEWARE=['major_event_log.metrics.MetricsMiddleware'] +
+                       list(settings.MIDDLEWARE))
+    async def test_metrics(self):
+        """Check that the metrics middleware measures async views."""
+        metrics.registry.reset()
+        response = await self.async_client.get(self.event.get_absolute_url())
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        stats = metrics.registry.get_stats()['major-event-log:event_details']
+        self.assertEqual(stats['queries'], 2)
+
+    @override_settings(MAJOR_EVENT_LOG_PAGE_CACHE={'TIMEOUT': 60})
+    async def test_page_cache(self):
+        """Check that the async index and feed go through the page cache."""
+        await sync_to_async(caches['default'].clear)()
+        page_cache.clear()
+        for url in (reverse('major-event-log:index'),
+                    reverse('major-event-log:feed')):
+            first = await self.async_client.get(url)
+            second = await self.async_client.get(url)
+            self.assertEqual(first.content, second.content)
+        self.assertEqual(page_cache.get_stats(),
+                         {'hits': 2, 'stale_hits': 0, 'misses': 2})
+
+
+@override_settings(
+    MIDDLEWARE=['major_event_log.routers.ReadYourWritesMiddleware'] + list(
+        settings.MIDDLEWARE),
+    MAJOR_EVENT_LOG_REPLICA='replica',
+    MAJOR_EVENT_LOG_INGEST_TOKENS=['secret'])
+class TestReplicaRouting(TestCase):
+    """Test sending the reads of the read-only views to a replica."""
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.primary_event = create_event(title='primary event')
+        agent = Agent.objects.using('replica').create(
+            name='John Doe', email='admin@email.com')
+        cls.replica_event = Event.objects.using('replica').create(
+            title='replica event', detail='none', outcome=Event.SUCCESS,
+            outcome_detail='none', date=timezone.now(), agent=agent)
+
+    def test_views_read_from_replica(self):
+        """Check that the read-only views read from the replica."""
+        urls = [
+            reverse('major-event-log:index'),
+            reverse('major-event-log:index') + '?page=1',
+            reverse('major-event-log:feed'),
+            reverse('major-event-log:changes'),
+            reverse('major-event-log:changes_jsonl'),
+            reverse('major-event-log:stats_json'),
+            self.replica_event.get_absolute_url(),
+            reverse('major-event-log:event_premis',
+                    args=[self.replica_event.pk]),
+        ]
+        for url in urls:
+            with CaptureQueriesContext(connection) as primary:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(len(primary), 0, url)
+        response = self.client.get(reverse('major-event-log:index'))
+        self.assertContains(response, 'replica event')
+        self.assertNotContains(response, 'primary event')
+        response = self.client.get(self.primary_event.get_absolute_url())
+        self.assertEqual(response.status_code, 404)
+
+    def test_streamed_export_reads_from_replica(self):
+        """Check that a streaming response reads from the replica while
+        it's streamed.
+        """
+        response = self.client.get(reverse('major-event-log:premis_export'))
+        with CaptureQueriesContext(connection) as primary:
+            content = b''.join(response.streaming_content)
+        self.assertIn(str(self.replica_event.pk).encode(), content)
+        self.assertNotIn(str(self.primary_event.pk).encode(), content)
+        self.assertEqual(len(primary), 0)
+
+    @override_settings(ROOT_URLCONF='tests.async_urls')
+    async def test_async_views_read_from_replica(self):
+        """Check that the async views read from the replica."""
+        response = await self.async_client.get(
+            reverse('major-event-log:index'))
+        self.assertContains(response, 'replica event')
+        response = await self.async_client.get(
+            self.replica_event.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_reads_from_default(self):
+        """Check that the admin isn't routed to the replica."""
+        user = User.objects.create_superuser('admin', 'admin@example.com',
+                                             'password')
+        self.client.force_login(user)
+        response = self.client.get('/admin/major_event_log/event/')
+        self.assertContains(response, 'primary event')
+        self.assertNotContains(response, 'replica event')
+
+    def test_read_your_writes(self):
+        """Check that a client that wrote reads from the default database
+        for a while.
+        """
+        response = self.client.post(
+            reverse('major-event-log:ingest'),
+            json.dumps({'title': 'ingested', 'detail': 'none',
+                        'outcome': 'Success', 'outcome_detail': 'none',
+                        'date': '2001-02-03T04:05:06Z',
+                        'contact_name': 'John Doe',
+                        'contact_email': 'admin@email.com'}) + '\n',
+            content_type='application/x-ndjson',
+            HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(routers.READ_YOUR_WRITES_COOKIE, response.cookies)
+        response = self.client.get(reverse('major-event-log:index'))
+        self.assertContains(response, 'ingested')
+        self.assertNotContains(response, 'replica event')
+        self.assertNotIn(routers.READ_YOUR_WRITES_COOKIE, response.cookies)
+
+    def test_read_your_writes_window(self):
+        """Check that reads go back to the replica after the window."""
+        self.client.cookies[routers.READ_YOUR_WRITES_COOKIE] = str(
+            time.time() - routers.DEFAULT_READ_YOUR_WRITES_SECONDS - 1)
+        response = self.client.get(reverse('major-event-log:index'))
+        self.assertContains(response, 'replica event')
+
+    @override_settings(MAJOR_EVENT_LOG_PAGE_CACHE={'TIMEOUT': 60,
+                                                   'WAIT': 0})
+    def test_page_cache_skipped_after_write(self):
+        """Check that a client within its read-your-writes window isn't
+        answered from the page cache.
+        """
+        caches['default'].clear()
+        url = reverse('major-event-log:index')
+        self.assertContains(self.client.get(url), 'replica event')
+        self.client.cookies[routers.READ_YOUR_WRITES_COOKIE] = str(
+            time.time())
+        response = self.client.get(url)
+        self.assertContains(response, 'primary event')
+        self.assertNotContains(response, 'replica event')
+
+    @override_settings(MAJOR_EVENT_LOG_PAGE_CACHE={'TIMEOUT': 60,
+                                                   'WAIT': 0})
+    def test_replica_pages_not_cached_after_bump(self):
+        """Check that pages read from the replica soon after a write are
+        served but not cached.
+        """
+        caches['default'].clear()
+        page_cache.clear()
+        url = reverse('major-event-log:index')
+        page_cache.bump()
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(page_cache.get_stats()['misses'], 2)
+        caches['default'].set(page_cache.bumped_key, time.time() -
+                              routers.DEFAULT_READ_YOUR_WRITES_SECONDS - 1)
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(page_cache.get_stats()['misses'], 3)
+
+    def test_missing_counter_not_created(self):
+        """Check that counters missing on the replica aren't written
+        anywhere.
+        """
+        EventCounter.objects.using('replica').all().delete()
+        with CaptureQueriesContext(connections['replica']) as replica, \
+                CaptureQueriesContext(connection) as primary:
+            self.client.get(reverse('major-event-log:index') + '?page=1')
+        self.assertFalse(any(query['sql'].startswith('INSERT')
+                             for query in list(replica) + list(primary)))
+        self.assertFalse(EventCounter.objects.using('replica').exists())
+
+    @override_settings(MAJOR_EVENT_LOG_REPLICA=None)
+    def test_not_configured(self):
+        """Check that everything reads from the default database unless
+        a replica is configured.
+        """
+        response = self.client.get(reverse('major-event-log:index'))
+        self.assertContains(response, 'primary event')
+
+
+class TestArchive(TestCase):
+    """Test moving old events to the archive and looking them up."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.events = [create_event(title='archived {0}'.format(number))
+                      for number in range(3)]
+        cls.events += [create_event(title='current {0}'.format(number),
+                                    outcome='Failure')
+                       for number in range(2)]
+        cls.cutoff = timezone.now() - datetime.timedelta(days=30)
+        old = cls.cutoff - datetime.timedelta(days=1)
+        Event.objects.filter(pk__in=[event.pk for event in cls.events[:3]]
+                             ).update(entry_created=old)
+        for event in cls.events:
+            event.refresh_from_db()
+
+    def archive(self, batch_size=2):
+        return list(archive.archive_events(self.cutoff, batch_size))
+
+    def rollups(self):
+        return sorted(EventRollup.objects.values_list(
+            'day', 'outcome', 'agent_id', 'count'))
+
+    def test_archive_events(self):
+        """Check that old events move in batches with their fields."""
+        self.assertEqual(self.archive(), [2, 1])
+        self.assertEqual(
+            sorted(Event.objects.values_list('title', flat=True)),
+            ['current 0', 'current 1'])
+        for event in self.events[:3]:
+            archived = ArchivedEvent.objects.get(pk=event.pk)
+            for field in archive.ARCHIVED_FIELDS:
+                self.assertEqual(getattr(archived, field),
+                                 getattr(event, field))
+        self.assertEqual(self.archive(), [])
+
+    def test_derived_data(self):
+        """Check that archived events leave the counts and the search
+        index, but not the rollups.
+        """
+        rollups_before = self.rollups()
+        self.archive()
+        self.assertEqual(EventCounter.objects.get(
+            name=counts.TOTAL_COUNTER).count, 2)
+        self.assertEqual(EventCounter.objects.get(
+            name=facets.counter_name('outcome', Event.SUCCESS)).count, 0)
+        self.assertEqual(list(search.search_events(
+            Event.objects.all(), 'archived')), [])
+        self.assertEqual(self.rollups(), rollups_before)
+        rollups.rebuild_rollups()
+        self.assertEqual(self.rollups(), rollups_before)
+
+    def test_listings(self):
+        """Check that archived events leave the index and the feed."""
+        self.archive()
+        response = self.client.get(reverse('major-event-log:index'))
+        self.assertNotContains(response, 'archived 0')
+        self.assertContains(response, 'current 0')
+        response = self.client.get(reverse('major-event-log:feed'))
+        self.assertNotContains(response, 'archived 0')
+
+    def test_harvests(self):
+        """Check that archived events stay in the changes, OAI-PMH lists
+        and exports, merged with the events in order.
+        """
+        self.archive()
+        ArchivedEvent.objects.filter(pk=self.events[0].pk).update(
+            entry_modified=timezone.now())
+        expected = [str(event.pk) for event in self.events[1:]]
+        expected.append(str(self.events[0].pk))
+
+        ids, token = [], None
+        while True:
+            params = {'limit': 2}
+            if token:
+                params['token'] = token
+            response = self.client.get(
+                reverse('major-event-log:changes_jsonl'), params)
+            rows = [json.loads(line) for line in
+                    response.content.decode().splitlines()]
+            if not rows:
+                break
+            ids += [row['id'] for row in rows]
+            token = response['X-Resume-Token']
+        self.assertEqual(ids, expected)
+
+        response = self.client.get(reverse('major-event-log:changes'))
+        self.assertContains(response, 'archived 0')
+        response = self.client.get(reverse('major-event-log:oai'), {
+            'verb': 'ListIdentifiers', 'metadataPrefix': 'premis'})
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(re.findall(r'oai:testserver:([0-9a-f-]+)', content),
+                         expected)
+        response = self.client.get(reverse('major-event-log:premis_export'))
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(
+            [match for match in re.findall(r'[0-9a-f-]{36}', content)
+             if match in expected], expected)
+        out = io.StringIO()
+        call_command('export_events', format='jsonl', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 5)
+
+    def test_event_views(self):
+        """Check that the event views find archived events."""
+        self.archive()
+        event = self.events[0]
+        response = self.client.get(event.get_absolute_url())
+        self.assertContains(response, 'archived 0')
+        response = self.client.get(reverse(
+            'major-event-log:event_premis', args=[event.pk]))
+        self.assertEqual(response.content,
+                         serializers.serialize_premis(event))
+        url = reverse('major-event-log:event_atom', args=[event.pk])
+        response = self.client.get(url)
+        self.assertContains(response, str(event.pk))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(reverse('major-event-log:event_details',
+                                           args=[uuid.uuid4()]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_get_record(self):
+        """Check that OAI-PMH GetRecord finds archived events."""
+        self.archive()
+        response = self.client.get(reverse('major-event-log:oai'), {
+            'verb': 'GetRecord', 'metadataPrefix': 'premis',
+            'identifier': 'oai:testserver:{0}'.format(self.events[0].pk)})
+        content = b''.join(response.streaming_content)
+        self.assertIn(str(self.events[0].pk).encode(), content)
+        self.assertNotIn(b'idDoesNotExist', content)
+
+    async def test_async_lookup(self):
+        """Check that the async views find archived events."""
+        await sync_to_async(self.archive)()
+        event = await async_views.aget_event_or_404(str(self.events[0].pk))
+        self.assertEqual(event.title, 'archived 0')
+        self.assertIsInstance(event, ArchivedEvent)
+
+    def test_command(self):
+        """Check the archive_events command and its cutoffs."""
+        out = io.StringIO()
+        call_command('archive_events', older_than=30, stdout=out)
+        self.assertIn('Archived 3 events', out.getvalue())
+        self.assertEqual(Event.objects.count(), 2)
+        call_command('archive_events', before='2000-01-01', stdout=out)
+        with self.assertRaises(CommandError):
+            call_command('archive_events', before='last year')
+        with self.assertRaises(CommandError):
+            call_command('archive_events')
+
+
+class TestStaticSite(TestCase):
+    """Test the static snapshot of the public pages."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.events = []
+        start = timezone.now() - datetime.timedelta(days=1)
+        for number in range(25):
+            event = create_event(title='event {0}'.format(number))
+            Event.objects.filter(pk=event.pk).update(
+                entry_created=start + datetime.timedelta(minutes=number))
+            event.refresh_from_db()
+            cls.events.append(event)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+
+    def build(self, **kwargs):
+        return static_site.build_static_site(self.root, 'http://testserver',
+                                             workers=1, **kwargs)
+
+    def read(self, url, cursor=None, extension='.html'):
+        path = static_site.StaticSite(self.root, '').file_path(
+            url, cursor, extension)
+        with open(os.path.join(self.root, path), 'rb') as stream:
+            return stream.read()
+
+    def test_plan_pages(self):
+        """Check that the events are cut into pages from the oldest in a
+        single pass over the rows.
+        """
+        rows = list(Event.objects.order_by(
+            *static_site.LISTING_ORDERING).values_list(
+            'entry_created', 'id', 'entry_modified'))
+        for count in (0, 4, 5, 9, 10, 14, 15, 24, 25):
+            pages = list(static_site.plan_pages(iter(rows[:count]), 5))
+            first, = [page_rows for cursor, spec, page_rows in pages
+                      if cursor is None]
+            listed = [row for cursor, spec, page_rows in pages
+                      if cursor != CursorPaginator.LAST_CURSOR
+                      for row in page_rows]
+            self.assertEqual(sorted(listed), rows[:count], count)
+            self.assertEqual(len(first), count if count < 10 else
+                             5 + count % 5, count)
+
+    def test_full_build(self):
+        """Check that the pages are written as the views serve them."""
+        # 25 events, and the first, second and last pages of the index
+        # and the feed, and the about page.
+        self.assertEqual(self.build(),
+                         {'rendered': 32, 'unchanged': 0, 'removed': 0})
+        event = self.events[3]
+        for name, extension in (('event_details', '.html'),
+                                ('event_atom', '.xml'),
+                                ('event_premis', '.xml')):
+            url = reverse('major-event-log:' + name, args=[event.pk])
+            self.assertEqual(self.read(url, extension=extension),
+                             self.client.get(url).content)
+        about = reverse('major-event-log:about')
+        self.assertEqual(self.read(about), self.client.get(about).content)
+
+    def test_pages(self):
+        """Check that the first page holds the newest events and links
+        to pages that keep their events as events are added.
+        """
+        self.build()
+        index = reverse('major-event-log:index')
+        content = self.read(index).decode()
+        self.assertIn('event 24', content)
+        self.assertIn('event 10', content)
+        self.assertNotIn('event 9<', content)
+        cursor = re.search(r"\?cursor=([\w-]+)'>Next", content).group(1)
+        titles = re.compile(rb'event \d+<')
+        listed = titles.findall(self.read(index, cursor))
+        self.assertEqual(len(listed), 10)
+        self.assertEqual(listed, titles.findall(
+            self.client.get(index, {'cursor': cursor}).content))
+        self.assertIn(b'event 0<', self.read(index, 'last'))
+        feed = reverse('major-event-log:feed')
+        self.assertIn(b'event 24', self.read(feed, extension='.xml'))
+        self.assertIn(b'event 9<', self.read(feed, cursor, '.xml'))
+
+    def test_incremental_build(self):
+        """Check that later builds only render the changed pages."""
+        self.build()
+        self.assertEqual(self.build(),
+                         {'rendered': 0, 'unchanged': 32, 'removed': 0})
+        event = self.events[2]
+        event.title = 'changed'
+        event.save()
+        # The event and the second and last pages of the index and feed.
+        self.assertEqual(self.build()['rendered'], 5)
+        url = reverse('major-event-log:event_details', args=[event.pk])
+        self.assertIn(b'changed', self.read(url))
+        create_event(title='new event')
+        # The event, the first page of the feed and, as the facet counts
+        # of their sidebar changed, every page of the index.
+        self.assertEqual(self.build()['rendered'], 5)
+        self.assertEqual(self.build(full=True)['rendered'], 33)
+
+    def test_about_page_rebuilt(self):
+        """Check that the about page is rendered again when its content
+        changes.
+        """
+        self.build()
+        url = reverse('major-event-log:about')
+        with mock.patch.object(views, 'about',
+                               return_value=HttpResponse(b'new about')):
+            self.assertEqual(self.build()['rendered'], 1)
+        self.assertEqual(self.read(url), b'new about')
+
+    def test_removed_events(self):
+        """Check that the files of deleted events are removed, and that
+        archived events keep their pages.
+        """
+        self.build()
+        deleted, archived = self.events[24], self.events[0]
+        deleted.delete()
+        list(archive.archive_events(
+            archived.entry_created + datetime.timedelta(seconds=1)))
+        self.build()
+        self.assertFalse(os.path.exists(os.path.join(
+            self.root, 'major-event-log', 'event', str(deleted.pk))))
+        url = reverse('major-event-log:event_premis', args=[archived.pk])
+        self.assertEqual(self.read(url, extension='.xml'),
+                         self.client.get(url).content)
+
+    def test_command(self):
+        """Check the build_static_site command."""
+        out = io.StringIO()
+        call_command('build_static_site', self.root, workers=1,
+                     base_url='http://testserver', stdout=out)
+        self.assertIn('Rendered 32 pages', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('build_static_site', self.root, workers=1,
+                         base_url='testserver')